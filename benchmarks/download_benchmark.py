@@ -0,0 +1,120 @@
+"""
+Бенчмарк скачивания видео с локальной заглушки Яндекс.Диска.
+
+Сравнивает пропускную способность:
+  - legacy  – прежний цикл download_file: один потоковый GET с чанками по 8 КБ;
+  - ranged  – Range-запросы частями DOWNLOAD_CHUNK_MB в 1, 4, 8 соединений;
+а также докачку: процесс скачивания прерывается на середине (terminate), после чего
+download_file запускается снова и докачивает только недостающие части.
+
+Пропускная способность одного соединения ограничивается сервером (--bandwidth-mbps),
+как у реального канала до Диска, где одно TCP-соединение не занимает всю полосу.
+
+Запуск из корня репозитория:
+    python -m benchmarks.download_benchmark --size-mb 512 --bandwidth-mbps 200 --connections 1 4 8
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+
+import requests
+
+from benchmarks.fake_disk import FakeDiskServer, build_tree
+
+
+def legacy_download_file(url, local_path):
+    """Копия исходного цикла download_file (один поток, чанки по 8 КБ)."""
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+        with open(local_path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=8192):
+                if chunk:
+                    f.write(chunk)
+
+
+def _md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _download_process(url, local_path, connections):
+    from modules import video_processor
+    video_processor.download_file(url, local_path, connections=connections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=512, help="размер видео, МБ")
+    parser.add_argument("--bandwidth-mbps", type=float, default=200.0,
+                        help="пропускная способность одного соединения, Мбит/с (0 – без ограничения)")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--chunk-mb", type=int, default=16, help="размер части Range-запроса, МБ")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="download-bench-")
+    source = os.path.join(workdir, "source.mp4")
+    with open(source, "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 ** 2))
+    expected_md5 = _md5(source)
+
+    root = "disk:/Школа"
+    tree = build_tree(root, courses=1, modules=1, lessons=1, files_per_lesson=1)
+    bandwidth = args.bandwidth_mbps * 1e6 / 8 if args.bandwidth_mbps else None
+    server = FakeDiskServer(tree, video_source=source, bandwidth=bandwidth).start()
+    video_path = next(path for path in server.files if path.endswith(".mp4"))
+    os.environ["DISK_API_URL"] = server.api_url
+    os.environ["DOWNLOAD_CHUNK_MB"] = str(args.chunk_mb)
+    os.chdir(workdir)
+    from modules import video_processor
+
+    url = video_processor.get_download_url(video_path)
+    print(f"Видео {args.size_mb} МБ, {args.bandwidth_mbps:.0f} Мбит/с на соединение, часть {args.chunk_mb} МБ")
+    print(f"{'режим':>14} {'время, с':>9} {'МБ/с':>7} {'md5':>5}")
+
+    def run(label, func):
+        target = os.path.join(workdir, "video.mp4")
+        start = time.perf_counter()
+        func(target)
+        elapsed = time.perf_counter() - start
+        ok = "ok" if _md5(target) == expected_md5 else "FAIL"
+        print(f"{label:>14} {elapsed:>9.2f} {args.size_mb / elapsed:>7.1f} {ok:>5}")
+        os.remove(target)
+
+    run("legacy", lambda target: legacy_download_file(url, target))
+    for connections in args.connections:
+        run(f"ranged x{connections}",
+            lambda target: video_processor.download_file(url, target, connections=connections))
+
+    # Докачка: прерываем процесс скачивания примерно на середине и запускаем заново
+    connections = max(args.connections)
+    target = os.path.join(workdir, "video.mp4")
+    process = multiprocessing.Process(target=_download_process, args=(url, target, connections))
+    process.start()
+    part_path = f"{target}.part.json"
+    half = args.size_mb // args.chunk_mb // 2
+    while process.is_alive():
+        try:
+            with open(part_path, "r", encoding="utf-8") as f:
+                if f.read().count(",") + 1 >= half:
+                    break
+        except OSError:
+            pass
+        time.sleep(0.05)
+    process.terminate()
+    process.join()
+    requests_before = server.requests
+    run(f"resume x{connections}", lambda target: video_processor.download_file(url, target, connections=connections))
+    print(f"запросов при докачке: {server.requests - requests_before} "
+          f"(частей всего {-(-args.size_mb // args.chunk_mb)})")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
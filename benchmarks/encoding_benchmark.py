@@ -0,0 +1,129 @@
+"""
+Бенчмарк профилей кодирования аудио (modules/audio_profiles.py).
+
+Для каждого профиля из --profiles (auto – выбор профиля по исходной дорожке, как при
+AUDIO_PROFILE=auto) извлекает аудио из всех записей и измеряет:
+  - размер результата и средний битрейт, в том числе относительно legacy;
+  - время кодирования (extract_audio) и скорость относительно реального времени;
+  - время загрузки в Object Storage на локальном S3-совместимом сервере
+    с заданными задержкой и пропускной способностью.
+Записи передаются через --videos (лучше – несколько настоящих уроков); без них генерируются
+синтетические исходники с речеподобным сигналом: запись экрана (AAC 44.1 кГц, 128 кбит/с),
+сильно сжатая запись (AAC 32 кбит/с) и телефонная (8 кГц). Размер синтетики не равен размеру
+настоящей речи, поэтому выбирать профиль следует по результатам на уроках.
+С --output-dir результаты кодирования сохраняются, чтобы сравнить качество распознавания
+каждого профиля на тех же записях.
+
+Запуск из корня репозитория:
+    python -m benchmarks.encoding_benchmark --videos lesson1.mp4 lesson2.mp4
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from benchmarks.fake_s3 import FakeS3Server
+
+# Речеподобный сигнал: гармоники основного тона 120-220 Гц с огибающей слогов (4 Гц),
+# паузы между фразами и фоновый шум
+SPEECH_EXPR = ("(0.3*sin(2*PI*(120+100*sin(2*PI*0.3*t))*t)+0.15*sin(4*PI*(120+100*sin(2*PI*0.3*t))*t)"
+               "+0.08*sin(6*PI*(120+100*sin(2*PI*0.3*t))*t))*abs(sin(2*PI*4*t))*lt(mod(t\\,7)\\,5)"
+               "+0.01*(random(0)-0.5)")
+SAMPLES = [
+    # имя, частота исходной дорожки, каналы, битрейт AAC
+    ("screen", 44100, 2, "128k"),
+    ("compressed", 44100, 1, "32k"),
+    ("phone", 8000, 1, "24k"),
+]
+
+
+def make_sample(path, seconds, rate, channels, bitrate):
+    """Генерирует видео MP4 (H.264 + AAC) с речеподобным сигналом длительностью seconds."""
+    subprocess.run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"aevalsrc={SPEECH_EXPR}:d={seconds}:s={rate}",
+        "-f", "lavfi", "-i", f"color=size=320x240:rate=5:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-b:a", bitrate,
+        "-ac", str(channels), "-shortest", path,
+    ], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", nargs="+", help="записи уроков (по умолчанию – синтетические)")
+    parser.add_argument("--sample-seconds", type=int, default=300, help="длительность синтетических записей, сек")
+    parser.add_argument("--profiles", nargs="+", help="профили (по умолчанию все и auto)")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка S3 на запрос, сек")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0,
+                        help="пропускная способность одного соединения с S3, Мбит/с")
+    parser.add_argument("--output-dir", help="каталог для результатов кодирования (по умолчанию удаляются)")
+    args = parser.parse_args()
+
+    server = FakeS3Server(latency=args.latency, bandwidth=args.bandwidth_mbps * 1e6 / 8).start()
+    os.environ.update({
+        "YOBJECT_STORAGE_ENDPOINT": server.endpoint,
+        "YOBJECT_STORAGE_BUCKET": "bench",
+        "YOBJECT_STORAGE_ACCESS_KEY": "bench",
+        "YOBJECT_STORAGE_SECRET_KEY": "bench",
+        "AWS_DEFAULT_REGION": "ru-central1",
+    })
+    videos = [os.path.abspath(path) for path in args.videos or []]
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir else None
+    workdir = tempfile.mkdtemp(prefix="encoding-bench-")
+    os.chdir(workdir)
+    import logging
+    from modules import video_processor
+    from modules.audio_profiles import PROFILES, resolve_profile
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if not videos:
+        for name, rate, channels, bitrate in SAMPLES:
+            path = os.path.join(workdir, f"{name}.mp4")
+            make_sample(path, args.sample_seconds, rate, channels, bitrate)
+            videos.append(path)
+    profiles = args.profiles or list(PROFILES) + ["auto"]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    print(f"{len(videos)} записей; S3: задержка {args.latency * 1000:.0f} мс, {args.bandwidth_mbps:.0f} Мбит/с")
+    print(f"{'профиль':>11} {'размер, МБ':>11} {'кбит/с':>7} {'к legacy':>9} "
+          f"{'кодирование':>12} {'x реального':>12} {'загрузка':>9}")
+    legacy_size = None
+    for profile in profiles:
+        size = encode_time = upload_time = duration = 0.0
+        chosen = []
+        for video in videos:
+            stem = os.path.splitext(os.path.basename(video))[0]
+            audio_path = os.path.join(output_dir or workdir, f"{stem}.{profile}.ogg")
+            start = time.perf_counter()
+            name = resolve_profile(video, setting=profile)
+            seconds = video_processor.extract_audio(video, audio_path, profile=name)
+            encode_time += time.perf_counter() - start
+            assert seconds, f"не удалось извлечь аудио из {video}"
+            chosen.append(f"{stem}: {name}")
+
+            start = time.perf_counter()
+            url = video_processor.upload_to_object_storage(audio_path, os.path.basename(audio_path))
+            upload_time += time.perf_counter() - start
+            assert url, f"не удалось загрузить {audio_path}"
+            duration += seconds
+            size += os.path.getsize(audio_path)
+            if not output_dir:
+                os.remove(audio_path)
+        if profile == "legacy":
+            legacy_size = size
+        relative = f"{size / legacy_size:>8.0%}" if legacy_size else f"{'–':>8}"
+        print(f"{profile:>11} {size / 1024 ** 2:>11.2f} {size * 8 / duration / 1000:>7.1f} {relative} "
+              f"{encode_time:>11.2f}с {duration / encode_time:>11.0f}x {upload_time:>8.2f}с")
+        if profile == "auto":
+            print(f"{'':>11} {', '.join(chosen)}")
+    server.shutdown()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if output_dir:
+        print(f"Результаты кодирования сохранены в {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
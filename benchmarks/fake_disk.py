@@ -0,0 +1,205 @@
+"""
+Локальная заглушка REST API Яндекс.Диска для бенчмарков.
+
+Поддерживает методы, которые использует проект:
+  - GET /v1/disk/resources           – содержимое папки с limit/offset;
+  - GET /v1/disk/resources/files     – плоский список файлов (media_type, limit, offset);
+  - GET /v1/disk/resources/download  – ссылка на скачивание;
+  - GET /download/<path>             – содержимое файла (с поддержкой Range).
+Дерево папок генерируется функцией build_tree; содержимое всех видео берётся
+из одного локального файла (video_source) или генерируется нулями нужного размера.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+
+def _file_item(path, size, content_key=None):
+    """Формирует описание файла в формате API Диска; хэши зависят от content_key (по умолчанию – от пути)."""
+    digest_source = (content_key or path).encode("utf-8")
+    return {
+        "name": path.rsplit("/", 1)[-1],
+        "path": path,
+        "type": "file",
+        "mime_type": "video/mp4" if path.endswith(".mp4") else "application/pdf",
+        "media_type": "video" if path.endswith(".mp4") else "document",
+        "size": size,
+        "md5": hashlib.md5(digest_source).hexdigest(),
+        "sha256": hashlib.sha256(digest_source).hexdigest(),
+    }
+
+
+def build_tree(root="disk:/Школа", courses=12, modules=10, lessons=25, files_per_lesson=10,
+               flat_folder_files=0, video_size=100 * 1024 ** 2, duplicate_every=0):
+    """
+    Генерирует дерево курсов: root/Курс N/Модуль N/Урок N/видео.
+    В каждой папке урока, кроме видео, лежит один PDF (не видео, должен отфильтровываться).
+    flat_folder_files – число видео в отдельной папке root/Подкасты (проверка постраничного чтения).
+    duplicate_every – если > 0, каждое duplicate_every-е видео имеет тот же хэш, что и первое
+    (имитация повторно загруженных копий).
+    Возвращает словарь {путь папки: [элементы]}.
+    """
+    tree = {root: []}
+    counter = 0
+
+    def add_dir(parent, name):
+        path = f"{parent}/{name}"
+        tree[parent].append({"name": name, "path": path, "type": "dir"})
+        tree[path] = []
+        return path
+
+    def add_video(folder, name):
+        nonlocal counter
+        counter += 1
+        content_key = "duplicate" if duplicate_every and counter % duplicate_every == 0 else None
+        tree[folder].append(_file_item(f"{folder}/{name}", video_size, content_key))
+
+    for c in range(1, courses + 1):
+        course = add_dir(root, f"Курс {c}")
+        for m in range(1, modules + 1):
+            module = add_dir(course, f"Модуль {m}")
+            for lesson_number in range(1, lessons + 1):
+                lesson = add_dir(module, f"Урок {lesson_number}")
+                for f in range(1, files_per_lesson + 1):
+                    add_video(lesson, f"{f}.mp4")
+                tree[lesson].append(_file_item(f"{lesson}/Материалы.pdf", 1024))
+    if flat_folder_files:
+        podcasts = add_dir(root, "Подкасты")
+        for f in range(1, flat_folder_files + 1):
+            add_video(podcasts, f"Подкаст {f}.mp4")
+    return tree
+
+
+class FakeDiskServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, tree, address=("127.0.0.1", 0), latency=0.0, video_source=None, bandwidth=None):
+        """
+        latency – задержка на каждый запрос к API (сек).
+        video_source – локальный файл, содержимое которого отдаётся для любого видео.
+        bandwidth – пропускная способность одного соединения при скачивании (байт/с).
+        """
+        super().__init__(address, FakeDiskHandler)
+        self.tree = tree
+        self.latency = latency
+        self.video_source = video_source
+        self.bandwidth = bandwidth
+        self.files = {item["path"]: item for items in tree.values() for item in items if item["type"] == "file"}
+        self.flat_files = sorted(self.files.values(), key=lambda item: item["path"])
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/disk"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Клиент может оборвать соединение (например, прерванное скачивание) – это не ошибка сервера
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeDiskHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Иначе keep-alive соединения упираются в задержку Nagle + delayed ACK (~40 мс на ответ)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        parsed = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(parsed.query).items()}
+        if parsed.path.startswith("/download/"):
+            self._download(unquote(parsed.path[len("/download/"):]))
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+        if parsed.path == "/v1/disk/resources":
+            items = self.server.tree.get(query.get("path"))
+            if items is None:
+                self._send_json(404, {"error": "DiskNotFoundError"})
+                return
+            self._send_json(200, {
+                "path": query["path"], "type": "dir",
+                "_embedded": {"items": items[offset:offset + limit], "limit": limit,
+                              "offset": offset, "total": len(items), "path": query["path"]},
+            })
+        elif parsed.path == "/v1/disk/resources/files":
+            files = self.server.flat_files
+            if "media_type" in query:
+                files = [item for item in files if item["media_type"] == query["media_type"]]
+            self._send_json(200, {"items": files[offset:offset + limit], "limit": limit, "offset": offset})
+        elif parsed.path == "/v1/disk/resources/download":
+            if query.get("path") not in self.server.files:
+                self._send_json(404, {"error": "DiskNotFoundError"})
+                return
+            host, port = self.server.server_address[:2]
+            self._send_json(200, {"href": f"http://{host}:{port}/download/{quote(query['path'])}",
+                                  "method": "GET", "templated": False})
+        else:
+            self._send_json(404, {"error": "NotFound"})
+
+    def _download(self, path):
+        item = self.server.files.get(path)
+        if item is None:
+            self._send_json(404, {"error": "DiskNotFoundError"})
+            return
+        source = self.server.video_source
+        size = os.path.getsize(source) if source else item["size"]
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", item["mime_type"])
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        remaining = end - start + 1
+        block = 256 * 1024
+        f = open(source, "rb") if source else None
+        try:
+            if f:
+                f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(block, remaining)) if f else b"\0" * min(block, remaining)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                if self.server.bandwidth:
+                    time.sleep(len(chunk) / self.server.bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            if f:
+                f.close()
@@ -0,0 +1,164 @@
+"""
+Локальный S3-совместимый сервер для бенчмарков.
+
+Поддерживает ровно те операции, которые использует проект: PutObject, HeadObject, GetObject
+и multipart-загрузку (CreateMultipartUpload, UploadPart, CompleteMultipartUpload,
+AbortMultipartUpload). Адресация – path-style (http://host:port/bucket/key).
+Задержка на запрос и пропускная способность одного соединения настраиваются,
+чтобы эффект параллельной загрузки был виден так же, как на реальном канале.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+
+class FakeS3Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, bandwidth=None, keep_data=False):
+        """
+        latency – задержка на каждый запрос (сек).
+        bandwidth – пропускная способность одного соединения (байт/с), None – без ограничения.
+        keep_data – хранить содержимое объектов (иначе хранится только размер).
+        """
+        super().__init__(address, FakeS3Handler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.keep_data = keep_data
+        self.objects = {}
+        self.uploads = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def endpoint(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Иначе keep-alive соединения упираются в задержку Nagle + delayed ACK (~40 мс на ответ)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _target(self):
+        parsed = urlparse(self.path)
+        bucket, _, key = unquote(parsed.path).lstrip("/").partition("/")
+        query = {name: values[0] for name, values in parse_qs(parsed.query, keep_blank_values=True).items()}
+        return bucket, key, query
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        if self.server.bandwidth:
+            time.sleep(length / self.server.bandwidth)
+        return body
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _begin(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def do_PUT(self):
+        self._begin()
+        bucket, key, query = self._target()
+        body = self._read_body()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        stored = body if self.server.keep_data else len(body)
+        with self.server.lock:
+            if "uploadId" in query:
+                upload = self.server.uploads.get(query["uploadId"])
+                if upload is None:
+                    self._send(404)
+                    return
+                upload[int(query["partNumber"])] = stored
+            else:
+                self.server.objects[(bucket, key)] = stored
+        self._send(200, headers={"ETag": etag})
+
+    def do_POST(self):
+        self._begin()
+        bucket, key, query = self._target()
+        self._read_body()
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {}
+            body = (f'<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>'
+                    f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>').encode()
+            self._send(200, body, {"Content-Type": "application/xml"})
+        elif "uploadId" in query:
+            with self.server.lock:
+                parts = self.server.uploads.pop(query["uploadId"], None)
+                if parts is not None:
+                    ordered = [parts[number] for number in sorted(parts)]
+                    if self.server.keep_data:
+                        self.server.objects[(bucket, key)] = b"".join(ordered)
+                    else:
+                        self.server.objects[(bucket, key)] = sum(ordered)
+            if parts is None:
+                self._send(404)
+                return
+            body = (f'<?xml version="1.0" encoding="UTF-8"?>'
+                    f'<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>'
+                    f'<ETag>"{uuid.uuid4().hex}-{len(parts)}"</ETag></CompleteMultipartUploadResult>').encode()
+            self._send(200, body, {"Content-Type": "application/xml"})
+        else:
+            self._send(400)
+
+    def do_DELETE(self):
+        self._begin()
+        bucket, key, query = self._target()
+        with self.server.lock:
+            if "uploadId" in query:
+                self.server.uploads.pop(query["uploadId"], None)
+            else:
+                self.server.objects.pop((bucket, key), None)
+        self._send(204)
+
+    def _object(self):
+        bucket, key, _ = self._target()
+        with self.server.lock:
+            return self.server.objects.get((bucket, key))
+
+    def do_HEAD(self):
+        self._begin()
+        stored = self._object()
+        if stored is None:
+            self._send(404)
+            return
+        size = len(stored) if isinstance(stored, bytes) else stored
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+
+    def do_GET(self):
+        self._begin()
+        stored = self._object()
+        if stored is None:
+            self._send(404)
+            return
+        body = stored if isinstance(stored, bytes) else b"\0" * stored
+        self._send(200, body, {"Content-Type": "application/octet-stream"})
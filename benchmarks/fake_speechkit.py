@@ -0,0 +1,154 @@
+"""
+Локальная заглушка API асинхронного распознавания SpeechKit для бенчмарков.
+
+Поддерживает методы, которые использует проект:
+  - POST /speech/stt/v2/longRunningRecognize – запуск операции, ответ {"id", "done": false};
+  - GET  /operations/<id>                    – статус операции; после processing_time секунд
+                                               возвращается результат с фрагментами и словами.
+Лимиты запросов имитируются фиксированным окном: сверх submit_limit отправок или
+status_limit проверок статуса за window секунд сервер отвечает 429 с заголовком Retry-After.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+WORDS_PER_CHUNK = 20
+WORD_DURATION = 0.4
+
+
+def build_response(words):
+    """Результат распознавания из words слов: фрагменты по WORDS_PER_CHUNK слов с временем и уверенностью."""
+    chunks = []
+    for first in range(0, words, WORDS_PER_CHUNK):
+        chunk_words = [{
+            "startTime": f"{index * WORD_DURATION:.3f}s",
+            "endTime": f"{(index + 1) * WORD_DURATION - 0.05:.3f}s",
+            "word": f"слово{index}",
+            "confidence": 1,
+        } for index in range(first, min(first + WORDS_PER_CHUNK, words))]
+        chunks.append({
+            "alternatives": [{"words": chunk_words, "text": " ".join(word["word"] for word in chunk_words),
+                              "confidence": 1}],
+            "channelTag": "1",
+        })
+    return {"chunks": chunks}
+
+
+class FakeSpeechKitServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, processing_time=5.0, words=200,
+                 submit_limit=None, status_limit=None, window=60.0, retry_after=1):
+        """
+        latency – задержка на каждый запрос (сек).
+        processing_time – через сколько секунд после запуска операция завершается.
+        words – число слов в результате каждой операции.
+        submit_limit, status_limit – допустимое число запросов за окно window секунд
+        (None – без ограничения); retry_after – значение заголовка Retry-After в ответе 429.
+        """
+        super().__init__(address, FakeSpeechKitHandler)
+        self.latency = latency
+        self.processing_time = processing_time
+        self.response = build_response(words)
+        self.limits = {"submit": submit_limit, "status": status_limit}
+        self.window = window
+        self.retry_after = retry_after
+        self.windows = {"submit": [0.0, 0], "status": [0.0, 0]}
+        self.operations = {}
+        self.stats = {"submit": 0, "status": 0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    @property
+    def async_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/speech/stt/v2/longRunningRecognize"
+
+    @property
+    def operation_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/operations"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def admit(self, kind):
+        """Учитывает запрос вида kind ("submit" или "status"); False – лимит окна исчерпан."""
+        with self.lock:
+            self.stats[kind] += 1
+            limit = self.limits[kind]
+            if limit is None:
+                return True
+            window = self.windows[kind]
+            now = time.monotonic()
+            if now - window[0] >= self.window:
+                window[0], window[1] = now, 0
+            if window[1] >= limit:
+                self.stats["rejected"] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class FakeSpeechKitHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _too_many_requests(self):
+        self._send_json(429, {"code": 8, "message": "Too many requests"},
+                        {"Retry-After": str(self.server.retry_after)})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if urlparse(self.path).path != "/speech/stt/v2/longRunningRecognize":
+            self._send_json(404, {"error": "NotFound"})
+            return
+        if not self.server.admit("submit"):
+            self._too_many_requests()
+            return
+        request = json.loads(body or b"{}")
+        operation_id = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.operations[operation_id] = {
+                "ready_at": time.monotonic() + self.server.processing_time,
+                "uri": request.get("audio", {}).get("uri"),
+            }
+        self._send_json(200, {"id": operation_id, "done": False})
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = urlparse(self.path).path
+        if not path.startswith("/operations/"):
+            self._send_json(404, {"error": "NotFound"})
+            return
+        if not self.server.admit("status"):
+            self._too_many_requests()
+            return
+        operation_id = path[len("/operations/"):]
+        operation = self.server.operations.get(operation_id)
+        if operation is None:
+            self._send_json(404, {"code": 5, "message": "Operation not found"})
+        elif time.monotonic() < operation["ready_at"]:
+            self._send_json(200, {"id": operation_id, "done": False})
+        else:
+            self._send_json(200, {"id": operation_id, "done": True, "response": self.server.response})
@@ -0,0 +1,101 @@
+"""
+Бенчмарк хранения базы знаний.
+
+На синтетической базе знаний (записи как в benchmarks.search_benchmark) сравнивает
+прежнюю схему – весь список в JSON с indent=4 – и хранилище SQLite из modules.database:
+  - открытие базы и чтение последней записи;
+  - добавление одной записи и изменение одной существующей записи;
+  - поиск сразу после изменения (индекс обновляется только по изменённой записи).
+
+Запуск из корня репозитория:
+    python -m benchmarks.knowledge_base_benchmark --entries 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.search_benchmark import make_entries, make_vocabulary
+
+
+def legacy_load(filename):
+    with open(filename, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def legacy_update(new_data, filename):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(new_data, f, ensure_ascii=False, indent=4)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000, help="число записей в базе знаний")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(50000, rng)
+    data = make_entries(args.entries, vocabulary, rng)
+    new_entry = {"question": "Как поддержать разговор на свидании?", "answer": "Задавайте открытые вопросы."}
+    changed_entry = dict(data[args.entries // 2], answer="Обновлённый ответ про уверенность и харизму.")
+
+    workdir = tempfile.mkdtemp(prefix="knowledge-bench-")
+    os.chdir(workdir)
+    legacy_file = os.path.join(workdir, "legacy.json")
+    legacy_update(data, legacy_file)
+    filename = os.path.join(workdir, "knowledge_base.json")
+    legacy_update(data, filename)
+    from modules import database
+
+    _, import_time = timed(lambda: database.open_knowledge_base(filename))
+    database.search_knowledge_base("разговор", database.load_knowledge_base(filename))
+    database._knowledge_bases.clear()
+    print(f"Записей: {args.entries}, JSON {os.path.getsize(legacy_file) / 1024 ** 2:.1f} МБ, "
+          f"SQLite {os.path.getsize(database.storage_path(filename)) / 1024 ** 2:.1f} МБ, "
+          f"перенос из JSON {import_time / 1000:.1f} с")
+    print(f"{'операция':>28} {'JSON, мс':>10} {'SQLite, мс':>11}")
+
+    def report(label, legacy_ms, storage_ms):
+        legacy = f"{legacy_ms:.1f}" if legacy_ms is not None else "–"
+        print(f"{label:>28} {legacy:>10} {storage_ms:>11.2f}")
+
+    legacy_data, legacy_ms = timed(lambda: legacy_load(legacy_file))
+    knowledge_base, storage_ms = timed(lambda: database.load_knowledge_base(filename))
+    _, legacy_read = timed(lambda: legacy_load(legacy_file)[-1])
+    _, storage_read = timed(lambda: knowledge_base[len(knowledge_base) - 1])
+    report("открытие", legacy_ms, storage_ms)
+    report("открытие + последняя запись", legacy_read, storage_ms + storage_read)
+
+    def legacy_append():
+        entries = legacy_load(legacy_file)
+        entries.append(new_entry)
+        legacy_update(entries, legacy_file)
+
+    def legacy_change():
+        entries = legacy_load(legacy_file)
+        entries[args.entries // 2] = changed_entry
+        legacy_update(entries, legacy_file)
+
+    _, legacy_ms = timed(legacy_append)
+    _, storage_ms = timed(lambda: database.append_entry(new_entry, filename))
+    report("добавление записи", legacy_ms, storage_ms)
+    _, legacy_ms = timed(legacy_change)
+    _, storage_ms = timed(lambda: database.append_entry(changed_entry, filename))
+    report("изменение записи", legacy_ms, storage_ms)
+
+    knowledge_base.search_index()
+    database.append_entry(dict(new_entry, question="Как пригласить на второе свидание?"), filename)
+    _, storage_ms = timed(lambda: database.search_knowledge_base("второе свидание", knowledge_base))
+    report("поиск после изменения", None, storage_ms)
+
+
+if __name__ == "__main__":
+    main()
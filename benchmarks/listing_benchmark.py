@@ -0,0 +1,77 @@
+"""
+Бенчмарк листинга видео на локальной заглушке API Яндекс.Диска.
+
+Генерирует дерево примерно из 30 000 видео (плюс папка с числом файлов больше одной страницы)
+и сравнивает время сканирования и число найденных файлов:
+  - legacy – прежний алгоритм: последовательная рекурсия, одна страница на папку;
+  - tree   – постраничный обход с параллельным запросом соседних папок (DISK_LIST_WORKERS);
+  - flat   – плоский список /resources/files?media_type=video.
+
+Запуск из корня репозитория:
+    python -m benchmarks.listing_benchmark --latency 0.02 --workers 1 4 8 16
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import requests
+
+from benchmarks.fake_disk import FakeDiskServer, build_tree
+
+
+def legacy_list_video_files(api_url, folder_path):
+    """Копия исходной реализации list_video_files (одна страница на папку, последовательный обход)."""
+    video_files = []
+    response = requests.get(f"{api_url}/resources", params={"path": folder_path, "limit": 1000})
+    if response.status_code == 200:
+        for item in response.json().get("_embedded", {}).get("items", []):
+            if item.get("type") == "dir":
+                video_files.extend(legacy_list_video_files(api_url, item.get("path")))
+            elif item.get("type") == "file" and item.get("mime_type", "").startswith("video/"):
+                video_files.append(item)
+    return video_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа API, сек")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--courses", type=int, default=12)
+    parser.add_argument("--flat-folder-files", type=int, default=1500,
+                        help="число видео в одной папке (больше страницы в 1000 элементов)")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    root = "disk:/Школа"
+    tree = build_tree(root, courses=args.courses, flat_folder_files=args.flat_folder_files)
+    server = FakeDiskServer(tree, latency=args.latency).start()
+    expected = sum(1 for items in tree.values() for item in items if item.get("media_type") == "video")
+    print(f"Дерево: {len(tree)} папок, {expected} видео; задержка API {args.latency * 1000:.0f} мс")
+
+    os.environ["DISK_API_URL"] = server.api_url
+    os.chdir(tempfile.mkdtemp(prefix="listing-bench-"))
+    from modules import video_processor, http_session
+
+    print(f"{'режим':>16} {'время, с':>9} {'запросов':>9} {'найдено':>8}")
+
+    def run(label, func):
+        requests_before = server.requests
+        start = time.perf_counter()
+        found = func()
+        elapsed = time.perf_counter() - start
+        print(f"{label:>16} {elapsed:>9.2f} {server.requests - requests_before:>9} {len(found):>8}")
+
+    if not args.skip_legacy:
+        run("legacy", lambda: legacy_list_video_files(server.api_url, root))
+    for workers in args.workers:
+        video_processor.DISK_LIST_WORKERS = workers
+        # Пул соединений общей сессии рассчитывается по числу потоков при её создании
+        http_session.reset_sessions()
+        run(f"tree x{workers}", lambda: video_processor.list_video_files(root, mode="tree"))
+    run("flat", lambda: video_processor.list_video_files(root, mode="flat"))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
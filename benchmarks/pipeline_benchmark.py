@@ -0,0 +1,201 @@
+"""
+Сквозной бенчмарк конвейера на локальных заглушках Яндекс.Диска, Object Storage и SpeechKit.
+
+Генерирует тестовое видео (ffmpeg: тон и цветной фон), отдаёт его с заглушки Диска
+под N путями уроков и прогоняет их через проект без обращения к Яндекс.Облаку:
+  - pipeline – run_ingestion_pipeline в режиме general: распознавание ждёт стадия загрузки;
+  - main     – потоки main.py в режиме deferred-general: конвейер ставит аудио в audio_queue,
+               поток распознавания отправляет операции, результаты ждёт общий опросчик.
+Выводит число видео в час, перцентили длительности каждого этапа и пиковый RSS
+(самого процесса и дочерних ffmpeg). Остальные настройки (число потоков стадий,
+STREAM_EXTRACTION, RECOGNITION_POLL_TICK и т. д.) берутся из переменных окружения, как в сервисе.
+
+Запуск из корня репозитория:
+    python -m benchmarks.pipeline_benchmark --videos 20 --video-seconds 120 --mode pipeline
+    python -m benchmarks.pipeline_benchmark --mode main --status-limit 50 --limit-window 10
+"""
+import argparse
+import collections
+import importlib
+import logging
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_disk import FakeDiskServer, build_tree
+from benchmarks.fake_s3 import FakeS3Server
+from benchmarks.fake_speechkit import FakeSpeechKitServer
+
+latencies = collections.defaultdict(list)
+_latencies_lock = threading.Lock()
+
+
+def record(stage, seconds):
+    with _latencies_lock:
+        latencies[stage].append(seconds)
+
+
+def timed(stage, func):
+    """Оборачивает функцию проекта: длительность каждого вызова записывается в latencies[stage]."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(stage, time.perf_counter() - start)
+    return wrapper
+
+
+def make_video(path, seconds, streamable):
+    """Генерирует видео MP4 (H.264 + AAC); streamable – moov в начале файла (+faststart)."""
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-f", "lavfi", "-i", f"color=size=320x240:rate=25:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest",
+    ]
+    if streamable:
+        command += ["-movflags", "+faststart"]
+    subprocess.run(command + [path], check=True)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def instrument(video_processor):
+    """Подключает замеры к этапам конвейера (функции вызываются по имени модуля, поэтому подмена видна стадиям)."""
+    for stage, name in [("scan", "list_video_files"), ("get_download_url", "get_download_url"),
+                        ("download", "download_file"), ("extract_audio", "extract_audio"),
+                        ("extract_and_upload", "extract_and_upload_audio"),
+                        ("get_audio_duration", "get_audio_duration"), ("upload", "upload_to_object_storage"),
+                        ("recognition_wait", "wait_recognition"), ("transcript_write", "save_raw_transcript")]:
+        setattr(video_processor, name, timed(stage, getattr(video_processor, name)))
+
+
+def run_pipeline_mode(video_processor, root):
+    video_processor.run_ingestion_pipeline(video_processor.list_video_files(root))
+
+
+def run_main_mode(video_processor, root):
+    import main
+    from modules import job_store
+
+    submitted = {}
+    submit_recognition = main.submit_recognition
+    on_recognition_done = main.on_recognition_done
+
+    def submit(file_url, model):
+        submitted[file_url] = time.perf_counter()
+        return submit_recognition(file_url, model)
+
+    def done(metadata, future):
+        started = submitted.pop(metadata.get("public_url"), None)
+        if started is not None:
+            record("recognition_wait", time.perf_counter() - started)
+        on_recognition_done(metadata, future)
+
+    main.submit_recognition = submit
+    main.on_recognition_done = done
+
+    transcription_thread = threading.Thread(target=main.transcription_processing_thread, daemon=True)
+    transcription_thread.start()
+    video_processor.run_ingestion_pipeline(video_processor.list_video_files(root), main.audio_queue)
+    while job_store.count_jobs(job_store.UPLOADED) or job_store.count_jobs(job_store.SUBMITTED):
+        time.sleep(0.2)
+    main.stop_recognition()
+    transcription_thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["pipeline", "main"], default="pipeline")
+    parser.add_argument("--videos", type=int, default=20, help="число видео")
+    parser.add_argument("--video-seconds", type=int, default=120, help="длительность тестового видео, сек")
+    parser.add_argument("--streamable", action="store_true",
+                        help="moov в начале MP4: аудио извлекается по ссылке без скачивания")
+    parser.add_argument("--disk-bandwidth-mbps", type=float, default=200.0,
+                        help="скорость одного соединения с Диском, Мбит/с (0 – без ограничения)")
+    parser.add_argument("--disk-latency", type=float, default=0.02, help="задержка API Диска, сек")
+    parser.add_argument("--s3-bandwidth-mbps", type=float, default=100.0,
+                        help="скорость одного соединения с Object Storage, Мбит/с (0 – без ограничения)")
+    parser.add_argument("--s3-latency", type=float, default=0.02, help="задержка Object Storage, сек")
+    parser.add_argument("--speechkit-latency", type=float, default=0.05, help="задержка API SpeechKit, сек")
+    parser.add_argument("--processing-time", type=float, default=5.0,
+                        help="время распознавания одной операции в SpeechKit, сек")
+    parser.add_argument("--submit-limit", type=int, default=None,
+                        help="отправок на распознавание за окно, сверх – 429")
+    parser.add_argument("--status-limit", type=int, default=None,
+                        help="проверок статуса за окно, сверх – 429")
+    parser.add_argument("--limit-window", type=float, default=60.0, help="окно лимитов SpeechKit, сек")
+    parser.add_argument("--verbose", action="store_true", help="не подавлять журнал проекта")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    video = os.path.join(workdir, "source.mp4")
+    make_video(video, args.video_seconds, args.streamable)
+
+    root = "disk:/Школа"
+    tree = build_tree(root, courses=1, modules=1, lessons=args.videos, files_per_lesson=1,
+                      video_size=os.path.getsize(video))
+    disk = FakeDiskServer(tree, latency=args.disk_latency, video_source=video,
+                          bandwidth=args.disk_bandwidth_mbps * 1e6 / 8 or None).start()
+    s3 = FakeS3Server(latency=args.s3_latency, bandwidth=args.s3_bandwidth_mbps * 1e6 / 8 or None).start()
+    speechkit = FakeSpeechKitServer(latency=args.speechkit_latency, processing_time=args.processing_time,
+                                    submit_limit=args.submit_limit, status_limit=args.status_limit,
+                                    window=args.limit_window).start()
+    os.environ.update({
+        "DISK_API_URL": disk.api_url,
+        "DISK_FOLDER_PATH": root,
+        "YANDEX_DISK_OAUTH_TOKEN": "bench",
+        "YOBJECT_STORAGE_ENDPOINT": s3.endpoint,
+        "YOBJECT_STORAGE_BUCKET": "bench",
+        "YOBJECT_STORAGE_ACCESS_KEY": "bench",
+        "YOBJECT_STORAGE_SECRET_KEY": "bench",
+        "AWS_DEFAULT_REGION": "ru-central1",
+        "YANDEX_SPEECHKIT_API_KEY": "bench",
+        "SPEECHKIT_ASYNC_URL": speechkit.async_url,
+        "SPEECHKIT_OPERATION_URL": speechkit.operation_url,
+        "RECOGNITION_MODEL": "general" if args.mode == "pipeline" else "deferred-general",
+    })
+    os.chdir(workdir)
+    from modules import video_processor, job_store
+    if args.mode == "main":
+        # main.py при импорте настраивает логирование (log_config), уровень понижается после него
+        importlib.import_module("main")
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    instrument(video_processor)
+
+    start = time.perf_counter()
+    if args.mode == "pipeline":
+        run_pipeline_mode(video_processor, root)
+    else:
+        run_main_mode(video_processor, root)
+    elapsed = time.perf_counter() - start
+
+    recognized = job_store.count_jobs(job_store.RECOGNIZED)
+    failed = job_store.count_jobs(job_store.FAILED)
+    own_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"Режим {args.mode}: {args.videos} видео по {args.video_seconds} сек "
+          f"({os.path.getsize(video) / 1024 ** 2:.1f} МБ), {elapsed:.1f} сек")
+    print(f"Распознано: {recognized}, ошибок: {failed}; {recognized / elapsed * 3600:.0f} видео/ч, "
+          f"{recognized * args.video_seconds / elapsed:.1f} ч аудио/ч")
+    print(f"SpeechKit: отправок {speechkit.stats['submit']}, проверок статуса {speechkit.stats['status']}, "
+          f"ответов 429: {speechkit.stats['rejected']}")
+    print(f"Пиковый RSS: процесс {own_rss:.0f} МБ, дочерние процессы {children_rss:.0f} МБ")
+    print(f"{'этап':>20} {'вызовов':>8} {'p50, с':>8} {'p95, с':>8} {'макс, с':>8}")
+    for stage, values in latencies.items():
+        print(f"{stage:>20} {len(values):>8} {percentile(values, 0.5):>8.2f} "
+              f"{percentile(values, 0.95):>8.2f} {max(values):>8.2f}")
+    for server in (disk, s3, speechkit):
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
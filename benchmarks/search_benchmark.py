@@ -0,0 +1,122 @@
+"""
+Бенчмарк поиска по базе знаний.
+
+Генерирует синтетическую базу знаний (по умолчанию 100 000 записей «вопрос – ответ»
+из русских слов с распределением частот по закону Ципфа) и сравнивает:
+  - legacy – прежний search_knowledge_base: линейный проход с lower() и поиском подстроки;
+  - bm25   – поиск по инвертированному индексу modules.search_index.
+Для индекса измеряются время построения, размер файла и время загрузки с диска.
+
+Запуск из корня репозитория:
+    python -m benchmarks.search_benchmark --entries 100000 --queries 200
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_STEMS = [
+    "урок", "отношен", "мужчин", "женщин", "разговор", "свидан", "уверенност", "общен", "вопрос",
+    "ответ", "привычк", "трениров", "работ", "деньг", "семь", "друг", "встреч", "поведен", "эмоци",
+    "внимани", "довери", "границ", "ценност", "цел", "страх", "интерес", "харизм", "юмор", "стил",
+    "голос", "взгляд", "жест", "флирт", "конфликт", "решени", "ошибк", "опыт", "привлекательност",
+]
+_ENDINGS = ["", "а", "ы", "е", "у", "ом", "ами", "ах", "ов", "ей", "ия", "ие", "ии", "ях"]
+
+
+def legacy_search_knowledge_base(query, data):
+    """Копия исходного search_knowledge_base (линейный проход с поиском подстроки)."""
+    results = []
+    query_lower = query.lower()
+    for entry in data:
+        if query_lower in entry.get("question", "").lower() or query_lower in entry.get("answer", "").lower():
+            results.append(entry)
+    return results
+
+
+def make_vocabulary(size, rng):
+    """Словарь из size словоформ: основы с окончаниями и синтетические слова."""
+    words = [stem + ending for stem in _STEMS for ending in _ENDINGS]
+    letters = "абвгдежзиклмнопрстуфхцчшщэюя"
+    while len(words) < size:
+        words.append("".join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    rng.shuffle(words)
+    return words[:size]
+
+
+def make_entries(count, vocabulary, rng):
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    def sentence(length):
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=length)).capitalize()
+
+    return [{"question": sentence(rng.randint(6, 14)) + "?", "answer": sentence(rng.randint(30, 80)) + "."}
+            for _ in range(count)]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(search, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000, help="число записей в базе знаний")
+    parser.add_argument("--vocabulary", type=int, default=50000, help="размер словаря")
+    parser.add_argument("--queries", type=int, default=200, help="число запросов")
+    parser.add_argument("--legacy-queries", type=int, default=20, help="число запросов для линейного поиска")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    data = make_entries(args.entries, vocabulary, rng)
+    queries = [" ".join(rng.sample(vocabulary[:2000], rng.randint(1, 4))) for _ in range(args.queries)]
+
+    workdir = tempfile.mkdtemp(prefix="search-bench-")
+    filename = os.path.join(workdir, "knowledge_base.json")
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.chdir(workdir)
+    from modules import database
+    from modules.search_index import SearchIndex
+
+    knowledge_base = database.load_knowledge_base(filename)
+    start = time.perf_counter()
+    index = knowledge_base.search_index()
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded = SearchIndex.load(database.index_path(filename))
+    load_time = time.perf_counter() - start
+    index_size = os.path.getsize(database.index_path(filename)) / 1024 ** 2
+    json_size = os.path.getsize(filename) / 1024 ** 2
+    assert loaded is not None and len(loaded) == len(index)
+
+    print(f"Записей: {args.entries}, JSON {json_size:.1f} МБ, основ в индексе: {len(index.postings)}")
+    print(f"Индекс: построение {build_time:.2f} с, файл {index_size:.1f} МБ, загрузка {load_time:.2f} с")
+    print(f"{'режим':>8} {'запросов':>9} {'p50, мс':>9} {'p95, мс':>9} {'среднее, мс':>12}")
+    runs = [
+        ("legacy", queries[:args.legacy_queries], lambda query: legacy_search_knowledge_base(query, data)),
+        ("bm25", queries, lambda query: database.search_knowledge_base(query, knowledge_base, args.top_k)),
+    ]
+    for label, run_queries, search in runs:
+        latencies = measure(search, run_queries)
+        print(f"{label:>8} {len(run_queries):>9} {percentile(latencies, 0.5):>9.2f} "
+              f"{percentile(latencies, 0.95):>9.2f} {statistics.mean(latencies):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
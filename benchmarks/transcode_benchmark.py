@@ -0,0 +1,97 @@
+"""
+Бенчмарк параллельного извлечения аудио (extract_audio) на разном числе ядер.
+
+Генерирует набор тестовых видео разной длины (ffmpeg: тон и цветной фон) и для каждого
+числа ядер из --cores ограничивает процесс этими ядрами (sched_setaffinity, ffmpeg
+наследует привязку), после чего сравнивает:
+  - serial – прежний порядок: одно извлечение за раз, число потоков ffmpeg по умолчанию;
+  - pool   – планировщик конвейера: transcode_workers("auto") параллельных заданий,
+             ffmpeg_threads потоков на задание, задания от больших видео к меньшим.
+Выводит время, часы аудио в час и ускорение относительно serial и относительно одного ядра.
+Числа ядер больше доступных пропускаются.
+
+Запуск из корня репозитория:
+    python -m benchmarks.transcode_benchmark --videos 32 --video-seconds 120 --cores 1 2 4 8 16
+"""
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import tempfile
+import time
+
+
+def make_video(path, seconds):
+    """Генерирует видео MP4 (H.264 + AAC) длительностью seconds."""
+    subprocess.run([
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-f", "lavfi", "-i", f"color=size=320x240:rate=25:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path,
+    ], check=True)
+
+
+def run_serial(video_processor, videos, workdir):
+    for index, path in enumerate(videos):
+        video_processor.extract_audio(path, os.path.join(workdir, f"serial_{index}.ogg"), threads=0)
+
+
+def run_pool(video_processor, transcoder, videos, workdir):
+    workers = transcoder.transcode_workers("auto", [os.path.getsize(path) for path in videos], workdir)
+    threads = transcoder.ffmpeg_threads(workers)
+    ordered = sorted(videos, key=os.path.getsize, reverse=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: video_processor.extract_audio(
+            item[1], os.path.join(workdir, f"pool_{item[0]}.ogg"), threads=threads), enumerate(ordered)))
+    return workers, threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=32, help="число видео")
+    parser.add_argument("--video-seconds", type=int, default=120,
+                        help="длительность самого короткого видео, сек (остальные – в 2-4 раза длиннее)")
+    parser.add_argument("--cores", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="transcode-bench-")
+    os.chdir(workdir)
+    import logging
+    from modules import video_processor, transcoder
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Видео разной длины, чтобы порядок заданий влиял на время прогона
+    lengths = [args.video_seconds * (1 + index % 4) for index in range(args.videos)]
+    videos = []
+    for index, seconds in enumerate(lengths):
+        path = os.path.join(workdir, f"video_{index}.mp4")
+        make_video(path, seconds)
+        videos.append(path)
+    audio_hours = sum(lengths) / 3600
+
+    all_cpus = sorted(os.sched_getaffinity(0))
+    print(f"{args.videos} видео, {audio_hours:.2f} ч аудио; доступно ядер: {len(all_cpus)}")
+    print(f"{'ядер':>5} {'заданий':>8} {'потоков':>8} {'serial, с':>10} {'pool, с':>8} "
+          f"{'ч аудио/ч':>10} {'к serial':>9} {'к 1 ядру':>9}")
+    single_core = None
+    for cores in args.cores:
+        if cores > len(all_cpus):
+            print(f"{cores:>5} – пропущено: доступно только {len(all_cpus)} ядер")
+            continue
+        os.sched_setaffinity(0, all_cpus[:cores])
+        start = time.perf_counter()
+        run_serial(video_processor, videos, workdir)
+        serial = time.perf_counter() - start
+        start = time.perf_counter()
+        workers, threads = run_pool(video_processor, transcoder, videos, workdir)
+        pool = time.perf_counter() - start
+        if cores == 1:
+            single_core = pool
+        scaling = f"{single_core / pool:>8.2f}x" if single_core else f"{'–':>9}"
+        print(f"{cores:>5} {workers:>8} {threads:>8} {serial:>10.1f} {pool:>8.1f} "
+              f"{audio_hours * 3600 / pool:>10.0f} {serial / pool:>8.2f}x {scaling}")
+    os.sched_setaffinity(0, all_cpus)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Бенчмарк загрузки аудио в Object Storage на локальном S3-совместимом сервере.
+
+Сравнивает для записей длительностью 1, 5 и 10 часов (OggOpus 64k):
+  - serial    – однопоточная загрузка готового файла;
+  - multipart – параллельная multipart-загрузка с настройками S3_MULTIPART_* / S3_MAX_CONCURRENCY;
+  - sequential encode+upload – кодирование (имитация), затем multipart-загрузка;
+  - streaming encode+upload  – загрузка частей из pipe по мере кодирования.
+
+Запуск из корня репозитория:
+    python -m benchmarks.upload_benchmark --durations 1 5 10
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_s3 import FakeS3Server
+
+AUDIO_BYTES_PER_HOUR = 64 * 1000 // 8 * 3600  # OggOpus 64 кбит/с
+
+
+def _paced_writer(fd, size, rate, block=256 * 1024):
+    """Пишет size байт в файловый дескриптор со скоростью rate байт/с (имитация ffmpeg)."""
+    start = time.perf_counter()
+    written = 0
+    payload = os.urandom(block)
+    with os.fdopen(fd, "wb") as pipe:
+        while written < size:
+            chunk = payload[:min(block, size - written)]
+            pipe.write(chunk)
+            written += len(chunk)
+            delay = written / rate - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 5, 10], help="длительность записей, ч")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка на запрос, сек")
+    parser.add_argument("--bandwidth-mbps", type=float, default=40.0,
+                        help="пропускная способность одного соединения, Мбит/с")
+    parser.add_argument("--encode-speed", type=float, default=300.0,
+                        help="скорость кодирования ffmpeg, кратно реальному времени")
+    args = parser.parse_args()
+
+    server = FakeS3Server(latency=args.latency, bandwidth=args.bandwidth_mbps * 1e6 / 8).start()
+    os.environ.update({
+        "YOBJECT_STORAGE_ENDPOINT": server.endpoint,
+        "YOBJECT_STORAGE_BUCKET": "bench",
+        "YOBJECT_STORAGE_ACCESS_KEY": "bench",
+        "YOBJECT_STORAGE_SECRET_KEY": "bench",
+        "AWS_DEFAULT_REGION": "ru-central1",
+    })
+    workdir = tempfile.mkdtemp(prefix="upload-bench-")
+    os.chdir(workdir)
+    from boto3.s3.transfer import TransferConfig
+    from modules import video_processor
+
+    serial_config = TransferConfig(multipart_threshold=2 ** 40, use_threads=False)
+    print(f"S3: {server.endpoint}, задержка {args.latency * 1000:.0f} мс, "
+          f"{args.bandwidth_mbps:.0f} Мбит/с на соединение; часть "
+          f"{video_processor.S3_MULTIPART_CHUNKSIZE // 1024 ** 2} МБ, потоков {video_processor.S3_MAX_CONCURRENCY}")
+    print(f"{'запись':>8} {'размер, МБ':>11} {'serial':>9} {'multipart':>10} "
+          f"{'enc→upload':>11} {'enc+upload':>11}")
+    for hours in args.durations:
+        size = int(AUDIO_BYTES_PER_HOUR * hours)
+        path = os.path.join(workdir, f"{hours}h.ogg")
+        with open(path, "wb") as f:
+            for offset in range(0, size, 1024 ** 2):
+                f.write(os.urandom(min(1024 ** 2, size - offset)))
+
+        start = time.perf_counter()
+        video_processor.upload_to_object_storage(path, f"serial-{hours}.ogg", transfer_config=serial_config)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        video_processor.upload_to_object_storage(path, f"multipart-{hours}.ogg")
+        multipart = time.perf_counter() - start
+
+        encode_time = hours * 3600 / args.encode_speed
+        sequential = encode_time + multipart
+
+        read_fd, write_fd = os.pipe()
+        writer = threading.Thread(target=_paced_writer, args=(write_fd, size, size / encode_time))
+        start = time.perf_counter()
+        writer.start()
+        with os.fdopen(read_fd, "rb") as stream:
+            url = video_processor.upload_stream_to_object_storage(stream, f"stream-{hours}.ogg")
+        streaming = time.perf_counter() - start
+        writer.join()
+        assert url, "потоковая загрузка не удалась"
+        os.remove(path)
+
+        print(f"{hours:>7g}ч {size / 1024 ** 2:>11.1f} {serial:>8.2f}с {multipart:>9.2f}с "
+              f"{sequential:>10.2f}с {streaming:>10.2f}с")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
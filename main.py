@@ -1,127 +1,306 @@
 import log_config  # Выполняет настройку логирования (не используется напрямую) # noqa: F401
 
+import json
 import threading
 import time
-from queue import Queue
+import functools
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
 
 from modules.video_processor import (
     list_video_files,
     process_video_file,
-    load_upload_errors,
-    save_upload_errors,
+    run_ingestion_pipeline,
     DISK_FOLDER_PATH,
-    async_recognize_speech,
     load_audio_queue,
-    save_audio_queue
+    job_metadata,
+    complete_recognition,
+    complete_duplicate,
+    fail_recognition
 )
+from modules import job_store
+from modules.pipeline import MonitoredQueue
+from modules.metrics import (
+    QUEUE_DEPTH,
+    QUEUE_HIGH_WATER_MARK,
+    RECOGNITION_OPERATIONS,
+    observe_stage,
+    start_metrics_server
+)
+from modules.recognition import (
+    submit_recognition,
+    submit_segments,
+    track_operation,
+    track_segments,
+    chunks_to_text
+)
+from modules.utils import load_config
+
+config = load_config()
+# Ёмкость очереди распознавания: при заполнении загрузка новых аудио ждёт (backpressure)
+AUDIO_QUEUE_SIZE = int(config.get("AUDIO_QUEUE_SIZE", 100))
+# Максимум операций распознавания, одновременно ожидающих результата в SpeechKit
+MAX_ACTIVE_RECOGNITIONS = int(config.get("MAX_ACTIVE_RECOGNITIONS", 200))
+
+# Создаём потокобезопасную ограниченную очередь для метаданных аудиофайлов
+audio_queue = MonitoredQueue(maxsize=AUDIO_QUEUE_SIZE)
 
-# Создаём потокобезопасную очередь для метаданных аудиофайлов
-audio_queue = Queue()
+# Сигнал остановки потока распознавания: проверяется после выборки из очереди и будит ожидание слота
+stop_event = threading.Event()
 
-# Загружаем элементы из persistent файла и добавляем их в очередь
-persistent_items = load_audio_queue()
-for item in persistent_items:
-    audio_queue.put(item)
+# Число операций распознавания, ожидающих результата (свободные слоты – до MAX_ACTIVE_RECOGNITIONS)
+active_recognitions = 0
+active_condition = threading.Condition()
+
+QUEUE_DEPTH.set_function(audio_queue.qsize, queue="audio_queue")
+QUEUE_HIGH_WATER_MARK.set_function(lambda: audio_queue.high_water_mark, queue="audio_queue")
+RECOGNITION_OPERATIONS.set_function(lambda: active_recognitions, state="active")
 
 # Интервал сканирования (каждые 12 часов; для тестирования можно установить меньше)
 SCAN_INTERVAL = 43200  # 12 часов
+# Интервал вывода состояния очереди распознавания в лог
+QUEUE_REPORT_INTERVAL = 600
+# Как часто пустая очередь распознавания проверяет сигнал остановки, сек
+STOP_POLL_INTERVAL = 1
+
+
+def acquire_recognition_slot():
+    """
+    Ждёт, пока число ожидающих операций распознавания не станет меньше MAX_ACTIVE_RECOGNITIONS.
+    Возвращает False, если ожидание прервано остановкой (слот при этом не занимается).
+    """
+    global active_recognitions
+    with active_condition:
+        while active_recognitions >= MAX_ACTIVE_RECOGNITIONS and not stop_event.is_set():
+            active_condition.wait()
+        if stop_event.is_set():
+            return False
+        active_recognitions += 1
+        return True
+
+
+def occupy_recognition_slot():
+    """
+    Учитывает операцию, восстановленную после перезапуска, без ожидания: она уже отправлена
+    в SpeechKit, поэтому лишь уменьшает число слотов для новых операций.
+    """
+    global active_recognitions
+    with active_condition:
+        active_recognitions += 1
+
+
+def release_recognition_slot():
+    """Освобождает слот завершившейся операции распознавания."""
+    global active_recognitions
+    with active_condition:
+        active_recognitions -= 1
+        active_condition.notify()
+
+
+def stop_recognition():
+    """Останавливает отправку новых заданий: будит поток распознавания, ожидающий слот или очередь."""
+    stop_event.set()
+    with active_condition:
+        active_condition.notify_all()
+
+
+def _next_audio():
+    """Берёт из очереди следующее аудио; при остановке возвращает None."""
+    while not stop_event.is_set():
+        try:
+            return audio_queue.get(timeout=STOP_POLL_INTERVAL)
+        except Empty:
+            continue
+    return None
+
+
+def _segments_submitted(job):
+    """Проверяет, что все сегменты длинной записи уже отправлены в SpeechKit (у каждого есть operation_id)."""
+    segments = job_metadata(job)["segments"]
+    return bool(segments) and all(segment.get("operation_id") for segment in segments)
+
+
+def restore_recognition_state(audio_queue):
+    """
+    Восстанавливает распознавание после перезапуска по базе заданий:
+      - операции, уже отправленные в SpeechKit, снова отслеживаются по их id без повторной отправки;
+      - задания без id операции и с ошибкой распознавания возвращаются в состояние uploaded
+        (в очередь их ставит feed_audio_backlog);
+      - копии видео, оригинал которых успел распознаться, получают его транскрипцию.
+    """
+    for job in job_store.iter_jobs(job_store.SUBMITTED):
+        if job.get("duplicate_of"):
+            # Копия ждёт результата оригинала и сама в SpeechKit не отправлялась
+            original = job_store.get_job(job["duplicate_of"])
+            if original and original["state"] == job_store.RECOGNIZED and original.get("transcript"):
+                complete_duplicate(original["file_path"], job["file_path"], original["transcript"])
+        elif job.get("operation_id") or _segments_submitted(job):
+            metadata = job_metadata(job)
+            occupy_recognition_slot()
+            if metadata["segments"]:
+                # Операции сегментов длинной записи хранятся в поле segments
+                future = track_segments(metadata["segments"], "deferred-general")
+            else:
+                future = track_operation(job["operation_id"], job.get("audio_duration"), "deferred-general")
+            future.add_done_callback(functools.partial(on_recognition_done, metadata))
+        else:
+            job_store.set_state(job["file_path"], job_store.UPLOADED)
+    for job in job_store.list_jobs(job_store.FAILED, error_stage="recognition"):
+        job_store.set_state(job["file_path"], job_store.UPLOADED)
+
+
+def feed_audio_backlog(audio_queue):
+    """
+    Ставит в очередь аудио, загруженные до перезапуска (задания в состоянии uploaded).
+    Задания читаются из базы постранично, а put() ждёт свободного места в очереди,
+    поэтому даже большой накопленный объём не увеличивает потребление памяти.
+    """
+    count = 0
+    for item in load_audio_queue():
+        audio_queue.put(item)
+        count += 1
+    logging.info(f"В очередь распознавания поставлено {count} ранее загруженных аудио.")
 
 
 def reprocess_upload_errors(audio_queue):
-    errors = load_upload_errors()
+    errors = job_store.list_jobs(job_store.FAILED, error_stage="upload")
     if errors:
         logging.info(f"Найдено {len(errors)} файлов с ошибками загрузки. Попытка повторной загрузки.")
-        remaining_errors = []
         for error_item in errors:
-            # Здесь error_item содержит file_path, local_audio, audio_duration, а также данные, полученные из parse_video_file_path
-            # Попытаемся повторно загрузить аудио для этого файла
+            # Попытаемся повторно обработать видео; при новой ошибке задание снова
+            # окажется в базе в состоянии failed и будет повторено при следующем запуске
             file_item = {"path": error_item["file_path"]}
             process_video_file(file_item, audio_queue)
-            # Если после повторной обработки файл все ещё не загрузился, можно сохранить его для следующей попытки
-            # (например, можно загрузить список из persistent ошибок заново)
-            # Здесь для простоты оставляем повторную обработку без явного сохранения оставшихся ошибок.
-        # После обработки можно очистить файл ошибок, если все успешно обработаны
-        save_upload_errors([])
 
 
 def video_processing_thread():
     """
-    Поток для последовательной обработки видео:
+    Поток для обработки видео:
       - Сканирует папки на наличие новых видео
-      - Обрабатывает видео и добавляет аудио-метаданные в очередь.
+      - Прогоняет видео через конвейер (скачивание, извлечение аудио, загрузка)
+        и добавляет аудио-метаданные в очередь.
     """
     while True:
         logging.info("Начало сканирования видеофайлов")
         video_files = list_video_files(DISK_FOLDER_PATH)
         logging.info(f"Найдено видеофайлов: {len(video_files)}")
-        for file_item in video_files:
-            process_video_file(file_item, audio_queue)
+        run_ingestion_pipeline(video_files, audio_queue)
         logging.info("Сканирование завершено. Ожидание следующего цикла.")
         time.sleep(SCAN_INTERVAL)
 
 
-def process_transcription(metadata):
+def process_transcription(metadata, recognized_text, response=None):
     """
-    Отправляет запрос асинхронного распознавания для одного аудиофайла и
-    после успешного получения результата удаляет элемент из persistent-хранилища.
-    Сохраняет полученный сырой текст в файл raw_transcript.txt.
+    Обрабатывает результат распознавания одного аудиофайла: сохраняет сырой текст
+    и полный ответ SpeechKit в transcript_store (отдельные файлы видео и манифест),
+    и отмечает задание в базе как распознанное (вместе с ожидающими его копиями видео).
     """
-    public_url = metadata.get("public_url")
-    audio_duration = metadata.get("audio_duration")
     file_path = metadata.get("file_path")
-    recognized_text = async_recognize_speech(public_url, audio_duration, model="deferred-general")
     if recognized_text:
         logging.info(f"Распознавание для файла {file_path} завершено. Результат: {recognized_text}")
-
-        # Сохраняем сырой текст в файл raw_transcript.txt (в режиме append)
-        try:
-            with open("raw_transcript.txt", "a", encoding="utf-8") as f:
-                f.write(f"=== Файл: {file_path} ===\n")
-                f.write("Распознанный текст:\n")
-                f.write(recognized_text + "\n\n")
-        except Exception as e:
-            logging.error(f"Ошибка сохранения raw транскрипта для файла {file_path}: {e}")
-
-        # После успешного распознавания удаляем элемент из persistent-хранилища
-        current_items = load_audio_queue()
-        updated_items = [item for item in current_items if item.get("file_path") != file_path]
-        save_audio_queue(updated_items)
+        complete_recognition(file_path, recognized_text, response)
     else:
         logging.error(f"Распознавание для файла {file_path} не дало результата.")
+        fail_recognition(file_path)
     return recognized_text
 
 
+def on_recognition_done(metadata, future):
+    """Колбэк завершения операции распознавания, вызывается потоком опросчика."""
+    # Восстановленные после перезапуска операции не имеют времени отправки и в метрики не попадают
+    waited = time.time() - metadata["submitted_at"] if metadata.get("submitted_at") else None
+    response = None
+    try:
+        response = future.result()
+        process_transcription(metadata, chunks_to_text(response) if response else "", response)
+    except Exception as e:
+        logging.error(f"Ошибка в процессе расшифровки: {e}")
+    finally:
+        if waited is not None:
+            observe_stage("recognition_wait", waited, bool(response))
+        release_recognition_slot()
+
+
 def transcription_processing_thread():
     """
-    Поток, который постоянно проверяет очередь audio_queue и параллельно отправляет
-    запросы на расшифровку для каждого найденного аудиофайла.
+    Поток, который забирает аудиофайлы из очереди audio_queue и отправляет запросы
+    на расшифровку. Ожидание результатов выполняет общий опросчик операций; новое
+    задание берётся из очереди только при свободном слоте (MAX_ACTIVE_RECOGNITIONS),
+    поэтому при медленном SpeechKit очередь заполняется и загрузка аудио притормаживает.
+    Поток завершается по stop_event: задания, оставшиеся в очереди, не отправляются
+    (они сохранены в базе в состоянии uploaded и будут поставлены в очередь при следующем запуске).
     """
-    with ThreadPoolExecutor(max_workers=30) as executor:
-        while True:
-            if not audio_queue.empty():
-                metadata = audio_queue.get()
-                future = executor.submit(process_transcription, metadata)
-                future.add_done_callback(
-                    lambda f: logging.error(
-                        f"Ошибка в процессе расшифровки: {f.exception()}") if f.exception() else None
-                )
-            else:
-                time.sleep(10)
+    while acquire_recognition_slot():
+        metadata = _next_audio()
+        # Сигнал проверяется и после выборки: задание, взятое в момент остановки, не отправляется
+        if metadata is None or stop_event.is_set():
+            release_recognition_slot()
+            break
+        file_path = metadata.get("file_path")
+        # Атомарно забираем задание, чтобы одно и то же аудио не было отправлено дважды
+        if not job_store.claim_job(file_path, (job_store.UPLOADED,), job_store.SUBMITTED):
+            release_recognition_slot()
+            continue
+        # Время от отправки до результата учитывается в метриках этапа recognition_wait
+        metadata["submitted_at"] = time.time()
+        if metadata.get("segments"):
+            # Сегменты длинной записи распознаются параллельными операциями
+            segments = submit_segments(metadata["segments"], "deferred-general")
+            if not segments:
+                process_transcription(metadata, "")
+                release_recognition_slot()
+                continue
+            job_store.set_state(file_path, job_store.SUBMITTED, segments=json.dumps(segments))
+            future = track_segments(segments, "deferred-general")
+        else:
+            operation_id = submit_recognition(metadata.get("public_url"), "deferred-general")
+            if not operation_id:
+                process_transcription(metadata, "")
+                release_recognition_slot()
+                continue
+            job_store.set_state(file_path, job_store.SUBMITTED, operation_id=operation_id)
+            future = track_operation(operation_id, metadata.get("audio_duration"), "deferred-general")
+        future.add_done_callback(functools.partial(on_recognition_done, metadata))
+    logging.info("Поток распознавания остановлен.")
+
+
+def log_queue_state():
+    """Выводит в лог размер очереди распознавания, её максимум (high-water mark) и число операций в работе."""
+    logging.info(f"Очередь распознавания: {audio_queue.qsize()} из {AUDIO_QUEUE_SIZE}, "
+                 f"максимум {audio_queue.high_water_mark}; "
+                 f"операций в работе: {active_recognitions} из {MAX_ACTIVE_RECOGNITIONS}")
 
 
 if __name__ == "__main__":
-    # Повторная обработка файлов с ошибками загрузки (из upload_errors.json)
-    reprocess_upload_errors(audio_queue)
+    # Эндпоинт метрик Prometheus (METRICS_HOST:METRICS_PORT)
+    start_metrics_server()
 
-    # Запуск потоков обработки видео и расшифровки аудио
-    video_thread = threading.Thread(target=video_processing_thread, daemon=True)
+    # Восстановление отслеживания операций из базы заданий
+    restore_recognition_state(audio_queue)
+
+    # Поток расшифровки запускается первым: очередь ограничена, и без потребителя
+    # постановка в неё накопленных аудио заблокировалась бы
     transcription_thread = threading.Thread(target=transcription_processing_thread, daemon=True)
+    transcription_thread.start()
+    threading.Thread(target=feed_audio_backlog, args=(audio_queue,), daemon=True).start()
 
+    # Повторная обработка файлов с ошибками загрузки
+    reprocess_upload_errors(audio_queue)
+
+    # Запуск потока обработки видео
+    video_thread = threading.Thread(target=video_processing_thread, daemon=True)
     video_thread.start()
-    transcription_thread.start()
 
-    # Основной поток остаётся активным
-    while True:
-        time.sleep(60)
+    # Основной поток остаётся активным и периодически сообщает о состоянии очереди
+    try:
+        while True:
+            time.sleep(QUEUE_REPORT_INTERVAL)
+            log_queue_state()
+    except KeyboardInterrupt:
+        logging.info("Остановка: новые задания распознавания не отправляются.")
+        # Задания, оставшиеся в очереди, сохранены в базе и будут поставлены в неё при следующем запуске
+        stop_recognition()
+        transcription_thread.join(timeout=60)
+        if transcription_thread.is_alive():
+            logging.warning("Поток распознавания не остановился за 60 секунд.")
+        log_queue_state()
@@ -1,4 +1,5 @@
 from .video_processor import process_all_videos
 #from .text_structurer import process_course_text
-from .database import load_knowledge_base, search_knowledge_base, update_knowledge_base
+from .database import (load_knowledge_base, search_knowledge_base, update_knowledge_base,
+                       append_entry, export_knowledge_base)
 from .utils import load_config
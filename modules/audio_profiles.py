@@ -0,0 +1,143 @@
+"""
+Профили кодирования аудио для распознавания.
+
+Профиль задаёт частоту дискретизации, битрейт, режим (application) и сложность
+(compression_level) кодировщика libopus, а также цепочку фильтров ffmpeg.
+Для распознавания речи достаточно полосы 8 кГц (частота 16 кГц) и режима voip,
+поэтому речевые профили в несколько раз меньше
+прежнего кодирования (legacy: 64 кбит/с с частотой, которую выбирает ffmpeg), что
+сокращает объём и время загрузки в Object Storage. На низких битрейтах libopus кодирует
+речь режимами SILK/hybrid, которые требуют больше процессора, поэтому сложность
+речевых профилей снижена: при compression_level 5 кодирование вдвое быстрее, чем при 10,
+а размер практически не меняется.
+
+AUDIO_PROFILE=auto выбирает профиль по свойствам аудиодорожки исходного файла
+(ffprobe, select_profile). Профиль с наименьшим размером, при котором качество
+распознавания не падает, подбирается бенчмарком benchmarks/encoding_benchmark.py.
+"""
+import json
+import logging
+import subprocess
+
+from modules.utils import load_config
+
+config = load_config()
+
+# Профиль кодирования аудио: имя из PROFILES или auto – выбор по исходной дорожке
+AUDIO_PROFILE = config.get("AUDIO_PROFILE", "legacy")
+
+PROFILES = {
+    # Прежнее кодирование: 64 кбит/с, частота и фильтры по умолчанию
+    "legacy": {
+        "sample_rate": None, "bitrate": "64k", "application": "audio", "compression_level": None,
+        "filters": None,
+    },
+    # Широкополосная речь с запасом битрейта – для уже сильно сжатых исходников
+    "speech_hq": {
+        "sample_rate": 16000, "bitrate": "32k", "application": "voip", "compression_level": 5,
+        "filters": "highpass=f=60",
+    },
+    # Широкополосная речь – основной профиль для записей уроков
+    "speech": {
+        "sample_rate": 16000, "bitrate": "24k", "application": "voip", "compression_level": 5,
+        "filters": "highpass=f=60",
+    },
+    # Минимальный размер для речи без музыки и шума
+    "speech_low": {
+        "sample_rate": 16000, "bitrate": "16k", "application": "voip", "compression_level": 5,
+        "filters": "highpass=f=60",
+    },
+    # Узкополосные исходники (телефония, 8 кГц): большая частота не добавит информации
+    "narrowband": {
+        "sample_rate": 8000, "bitrate": "12k", "application": "voip", "compression_level": 5,
+        "filters": "highpass=f=60",
+    },
+}
+# Профиль, если свойства исходной дорожки определить не удалось
+AUTO_FALLBACK_PROFILE = "speech"
+# Исходники с битрейтом ниже этого (бит/с) уже содержат артефакты сжатия и кодируются с запасом
+LOW_SOURCE_BITRATE = 48000
+
+
+def encoder_options(profile, filters=True):
+    """
+    Параметры ffmpeg для кодирования аудио в OggOpus (моно) по профилю profile.
+    filters=False – без цепочки фильтров профиля (аудио уже было ими обработано).
+    """
+    settings = PROFILES[profile]
+    options = []
+    if filters and settings["filters"]:
+        options += ["-af", settings["filters"]]
+    options += ["-c:a", "libopus", "-b:a", settings["bitrate"], "-application", settings["application"]]
+    if settings["compression_level"] is not None:
+        options += ["-compression_level", str(settings["compression_level"])]
+    if settings["sample_rate"]:
+        options += ["-ar", str(settings["sample_rate"])]
+    return options + ["-ac", "1"]  # Принудительное преобразование в моно
+
+
+def probe_audio(source, input_options=None):
+    """
+    Читает свойства первой аудиодорожки source с помощью ffprobe.
+    Возвращает {"codec", "sample_rate", "channels", "bit_rate"} (неизвестные значения – None)
+    или None, если дорожку найти не удалось.
+    """
+    command = ["ffprobe", "-v", "error"] + list(input_options or []) + [
+        "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name,sample_rate,channels,bit_rate",
+        "-of", "json", source,
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60)
+        streams = json.loads(result.stdout or "{}").get("streams") or []
+    except Exception as e:
+        logging.warning(f"Не удалось определить свойства аудио {source}: {e}")
+        return None
+    if not streams:
+        return None
+
+    def number(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    stream = streams[0]
+    return {
+        "codec": stream.get("codec_name"),
+        "sample_rate": number(stream.get("sample_rate")),
+        "channels": number(stream.get("channels")),
+        "bit_rate": number(stream.get("bit_rate")),
+    }
+
+
+def select_profile(stream):
+    """
+    Выбирает профиль по свойствам исходной дорожки (см. probe_audio):
+    узкополосные исходники (до 8 кГц) – narrowband, сильно сжатые – speech_hq,
+    остальные – speech.
+    """
+    if not stream:
+        return AUTO_FALLBACK_PROFILE
+    if stream["sample_rate"] and stream["sample_rate"] <= 8000:
+        return "narrowband"
+    if stream["bit_rate"] and stream["bit_rate"] < LOW_SOURCE_BITRATE:
+        return "speech_hq"
+    return "speech"
+
+
+def resolve_profile(source, input_options=None, setting=None):
+    """
+    Возвращает имя профиля для source: setting (по умолчанию AUDIO_PROFILE) или,
+    если он равен auto, профиль, выбранный по свойствам исходной дорожки.
+    """
+    setting = setting or AUDIO_PROFILE
+    if setting == "auto":
+        stream = probe_audio(source, input_options)
+        profile = select_profile(stream)
+        logging.info(f"Профиль кодирования для {source}: {profile} (исходная дорожка: {stream})")
+        return profile
+    if setting not in PROFILES:
+        logging.warning(f"Неизвестный профиль кодирования {setting}, используется legacy")
+        return "legacy"
+    return setting
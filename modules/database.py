@@ -1,42 +1,373 @@
+import os
 import json
+import time
+import sqlite3
 import logging
+import threading
+from collections.abc import Sequence
+from modules.search_index import SearchIndex
+from modules.utils import load_config
 
+config = load_config()
+
+# JSON-файл базы знаний: прежний формат хранения, теперь – файл совместимого экспорта.
+# Сами записи хранятся в SQLite рядом с ним (knowledge_base.db)
 DATABASE_FILE = "knowledge_base.json"
+# Сколько МБ файла базы отображается в память (mmap): записи читаются без копирования в кэш SQLite
+KNOWLEDGE_MMAP_SIZE = int(config.get("KNOWLEDGE_MMAP_MB", 256)) * 1024 ** 2
+# Размер страницы при последовательном чтении всех записей
+PAGE_SIZE = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    entry_key TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_version ON entries (version);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+_knowledge_bases = {}
+# Индекс для списка записей, переданного в search_knowledge_base напрямую: (список, индекс).
+# Список хранится вместе с индексом, чтобы его id не был переиспользован другим объектом
+_list_index = None
+
+
+def storage_path(filename: str = DATABASE_FILE) -> str:
+    """Путь к SQLite-хранилищу базы знаний рядом с JSON-файлом: knowledge_base.db."""
+    return os.path.splitext(filename)[0] + ".db"
+
+
+def index_path(filename: str = DATABASE_FILE) -> str:
+    """Путь к файлу поискового индекса рядом с базой знаний: knowledge_base.index.pickle."""
+    return os.path.splitext(filename)[0] + ".index.pickle"
+
+
+def entry_key(entry: dict):
+    """
+    Ключ записи для upsert: поле id, если оно есть, иначе текст вопроса.
+    None – у записи нет ни id, ни вопроса: такие записи не сопоставляются с существующими,
+    а получают ключ по номеру строки (positional_key).
+    """
+    key = entry.get("id")
+    if key is not None:
+        return str(key)
+    return entry.get("question") or None
+
+
+def positional_key(row_id: int) -> str:
+    """Ключ записи без собственного ключа (или с повторяющимся ключом) – по номеру строки хранилища."""
+    return f"#{row_id}"
 
 
-def load_knowledge_base(filename: str = DATABASE_FILE) -> list:
+def get_connection(db_file: str) -> sqlite3.Connection:
     """
-    Загружает базу знаний из JSON-файла.
+    Возвращает соединение с хранилищем базы знаний для текущего потока
+    (WAL, файл базы отображается в память на KNOWLEDGE_MMAP_SIZE байт).
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(db_file)
+    if connection is None:
+        connection = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(f"PRAGMA mmap_size={KNOWLEDGE_MMAP_SIZE}")
+        connections[db_file] = connection
+        with _init_lock:
+            if db_file not in _initialized:
+                connection.executescript(_SCHEMA)
+                _initialized.add(db_file)
+    return connection
+
+
+class KnowledgeBase(Sequence):
+    """
+    База знаний в SQLite с ленивым доступом: запись читается по номеру при обращении,
+    без разбора всей базы. Номер записи (0, 1, ...) не меняется при её обновлении,
+    новые записи получают следующие номера. Каждое изменение помечается версией,
+    по которой поисковый индекс догоняет изменения, сделанные после его сохранения.
+    """
+
+    def __init__(self, filename: str = DATABASE_FILE):
+        self.filename = filename
+        self.db_file = storage_path(filename)
+        self.index = None
+        self._lock = threading.RLock()
+
+    def _connection(self) -> sqlite3.Connection:
+        return get_connection(self.db_file)
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self))
+            if step != 1:
+                return [self[number] for number in range(start, stop, step)]
+            rows = self._connection().execute(
+                "SELECT data FROM entries WHERE id > ? AND id <= ? ORDER BY id", (start, stop))
+            return [json.loads(row["data"]) for row in rows]
+        if position < 0:
+            position += len(self)
+        row = self._connection().execute("SELECT data FROM entries WHERE id = ?", (position + 1,)).fetchone()
+        if row is None:
+            raise IndexError(f"Нет записи {position} в базе знаний")
+        return json.loads(row["data"])
+
+    def __iter__(self):
+        last_id = 0
+        while True:
+            rows = self._connection().execute(
+                "SELECT id, data FROM entries WHERE id > ? ORDER BY id LIMIT ?", (last_id, PAGE_SIZE)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield json.loads(row["data"])
+            last_id = rows[-1]["id"]
+
+    def version(self) -> int:
+        """Номер последнего изменения базы знаний (0 – база пуста)."""
+        return self._connection().execute("SELECT COALESCE(MAX(version), 0) FROM entries").fetchone()[0]
+
+    def upsert(self, entries) -> int:
+        """
+        Добавляет новые записи и обновляет существующие (по entry_key) одной транзакцией.
+        Неизменившиеся записи не перезаписываются. Загруженный поисковый индекс
+        обновляется только по изменённым записям. Возвращает число изменённых записей.
+        """
+        connection = self._connection()
+        changed = []
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                previous_version = self.version()
+                version = previous_version + 1
+                now = time.time()
+                for entry in entries:
+                    key = entry_key(entry)
+                    data = json.dumps(entry, ensure_ascii=False)
+                    row = None
+                    if key is not None:
+                        row = connection.execute("SELECT id, data FROM entries WHERE entry_key = ?",
+                                                 (key,)).fetchone()
+                    if row is None:
+                        row_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM entries").fetchone()[0]
+                        connection.execute(
+                            "INSERT INTO entries (id, entry_key, data, version, updated_at) VALUES (?, ?, ?, ?, ?)",
+                            (row_id, key if key is not None else positional_key(row_id), data, version, now))
+                        changed.append((row_id - 1, entry, None))
+                    elif row["data"] != data:
+                        connection.execute("UPDATE entries SET data = ?, version = ?, updated_at = ? WHERE id = ?",
+                                           (data, version, now, row["id"]))
+                        changed.append((row["id"] - 1, entry, json.loads(row["data"])))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            if self.index is not None and changed:
+                if self.index.fingerprint == previous_version:
+                    for doc_id, entry, old_entry in changed:
+                        self.index.update(doc_id, entry, old_entry)
+                    self.index.fingerprint = version
+                else:
+                    # База менялась другим процессом: индекс догонит изменения при следующем поиске
+                    self.index = None
+        return len(changed)
+
+    def replace(self, entries) -> int:
+        """
+        Заменяет содержимое базы знаний списком entries одной транзакцией: номер записи –
+        её позиция в списке. Записи без id и вопроса и повторы ключа не сливаются, а получают
+        ключ по номеру (positional_key), поэтому выгрузка совпадает с entries.
+        Поисковый индекс строится по записанным записям сразу после замены и сохраняется
+        с новой версией, поэтому следующий поиск (и другие процессы) его не перестраивают.
+        Возвращает число записей.
+        """
+        connection = self._connection()
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                version = self.version() + 1
+                now = time.time()
+                connection.execute("DELETE FROM entries")
+                used = set()
+                rows = []
+                index = SearchIndex()
+                for row_id, entry in enumerate(entries, start=1):
+                    key = entry_key(entry)
+                    if key is None or key in used:
+                        key = positional_key(row_id)
+                    used.add(key)
+                    rows.append((row_id, key, json.dumps(entry, ensure_ascii=False), version, now))
+                    index.add(entry)
+                connection.executemany(
+                    "INSERT INTO entries (id, entry_key, data, version, updated_at) VALUES (?, ?, ?, ?, ?)", rows)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            index.fingerprint = version
+            self.index = index
+            try:
+                index.save(index_path(self.filename))
+            except Exception as e:
+                logging.error(f"Ошибка сохранения поискового индекса: {e}")
+                if os.path.exists(index_path(self.filename)):
+                    os.remove(index_path(self.filename))
+        logging.info(f"Поисковый индекс базы знаний построен при замене: {len(index)} записей.")
+        return len(rows)
+
+    def search_index(self) -> SearchIndex:
+        """
+        Возвращает поисковый индекс базы знаний. Сохранённый индекс догоняет записи,
+        изменённые после его сохранения, и при изменениях сохраняется заново.
+        Если файла индекса нет или он устарел, индекс строится целиком.
+        """
+        with self._lock:
+            connection = self._connection()
+            connection.execute("BEGIN")
+            try:
+                version = self.version()
+                if self.index is not None and self.index.fingerprint == version:
+                    return self.index
+                index = self.index if self.index is not None else SearchIndex.load(index_path(self.filename))
+                # Индекс, в котором записей больше, чем в базе, построен до её замены другим процессом
+                if (index is None or not isinstance(index.fingerprint, int) or index.fingerprint > version
+                        or len(index) > len(self)):
+                    index = SearchIndex.build(self)
+                    logging.info(f"Поисковый индекс базы знаний построен: {len(index)} записей, "
+                                 f"{len(index.postings)} основ.")
+                else:
+                    rows = connection.execute("SELECT id, data FROM entries WHERE version > ? ORDER BY id",
+                                              (index.fingerprint,)).fetchall()
+                    if len(rows) > len(index) // 2:
+                        # Изменена большая часть базы (например, заменена другим процессом): построить заново быстрее
+                        index = SearchIndex.build(self)
+                        logging.info(f"Поисковый индекс базы знаний построен: {len(index)} записей.")
+                    else:
+                        for row in rows:
+                            index.update(row["id"] - 1, json.loads(row["data"]))
+                        if rows:
+                            logging.info(f"Поисковый индекс базы знаний обновлён: {len(rows)} изменённых записей.")
+            finally:
+                connection.execute("COMMIT")
+            if index.fingerprint != version:
+                index.fingerprint = version
+                try:
+                    index.save(index_path(self.filename))
+                except Exception as e:
+                    logging.error(f"Ошибка сохранения поискового индекса: {e}")
+            self.index = index
+            return index
+
+
+def _import_legacy_json(knowledge_base: KnowledgeBase) -> None:
+    """
+    Переносит записи из JSON-файла в пустое хранилище при первом открытии базы знаний.
+    Записи переносятся все и в прежнем порядке, включая повторы вопросов и записи без ключа.
+    """
+    if len(knowledge_base) or not os.path.exists(knowledge_base.filename):
+        return
+    with open(knowledge_base.filename, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    count = knowledge_base.replace(data)
+    logging.info(f"База знаний {knowledge_base.filename} перенесена в {knowledge_base.db_file}: {count} записей.")
+
+
+def open_knowledge_base(filename: str = DATABASE_FILE) -> KnowledgeBase:
+    """Возвращает общий для процесса объект базы знаний filename, открывая хранилище при первом обращении."""
+    with _init_lock:
+        knowledge_base = _knowledge_bases.get(filename)
+    if knowledge_base is None:
+        knowledge_base = KnowledgeBase(filename)
+        _import_legacy_json(knowledge_base)
+        with _init_lock:
+            knowledge_base = _knowledge_bases.setdefault(filename, knowledge_base)
+    return knowledge_base
+
+
+def load_knowledge_base(filename: str = DATABASE_FILE) -> Sequence:
+    """
+    Открывает базу знаний. Записи не загружаются целиком: возвращается последовательность,
+    читающая записи из хранилища по номеру и при итерации.
     """
     try:
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        knowledge_base = open_knowledge_base(filename)
         logging.info("База знаний успешно загружена.")
-        return data
+        return knowledge_base
     except Exception as e:
         logging.error(f"Ошибка загрузки базы знаний: {e}")
         return []
 
 
-def search_knowledge_base(query: str, data: list) -> list:
+def search_knowledge_base(query: str, data: Sequence, top_k: int = 10) -> list:
     """
-    Ищет в базе знаний записи, содержащие запрос в вопросе или ответе.
+    Ищет в базе знаний записи, наиболее подходящие к запросу (BM25 по основам слов
+    вопроса и ответа). Возвращает до top_k записей по убыванию релевантности.
+    Для базы из load_knowledge_base используется сохранённый индекс; для списка записей
+    индекс строится в памяти при первом поиске.
     """
-    results = []
-    query_lower = query.lower()
-    for entry in data:
-        if query_lower in entry.get("question", "").lower() or query_lower in entry.get("answer", "").lower():
-            results.append(entry)
-    return results
+    global _list_index
+    if isinstance(data, KnowledgeBase):
+        index = data.search_index()
+    elif _list_index is not None and _list_index[0] is data and len(_list_index[1]) == len(data):
+        index = _list_index[1]
+    else:
+        index = SearchIndex.build(data)
+        _list_index = (data, index)
+    return [data[doc_id] for doc_id, _ in index.search(query, top_k)]
 
 
 def update_knowledge_base(new_data: list, filename: str = DATABASE_FILE) -> None:
     """
     Обновляет (перезаписывает) базу знаний новым набором данных.
+    Чтобы добавить или изменить отдельные записи, не переписывая базу, используйте append_entry.
+    """
+    try:
+        count = open_knowledge_base(filename).replace(new_data)
+        logging.info(f"База знаний успешно обновлена: записей {count}.")
+    except Exception as e:
+        logging.error(f"Ошибка обновления базы знаний: {e}")
+
+
+def append_entry(entry: dict, filename: str = DATABASE_FILE) -> None:
+    """
+    Добавляет запись в базу знаний или обновляет существующую с тем же ключом (entry_key).
+    Остальные записи не перечитываются и не перезаписываются.
     """
     try:
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(new_data, f, ensure_ascii=False, indent=4)
-        logging.info("База знаний успешно обновлена.")
+        count = open_knowledge_base(filename).upsert([entry])
+        logging.info(f"База знаний успешно обновлена: изменено записей {count}.")
     except Exception as e:
         logging.error(f"Ошибка обновления базы знаний: {e}")
+
+
+def export_knowledge_base(json_filename: str = None, filename: str = DATABASE_FILE) -> None:
+    """
+    Выгружает базу знаний в JSON прежнего формата (список записей, indent=4),
+    по умолчанию – в сам filename. Записи пишутся потоково, через временный файл.
+    """
+    json_filename = json_filename or filename
+    temp_file = f"{json_filename}.tmp"
+    try:
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write("[")
+            count = 0
+            for entry in open_knowledge_base(filename):
+                f.write(",\n    " if count else "\n    ")
+                f.write(json.dumps(entry, ensure_ascii=False, indent=4).replace("\n", "\n    "))
+                count += 1
+            f.write("\n]" if count else "]")
+        os.replace(temp_file, json_filename)
+        logging.info(f"База знаний выгружена в {json_filename}: {count} записей.")
+    except Exception as e:
+        logging.error(f"Ошибка выгрузки базы знаний: {e}")
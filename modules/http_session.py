@@ -0,0 +1,70 @@
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from modules.utils import load_config
+
+config = load_config()
+
+# Повторы идемпотентных запросов (GET/HEAD) при сетевых ошибках и ответах 5xx
+HTTP_RETRIES = int(config.get("HTTP_RETRIES", 3))
+# Базовая пауза между повторами (сек), растёт экспоненциально: 0.5, 1, 2, ...
+HTTP_BACKOFF = float(config.get("HTTP_BACKOFF", 0.5))
+# Таймауты по умолчанию: установка соединения и ожидание данных (сек)
+HTTP_CONNECT_TIMEOUT = float(config.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(config.get("HTTP_READ_TIMEOUT", 120))
+# Ответы, после которых идемпотентный запрос повторяется. 429 сюда не входит:
+# лимиты SpeechKit соблюдаются token bucket в modules.rate_limit
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class _Session(requests.Session):
+    """Сессия с таймаутом по умолчанию для запросов, в которых он не указан явно."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+def create_session(pool_size, retries=HTTP_RETRIES):
+    """
+    Создаёт сессию с пулом keep-alive соединений на pool_size одновременных запросов
+    к каждому хосту и повторами GET/HEAD. POST не повторяется: повторная отправка
+    на распознавание означала бы повторную тарификацию.
+    """
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                  backoff_factor=HTTP_BACKOFF, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset({"GET", "HEAD"}),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size), max_retries=retry)
+    session = _Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(name, pool_size):
+    """
+    Возвращает общую для всех потоков процесса сессию name ("disk", "speechkit"),
+    создавая её при первом обращении. Пул соединений к каждому хосту рассчитан
+    на pool_size одновременных запросов; при большем числе потоков лишние соединения
+    не сохраняются в пуле, но запросы выполняются.
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            logging.debug(f"Создана HTTP-сессия {name} с пулом на {pool_size} соединений")
+            session = _sessions[name] = create_session(pool_size)
+        return session
+
+
+def reset_sessions():
+    """Закрывает все общие сессии; следующие вызовы get_session создадут их заново (с новым размером пула)."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+JOB_STORE_FILE = "jobs.db"
+
+# Устаревшие JSON-файлы состояния, которые переносятся в базу при первом запуске
+PROCESSED_FILES_RECORD = "processed_files.json"
+UPLOAD_ERRORS_FILE = "upload_errors.json"
+AUDIO_QUEUE_FILE = "audio_queue.json"
+
+# Состояния видео в конвейере
+DISCOVERED = "discovered"
+DOWNLOADED = "downloaded"
+UPLOADED = "uploaded"
+SUBMITTED = "submitted"
+RECOGNIZED = "recognized"
+FAILED = "failed"
+# Видео в этих состояниях не нужно скачивать и обрабатывать повторно
+PROCESSED_STATES = (UPLOADED, SUBMITTED, RECOGNIZED)
+
+# Поля задания, которые можно обновлять вместе с состоянием
+JOB_FIELDS = ("transcript_name", "public_url", "audio_duration", "local_audio",
+              "operation_id", "error_stage", "error", "content_hash", "duplicate_of", "transcript",
+              "segments", "offset_map")
+
+# Колонки, добавленные после первой версии схемы: создаются в существующих базах при открытии
+_ADDED_COLUMNS = {
+    "content_hash": "TEXT",
+    "duplicate_of": "TEXT",
+    "transcript": "TEXT",
+    "segments": "TEXT",
+    "offset_map": "TEXT",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    file_path TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    transcript_name TEXT,
+    public_url TEXT,
+    audio_duration REAL,
+    local_audio TEXT,
+    operation_id TEXT,
+    error_stage TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, updated_at);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_content_hash ON jobs (content_hash);
+CREATE INDEX IF NOT EXISTS jobs_duplicate_of ON jobs (duplicate_of);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def get_connection(db_file=JOB_STORE_FILE):
+    """
+    Возвращает соединение с базой заданий для текущего потока.
+    База работает в режиме WAL: читатели не блокируют писателя, а каждое изменение –
+    отдельная короткая транзакция над одной строкой.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(db_file)
+    if connection is None:
+        connection = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connections[db_file] = connection
+        with _init_lock:
+            if db_file not in _initialized:
+                connection.executescript(_SCHEMA)
+                _add_missing_columns(connection)
+                connection.executescript(_INDEXES)
+                _migrate_json_files(connection)
+                _initialized.add(db_file)
+    return connection
+
+
+def _add_missing_columns(connection):
+    existing = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+    for column, column_type in _ADDED_COLUMNS.items():
+        if column not in existing:
+            connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+
+def _read_legacy_json(filename, default):
+    if not os.path.exists(filename):
+        return default
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"Ошибка чтения {filename} при переносе в базу заданий: {e}")
+        return default
+
+
+def _migrate_json_files(connection):
+    """
+    Переносит processed_files.json, audio_queue.json и upload_errors.json в базу заданий.
+    После переноса файлы переименовываются в *.migrated, чтобы не импортироваться повторно.
+    """
+    processed = _read_legacy_json(PROCESSED_FILES_RECORD, {})
+    audio_queue = _read_legacy_json(AUDIO_QUEUE_FILE, [])
+    upload_errors = _read_legacy_json(UPLOAD_ERRORS_FILE, [])
+    if not (processed or audio_queue or upload_errors):
+        return
+
+    now = time.time()
+    queued_paths = {item.get("file_path") for item in audio_queue}
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for file_path in processed:
+            # Обработанные видео, которых нет в очереди, уже распознаны
+            if file_path not in queued_paths:
+                connection.execute(
+                    "INSERT OR IGNORE INTO jobs (file_path, state, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (file_path, RECOGNIZED, now, now))
+        for item in audio_queue:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (file_path, state, transcript_name, public_url, audio_duration,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item.get("file_path"), UPLOADED, item.get("transcript_name"), item.get("public_url"),
+                 item.get("audio_duration"), now, now))
+        for item in upload_errors:
+            connection.execute(
+                "INSERT OR IGNORE INTO jobs (file_path, state, local_audio, audio_duration, error_stage,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, 'upload', ?, ?)",
+                (item.get("file_path"), FAILED, item.get("local_audio"), item.get("audio_duration"),
+                 item.get("timestamp", now), now))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+    for filename in (PROCESSED_FILES_RECORD, AUDIO_QUEUE_FILE, UPLOAD_ERRORS_FILE):
+        if os.path.exists(filename):
+            os.replace(filename, f"{filename}.migrated")
+    logging.info(f"Состояние перенесено в базу заданий: обработано {len(processed)}, "
+                 f"в очереди {len(audio_queue)}, ошибок загрузки {len(upload_errors)}.")
+
+
+def get_job(file_path):
+    """Возвращает задание по пути видео на Диске (dict) или None."""
+    row = get_connection().execute("SELECT * FROM jobs WHERE file_path = ?", (file_path,)).fetchone()
+    return dict(row) if row else None
+
+
+def is_processed(file_path) -> bool:
+    """Проверяет, загружено ли аудио видео в хранилище (или уже распознано)."""
+    job = get_job(file_path)
+    return bool(job) and job["state"] in PROCESSED_STATES
+
+
+def set_state(file_path, state, **fields) -> None:
+    """
+    Переводит задание в состояние state и обновляет переданные поля.
+    Если задания ещё нет, оно создаётся. Обновляется только одна строка.
+    Если задание завершилось ошибкой, ожидавшие его копии (duplicate_of) отвязываются
+    и переводятся в failed, чтобы при следующем сканировании обработаться самостоятельно.
+    """
+    unknown = set(fields) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"Неизвестные поля задания: {unknown}")
+    now = time.time()
+    columns = ["state"] + list(fields)
+    values = [state] + list(fields.values())
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+    attempts = ", attempts = attempts + 1" if state == FAILED else ""
+    get_connection().execute(
+        f"INSERT INTO jobs (file_path, {', '.join(columns)}, created_at, updated_at) "
+        f"VALUES (?, {', '.join('?' for _ in columns)}, ?, ?) "
+        f"ON CONFLICT(file_path) DO UPDATE SET {updates}, updated_at = excluded.updated_at{attempts}",
+        [file_path] + values + [now, now])
+    if state == FAILED:
+        get_connection().execute(
+            "UPDATE jobs SET state = ?, error_stage = 'duplicate', duplicate_of = NULL, updated_at = ? "
+            "WHERE duplicate_of = ? AND state != ?",
+            (FAILED, now, file_path, RECOGNIZED))
+
+
+def claim_job(file_path, from_states, to_state, **fields) -> bool:
+    """
+    Атомарно переводит задание из одного из from_states в to_state.
+    Возвращает False, если задание уже в другом состоянии (например, его забрал другой поток).
+    """
+    now = time.time()
+    assignments = "".join(f", {column} = ?" for column in fields)
+    cursor = get_connection().execute(
+        f"UPDATE jobs SET state = ?, updated_at = ?{assignments} "
+        f"WHERE file_path = ? AND state IN ({', '.join('?' for _ in from_states)})",
+        [to_state, now] + list(fields.values()) + [file_path] + list(from_states))
+    return cursor.rowcount == 1
+
+
+def list_jobs(state, error_stage=None) -> list:
+    """Возвращает задания в состоянии state (для FAILED можно отфильтровать по стадии ошибки)."""
+    query = "SELECT * FROM jobs WHERE state = ?"
+    params = [state]
+    if error_stage is not None:
+        query += " AND error_stage = ?"
+        params.append(error_stage)
+    return [dict(row) for row in get_connection().execute(query + " ORDER BY updated_at", params)]
+
+
+def iter_jobs(state, page_size=500):
+    """
+    Перебирает задания в состоянии state страницами по page_size (самые старые первыми),
+    не загружая их все в память. Страницы выбираются по ключу (updated_at, file_path),
+    поэтому задания, сменившие состояние во время перебора, не сдвигают следующие страницы.
+    """
+    last = (-1.0, "")
+    while True:
+        rows = get_connection().execute(
+            "SELECT * FROM jobs WHERE state = ? AND (updated_at, file_path) > (?, ?) "
+            "ORDER BY updated_at, file_path LIMIT ?", (state, last[0], last[1], page_size)).fetchall()
+        for row in rows:
+            yield dict(row)
+        if len(rows) < page_size:
+            return
+        last = (rows[-1]["updated_at"], rows[-1]["file_path"])
+
+
+def count_jobs(state) -> int:
+    """Возвращает число заданий в состоянии state."""
+    return get_connection().execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()[0]
+
+
+def find_by_content(content_hash, exclude_path=None):
+    """
+    Ищет задание с тем же содержимым (хэшем файла на Диске), которое уже распознано
+    или находится в обработке. Копии других заданий и задания с ошибкой не учитываются.
+    Распознанные задания возвращаются в первую очередь.
+    """
+    row = get_connection().execute(
+        "SELECT * FROM jobs WHERE content_hash = ? AND file_path != ? AND duplicate_of IS NULL "
+        "AND state != ? AND NOT (state = ? AND transcript IS NULL) "
+        "ORDER BY state = ? DESC, created_at LIMIT 1",
+        (content_hash, exclude_path or "", FAILED, RECOGNIZED, RECOGNIZED)).fetchone()
+    return dict(row) if row else None
+
+
+def list_duplicates(file_path) -> list:
+    """Возвращает задания-копии, ожидающие результата задания file_path."""
+    return [dict(row) for row in get_connection().execute(
+        "SELECT * FROM jobs WHERE duplicate_of = ? ORDER BY created_at", (file_path,))]
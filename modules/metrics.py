@@ -0,0 +1,232 @@
+"""
+Метрики сервиса в текстовом формате Prometheus.
+
+Счётчики и гистограммы этапов обработки видео (stage_timer, observe_stage), число занятых
+потоков стадий конвейера и датчики, значения которых читаются в момент запроса
+(глубина очереди распознавания, операции в SpeechKit). Процесс main.py отдаёт их
+по HTTP на METRICS_HOST:METRICS_PORT (/metrics), см. start_metrics_server.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.utils import load_config
+
+config = load_config()
+# Адрес HTTP-эндпоинта метрик; METRICS_PORT=0 отключает эндпоинт
+METRICS_HOST = config.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(config.get("METRICS_PORT", 9108))
+
+# Границы гистограмм длительности (сек): от HTTP-запросов до многочасового ожидания распознавания
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 10800)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Пары (суффикс имени и метки, значение) для вывода."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix} {_format_value(value)}" for suffix, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счётчик."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(_format_labels(self.labelnames, key), value) for key, value in values]
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение. Значение задаётся set/inc/dec либо функцией (set_function),
+    которая вызывается при каждом запросе метрик.
+    """
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        self.set(func, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        samples = []
+        for key, value in values:
+            if callable(value):
+                try:
+                    value = value()
+                except Exception as e:
+                    logging.error(f"Ошибка вычисления метрики {self.name}: {e}")
+                    continue
+            samples.append((_format_labels(self.labelnames, key), value))
+        return samples
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (_bucket), их сумма (_sum) и число (_count)."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            state["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            state["sum"] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(state["counts"]), state["sum"]) for key, state in self._values.items())
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])}",
+                                cumulative))
+            samples.append((f"_sum{_format_labels(self.labelnames, key)}", total))
+            samples.append((f"_count{_format_labels(self.labelnames, key)}", cumulative))
+        return samples
+
+
+STAGE_CALLS = Counter("pipeline_stage_calls_total",
+                      "Число выполнений этапа обработки видео по результату (ok, error).", ("stage", "outcome"))
+STAGE_DURATION = Histogram("pipeline_stage_duration_seconds",
+                           "Длительность этапа обработки видео, сек.", ("stage",))
+STAGE_WORKERS = Gauge("pipeline_stage_workers", "Число потоков стадии конвейера.", ("stage",))
+BUSY_WORKERS = Gauge("pipeline_busy_workers", "Число потоков стадии конвейера, занятых заданием.", ("stage",))
+QUEUE_DEPTH = Gauge("queue_depth", "Число элементов в очереди.", ("queue",))
+QUEUE_HIGH_WATER_MARK = Gauge("queue_high_water_mark", "Наибольшее число элементов в очереди с запуска.",
+                              ("queue",))
+RECOGNITION_OPERATIONS = Gauge("recognition_operations",
+                               "Операции распознавания: занятые слоты (active) и ожидающие опроса (pending).",
+                               ("state",))
+
+
+def observe_stage(stage, seconds, ok=True):
+    """Учитывает одно выполнение этапа stage длительностью seconds."""
+    STAGE_CALLS.inc(stage=stage, outcome="ok" if ok else "error")
+    STAGE_DURATION.observe(seconds, stage=stage)
+
+
+def stage_timer(stage):
+    """
+    Декоратор этапа обработки: учитывает длительность и результат каждого вызова.
+    Вызов считается ошибкой, если функция бросила исключение или вернула None/False
+    (так функции этапов сообщают о неудаче).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = result is not None and result is not False
+                return result
+            finally:
+                observe_stage(stage, time.perf_counter() - start, ok)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Запускает HTTP-эндпоинт метрик в фоновом потоке. Возвращает сервер или None,
+    если эндпоинт отключён (port=0) или порт занят.
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Не удалось запустить эндпоинт метрик на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Метрики доступны по адресу http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,99 @@
+"""
+Длительность OggOpus-файла без запуска ffprobe.
+
+Длительность Opus-потока в Ogg определяется позицией гранулы (granule position)
+последней страницы потока за вычетом pre-skip из заголовка OpusHead; гранула
+считается в отсчётах 48 кГц независимо от исходной частоты записи.
+Читается только первая страница (заголовок OpusHead) и хвост файла.
+"""
+import os
+import struct
+import logging
+
+# Частота, в которой считаются гранулы Opus
+OPUS_GRANULE_RATE = 48000
+# Максимальный размер страницы Ogg: заголовок 27 байт, 255 сегментов по 255 байт и их таблица
+MAX_PAGE_SIZE = 27 + 255 + 255 * 255
+# Сколько байт читается с начала файла для заголовка OpusHead
+HEAD_SIZE = 4096
+
+_CAPTURE = b"OggS"
+_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def ogg_crc(data: bytes) -> int:
+    """Контрольная сумма страницы Ogg (CRC-32, полином 0x04C11DB7, без отражения битов)."""
+    crc = 0
+    table = _CRC_TABLE
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ byte]
+    return crc
+
+
+def parse_page(data: bytes, offset: int = 0):
+    """
+    Разбирает страницу Ogg, начинающуюся в data[offset:], и проверяет её контрольную сумму.
+    Возвращает (позиция гранулы, серийный номер, данные страницы) или None, если страница
+    неполная или повреждена.
+    """
+    if len(data) - offset < _PAGE_HEADER.size:
+        return None
+    capture, version, _, granule, serial, _, crc, segments = _PAGE_HEADER.unpack_from(data, offset)
+    if capture != _CAPTURE or version != 0:
+        return None
+    header_size = _PAGE_HEADER.size + segments
+    if len(data) - offset < header_size:
+        return None
+    body_size = sum(data[offset + _PAGE_HEADER.size:offset + header_size])
+    end = offset + header_size + body_size
+    if end > len(data):
+        return None
+    page = bytearray(data[offset:end])
+    page[22:26] = b"\x00\x00\x00\x00"
+    if ogg_crc(page) != crc:
+        return None
+    return granule, serial, bytes(data[offset + header_size:end])
+
+
+def opus_duration(file_path):
+    """
+    Возвращает длительность OggOpus-файла в секундах или None, если файл не OggOpus
+    или его последняя страница не найдена (тогда длительность следует определить иначе).
+    """
+    try:
+        with open(file_path, "rb") as f:
+            first = parse_page(f.read(HEAD_SIZE))
+            if first is None or not first[2].startswith(b"OpusHead") or len(first[2]) < 19:
+                return None
+            _, serial, head = first
+            pre_skip = struct.unpack_from("<H", head, 10)[0]
+
+            size = os.fstat(f.fileno()).st_size
+            tail_start = max(0, size - MAX_PAGE_SIZE)
+            f.seek(tail_start)
+            tail = f.read()
+    except OSError as e:
+        logging.error(f"Ошибка чтения {file_path}: {e}")
+        return None
+
+    # Последняя целая страница потока с известной гранулой (-1 – на странице не заканчивается ни один пакет)
+    position = tail.rfind(_CAPTURE)
+    while position >= 0:
+        page = parse_page(tail, position)
+        if page is not None and page[1] == serial and page[0] >= 0:
+            return max(0, page[0] - pre_skip) / OPUS_GRANULE_RATE
+        position = tail.rfind(_CAPTURE, 0, position)
+    return None
@@ -0,0 +1,86 @@
+import logging
+import threading
+from queue import Queue
+
+from modules.metrics import BUSY_WORKERS, STAGE_WORKERS
+
+# Маркер завершения работы для потоков стадии
+_STOP = object()
+
+
+class MonitoredQueue(Queue):
+    """
+    Ограниченная очередь, запоминающая максимальное число элементов, которое в ней
+    одновременно находилось (high-water mark). Если значение держится у maxsize,
+    потребитель не успевает за производителями и те ждут на put().
+    """
+
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.high_water_mark = 0
+
+    def _put(self, item):
+        # Вызывается под внутренней блокировкой очереди
+        super()._put(item)
+        self.high_water_mark = max(self.high_water_mark, len(self.queue))
+
+
+def _stage_worker(name, func, in_queue, out_queue):
+    """
+    Рабочий поток стадии: берёт задания из входной очереди, обрабатывает их функцией стадии
+    и передаёт результат в следующую очередь. Если функция вернула None, задание
+    считается завершённым (или проваленным) и дальше не передаётся.
+    """
+    while True:
+        job = in_queue.get()
+        if job is _STOP:
+            break
+        BUSY_WORKERS.inc(stage=name)
+        try:
+            result = func(job)
+        except Exception as e:
+            logging.error(f"Исключение на стадии {name} для {job.get('file_path')}: {e}")
+            result = None
+        finally:
+            BUSY_WORKERS.dec(stage=name)
+        if result is not None and out_queue is not None:
+            out_queue.put(result)
+
+
+def run_stages(jobs, stages, queue_size=4):
+    """
+    Прогоняет задания через последовательность стадий, каждая из которых работает
+    в собственном пуле потоков. Стадии связаны ограниченными очередями, поэтому
+    быстрая стадия не может уйти далеко вперёд медленной (backpressure).
+
+    stages – список кортежей (name, func, workers). func принимает задание (dict)
+    и возвращает задание для следующей стадии либо None, если его нужно отбросить.
+
+    Функция блокируется, пока все задания не пройдут через все стадии.
+    """
+    queues = [Queue(maxsize=queue_size) for _ in stages]
+    pools = []
+    for index, (name, func, workers) in enumerate(stages):
+        out_queue = queues[index + 1] if index + 1 < len(queues) else None
+        threads = [
+            threading.Thread(target=_stage_worker,
+                             args=(name, func, queues[index], out_queue),
+                             name=f"{name}-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for thread in threads:
+            thread.start()
+        STAGE_WORKERS.inc(len(threads), stage=name)
+        pools.append(threads)
+
+    for job in jobs:
+        queues[0].put(job)
+
+    # Останавливаем стадии по очереди: следующая стадия получает маркеры только после того,
+    # как все потоки предыдущей завершились и передали ей свои результаты.
+    for (name, _, _), stage_queue, threads in zip(stages, queues, pools):
+        for _ in threads:
+            stage_queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+        STAGE_WORKERS.dec(len(threads), stage=name)
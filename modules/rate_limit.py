@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import weakref
+
+RATE_LIMITS_FILE = "rate_limits.json"
+# Как часто остаток токенов записывается в файл состояния (сек); пауза после 429 записывается сразу
+PERSIST_INTERVAL = 10
+
+# Общая блокировка файла состояния: в нём хранятся все лимиты процесса
+_state_lock = threading.Lock()
+# Лимиты процесса: их несохранённое состояние записывается при завершении (см. _save_all)
+_buckets = weakref.WeakSet()
+
+
+def _load_state(state_file):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Ошибка загрузки состояния лимитов {state_file}: {e}")
+        return {}
+
+
+class TokenBucket:
+    """
+    Потокобезопасный лимит запросов по алгоритму token bucket.
+
+    limit – допустимое число запросов за period секунд. Ёмкость корзины (burst) –
+    десятая часть лимита, а скорость пополнения рассчитана так, чтобы за любое окно
+    длиной period было выполнено не больше limit запросов.
+
+    Состояние (остаток токенов и пауза после HTTP 429) сохраняется в state_file,
+    поэтому перезапуск процесса не обнуляет уже израсходованный бюджет. Остаток токенов
+    записывается не чаще раза в PERSIST_INTERVAL секунд и при завершении процесса,
+    пауза после 429 – сразу.
+    """
+
+    def __init__(self, name, limit, period=3600, burst=None, state_file=RATE_LIMITS_FILE):
+        self.name = name
+        self.capacity = burst or max(1, limit // 10)
+        self.rate = max(limit - self.capacity, 1) / period
+        self.state_file = state_file
+        self._cond = threading.Condition()
+        now = time.time()
+        with _state_lock:
+            state = _load_state(state_file).get(name, {})
+        self._tokens = min(self.capacity, state.get("tokens", self.capacity))
+        self._updated = state.get("updated", now)
+        self._paused_until = state.get("paused_until", 0.0)
+        self._refill(now)
+        # Время последней записи и признак изменений, ещё не записанных в state_file
+        self._saved = now
+        self._dirty = False
+        _buckets.add(self)
+
+    def _refill(self, now):
+        # После паузы отсчёт пополнения начинается с момента её окончания
+        if now <= self._updated:
+            return
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_time(self, now, tokens):
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def _persist(self):
+        with _state_lock:
+            state = _load_state(self.state_file)
+            state[self.name] = {
+                "tokens": self._tokens,
+                "updated": self._updated,
+                "paused_until": self._paused_until,
+            }
+            temp_file = f"{self.state_file}.tmp"
+            try:
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(temp_file, self.state_file)
+            except Exception as e:
+                logging.error(f"Ошибка сохранения состояния лимитов {self.state_file}: {e}")
+        self._saved = time.time()
+        self._dirty = False
+
+    def _take(self, now, tokens):
+        # Файл состояния перезаписывается не на каждый запрос, а раз в PERSIST_INTERVAL
+        self._tokens -= tokens
+        self._dirty = True
+        if now - self._saved >= PERSIST_INTERVAL:
+            self._persist()
+
+    def save(self):
+        """Записывает несохранённое состояние лимита в state_file (вызывается при завершении процесса)."""
+        with self._cond:
+            if self._dirty:
+                self._persist()
+
+    def try_acquire(self, tokens=1):
+        """Забирает токены без ожидания. Возвращает False, если бюджет исчерпан или действует пауза."""
+        with self._cond:
+            now = time.time()
+            self._refill(now)
+            if self._wait_time(now, tokens) > 0:
+                return False
+            self._take(now, tokens)
+            return True
+
+    def acquire(self, tokens=1):
+        """Ждёт ровно столько, сколько нужно, чтобы запрос уложился в лимит, и забирает токены."""
+        with self._cond:
+            while True:
+                now = time.time()
+                self._refill(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    self._take(now, tokens)
+                    return
+                self._cond.wait(wait)
+
+    def pause(self, seconds):
+        """
+        Приостанавливает все запросы через этот лимит на seconds секунд (после HTTP 429).
+        Остаток токенов обнуляется, чтобы после паузы запросы возобновлялись постепенно.
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            self._persist()
+            self._cond.notify_all()
+        logging.warning(f"Лимит {self.name}: пауза всех запросов на {seconds:.0f} сек.")
+
+
+@atexit.register
+def _save_all():
+    for bucket in list(_buckets):
+        bucket.save()
@@ -0,0 +1,347 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+import requests
+from dotenv import load_dotenv
+from modules.utils import load_config
+from modules.rate_limit import TokenBucket
+from modules.http_session import get_session
+from modules.metrics import RECOGNITION_OPERATIONS
+
+load_dotenv()
+config = load_config()
+
+YANDEX_SPEECHKIT_API_KEY = os.environ.get("YANDEX_SPEECHKIT_API_KEY")
+SPEECHKIT_ASYNC_URL = config.get("SPEECHKIT_ASYNC_URL")
+SPEECHKIT_OPERATION_URL = config.get("SPEECHKIT_OPERATION_URL")
+LANGUAGE = config.get("LANGUAGE", "ru-RU")
+# Шаг общего расписания опроса и число потоков для HTTP-запросов статуса
+POLL_TICK = float(config.get("RECOGNITION_POLL_TICK", 5))
+POLL_WORKERS = int(config.get("RECOGNITION_POLL_WORKERS", 4))
+# Пауза всех запросов после ответа HTTP 429, если сервер не прислал Retry-After
+RATE_LIMIT_PAUSE = 3600
+# Квоты SpeechKit: запросов на распознавание и проверок статуса в час
+SPEECHKIT_SUBMIT_LIMIT = int(config.get("SPEECHKIT_SUBMIT_LIMIT", 500))
+SPEECHKIT_STATUS_LIMIT = int(config.get("SPEECHKIT_STATUS_LIMIT", 2500))
+
+# Общие для всех потоков процесса бюджеты запросов
+submit_limit = TokenBucket("speechkit_submit", SPEECHKIT_SUBMIT_LIMIT)
+status_limit = TokenBucket("speechkit_status", SPEECHKIT_STATUS_LIMIT)
+
+
+def _headers():
+    return {
+        "Authorization": f"Api-Key {YANDEX_SPEECHKIT_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def _session():
+    """
+    Общая сессия SpeechKit: keep-alive соединения на все потоки опроса статуса
+    и потоки, отправляющие запросы на распознавание.
+    """
+    return get_session("speechkit", POLL_WORKERS + 2)
+
+
+def _retry_after(response):
+    """Возвращает длительность паузы после HTTP 429 (из заголовка Retry-After, если он есть)."""
+    try:
+        return float(response.headers.get("Retry-After", RATE_LIMIT_PAUSE))
+    except ValueError:
+        return RATE_LIMIT_PAUSE
+
+
+def polling_schedule(model, audio_duration):
+    """
+    Определяет интервал опроса и максимальное время ожидания операции.
+    Если модель 'general' – используется динамический интервал ожидания,
+    если 'deferred-general' – фиксированный интервал опроса с максимальным временем ожидания 24 часа.
+    """
+    if model == "deferred-general":
+        # Фиксированный интервал опроса для отложенного режима
+        sleep_interval = 60  # опрашиваем раз в 60 сек
+        max_wait_time = 86400  # 24 часа в секундах
+    else:
+        # Динамический интервал: предполагается, что audio_duration/6 - ориентировочное время обработки
+        expected_processing_time = audio_duration / 6.0  # например, 60 сек аудио -> ~10 сек обработки
+        sleep_interval = max(10, expected_processing_time / 3.0)  # минимум 10 сек
+        max_wait_time = expected_processing_time * 10  # допускаем, что обработка займёт не более 10х ожидаемого времени
+    return sleep_interval, max_wait_time
+
+
+def submit_recognition(file_url, model):
+    """
+    Отправляет POST-запрос на асинхронное распознавание аудиофайла.
+    Возвращает идентификатор операции или None при ошибке.
+    """
+    payload = {
+        "config": {
+            "specification": {
+                "languageCode": LANGUAGE,
+                "model": model,
+                "rawResults": 'true'  # Флаг, указывающий, как писать числа
+            },                        # false (по умолчанию) — писать цифрами; true — писать прописью
+            "audioEncoding": "OGG_OPUS"
+        },
+        "audio": {
+            "uri": file_url
+        }
+    }
+    try:
+        while True:
+            # Ждём свободного места в бюджете запросов; после HTTP 429 ждут все вызывающие потоки
+            submit_limit.acquire()
+            response = _session().post(SPEECHKIT_ASYNC_URL, headers=_headers(), json=payload)
+            if response.status_code != 429:
+                break
+            logging.warning("Превышен лимит запросов на распознавание (HTTP 429).")
+            submit_limit.pause(_retry_after(response))
+        logging.debug(f"Ответ на запрос распознавания (POST): {response.text}")
+        if response.status_code != 200:
+            logging.error(f"Ошибка запроса асинхронного распознавания: {response.text}")
+            return None
+        operation = response.json()
+        operation_id = operation.get('id')
+        if not operation_id:
+            logging.error(f"Не получен идентификатор операции: {operation}")
+            return None
+        logging.info(f"Запущена операция распознавания, id: {operation_id}")
+        return operation_id
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Исключение при асинхронном распознавании: {e}")
+        return None
+
+
+def chunks_to_text(response):
+    """Склеивает текст лучших альтернатив из результата распознавания в одну строку."""
+    chunks = (response or {}).get("chunks", [])
+    return " ".join(
+        [chunk["alternatives"][0]["text"]
+         for chunk in chunks if chunk.get("alternatives")]
+    )
+
+
+def _shift_time(value, offset):
+    """Сдвигает время SpeechKit в формате "1.23s" на offset секунд."""
+    return f"{float(str(value).rstrip('s')) + offset:.3f}s"
+
+
+def merge_segment_responses(responses, offsets):
+    """
+    Склеивает результаты распознавания сегментов одной записи в один response.
+    Время слов (startTime/endTime) сдвигается на начало сегмента в исходной записи,
+    поэтому временные метки соответствуют исходному аудио.
+    """
+    chunks = []
+    for response, offset in zip(responses, offsets):
+        for chunk in (response or {}).get("chunks", []):
+            chunk = dict(chunk)
+            alternatives = []
+            for alternative in chunk.get("alternatives", []):
+                alternative = dict(alternative)
+                alternative["words"] = [
+                    dict(word, startTime=_shift_time(word["startTime"], offset),
+                         endTime=_shift_time(word["endTime"], offset))
+                    if "startTime" in word and "endTime" in word else word
+                    for word in alternative.get("words", [])
+                ]
+                alternatives.append(alternative)
+            chunk["alternatives"] = alternatives
+            chunks.append(chunk)
+    return {"chunks": chunks}
+
+
+class RecognitionPoller:
+    """
+    Единый опросчик операций SpeechKit.
+
+    Операции регистрируются по идентификатору и проверяются циклом asyncio в одном фоновом
+    потоке по общему расписанию: на каждом шаге (tick) опрашиваются только операции,
+    у которых наступило время следующей проверки, и не больше, чем позволяет бюджет
+    запросов статуса (status_limit). Если операций больше, чем бюджет, первыми
+    опрашиваются те, что ждут дольше. HTTP-запросы статуса выполняются
+    небольшим пулом потоков, поэтому тысячи ожидающих операций не занимают по потоку каждая.
+
+    Для каждой операции возвращается concurrent.futures.Future, который завершается
+    словарём response из результата операции или None при ошибке/таймауте.
+    Колбэки Future вызываются в потоках пула, а не в цикле событий.
+    """
+
+    def __init__(self, tick=POLL_TICK, workers=POLL_WORKERS):
+        self.tick = tick
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                               thread_name_prefix="speechkit-poll")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="speechkit-poller", daemon=True)
+        self._operations = {}
+        self._task = None
+
+    def start(self):
+        self._thread.start()
+        self._task = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+        return self
+
+    def stop(self):
+        """Останавливает опрос; незавершённые операции получают отмену."""
+        if self._task is not None:
+            self._task.cancel()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        for operation in self._operations.values():
+            operation["future"].cancel()
+        self._operations.clear()
+        self._executor.shutdown(wait=False)
+
+    @property
+    def pending_count(self):
+        return len(self._operations)
+
+    def register(self, operation_id, poll_interval, max_wait_time):
+        """Регистрирует операцию для опроса и возвращает Future с её результатом."""
+        now = time.time()
+        operation = {
+            "id": operation_id,
+            "future": concurrent.futures.Future(),
+            "interval": poll_interval,
+            "deadline": now + max_wait_time,
+            "next_poll": now + poll_interval,
+        }
+        self._loop.call_soon_threadsafe(self._operations.__setitem__, operation_id, operation)
+        return operation["future"]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = time.time()
+            for operation in list(self._operations.values()):
+                if now > operation["deadline"]:
+                    logging.error(f"Превышено максимальное время ожидания распознавания "
+                                  f"(операция {operation['id']}).")
+                    self._operations.pop(operation["id"])
+                    self._executor.submit(operation["future"].set_result, None)
+
+            # Опрашиваем дольше всех ожидающие операции, пока позволяет бюджет запросов статуса
+            due = sorted((operation for operation in self._operations.values() if operation["next_poll"] <= now),
+                         key=lambda operation: operation["next_poll"])
+            batch = []
+            for operation in due:
+                if not status_limit.try_acquire():
+                    break
+                batch.append(operation)
+
+            if batch:
+                outcomes = await asyncio.gather(
+                    *(loop.run_in_executor(self._executor, self._check, operation) for operation in batch),
+                    return_exceptions=True
+                )
+                for operation, outcome in zip(batch, outcomes):
+                    if isinstance(outcome, Exception):
+                        logging.error(f"Исключение при проверке операции {operation['id']}: {outcome}")
+                        outcome = "pending"
+                    if outcome == "done":
+                        self._operations.pop(operation["id"], None)
+                    elif outcome == "pending":
+                        operation["next_poll"] = time.time() + operation["interval"]
+                    # При "rate_limited" операция остаётся первой в очереди на опрос после паузы
+            await asyncio.sleep(self.tick)
+
+    def _check(self, operation):
+        """
+        Проверяет статус одной операции (выполняется в потоке пула).
+        Возвращает "done", "pending" или "rate_limited".
+        """
+        future = operation["future"]
+        op_response = _session().get(f"{SPEECHKIT_OPERATION_URL}/{operation['id']}", headers=_headers())
+        if op_response.status_code == 429:
+            logging.warning("Превышен лимит запросов на проверку статуса (HTTP 429).")
+            status_limit.pause(_retry_after(op_response))
+            return "rate_limited"
+        logging.debug(f"HTTP статус: {op_response.status_code}")
+        logging.debug(f"Ответ статуса: {op_response.text}")
+        if op_response.status_code != 200:
+            logging.error(f"Ошибка получения статуса (HTTP {op_response.status_code}): {op_response.text}")
+            return "pending"
+        op_data = op_response.json()
+        if not op_data.get("done"):
+            logging.debug(f"Операция {operation['id']} не завершена, ожидаем следующий опрос...")
+            return "pending"
+        if "error" in op_data:
+            logging.error(f"Ошибка распознавания: {op_data['error']}")
+            future.set_result(None)
+        elif "chunks" in op_data.get("response", {}):
+            future.set_result(op_data["response"])
+        else:
+            logging.error("Операция завершена, но результатов распознавания нет.")
+            future.set_result(None)
+        return "done"
+
+
+_poller = None
+_poller_lock = threading.Lock()
+RECOGNITION_OPERATIONS.set_function(lambda: _poller.pending_count if _poller is not None else 0, state="pending")
+
+
+def get_poller():
+    """Возвращает общий для процесса опросчик операций, запуская его при первом обращении."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = RecognitionPoller().start()
+        return _poller
+
+
+def track_operation(operation_id, audio_duration, model):
+    """
+    Регистрирует уже запущенную операцию распознавания в общем опросчике
+    (например, после перезапуска процесса). Возвращает Future с результатом операции.
+    """
+    poll_interval, max_wait_time = polling_schedule(model, audio_duration)
+    logging.info(f"Модель распознавания: {model}. Интервал опроса: {poll_interval:.1f} сек, "
+                 f"максимальное время ожидания: {max_wait_time:.1f} сек")
+    return get_poller().register(operation_id, poll_interval, max_wait_time)
+
+
+def submit_segments(segments, model):
+    """
+    Отправляет на распознавание все сегменты записи (список {"public_url", "offset", "duration"}).
+    Возвращает сегменты с добавленным operation_id или None, если хотя бы один не отправлен.
+    """
+    submitted = []
+    for segment in segments:
+        operation_id = submit_recognition(segment["public_url"], model)
+        if not operation_id:
+            logging.error(f"Не удалось отправить сегмент {segment['public_url']} на распознавание")
+            return None
+        submitted.append(dict(segment, operation_id=operation_id))
+    return submitted
+
+
+def track_segments(segments, model):
+    """
+    Регистрирует в опросчике операции всех сегментов записи (с operation_id).
+    Возвращает Future, который завершается склеенным результатом (см. merge_segment_responses)
+    после завершения всех сегментов или None, если хотя бы один сегмент не распознан.
+    """
+    combined = concurrent.futures.Future()
+    futures = [track_operation(segment["operation_id"], segment["duration"], model) for segment in segments]
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        responses = [future.result() for future in futures]
+        if all(responses):
+            combined.set_result(merge_segment_responses(responses, [segment["offset"] for segment in segments]))
+        else:
+            combined.set_result(None)
+
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
@@ -0,0 +1,214 @@
+import os
+import re
+import math
+import heapq
+import bisect
+import pickle
+import logging
+from array import array
+from functools import lru_cache
+from operator import itemgetter
+
+# Параметры ранжирования BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Слова вопроса учитываются с таким весом относительно слов ответа
+QUESTION_WEIGHT = 2
+# Версия формата файла индекса: при её изменении индекс перестраивается
+INDEX_VERSION = 1
+
+_WORD = re.compile(r"[а-яa-z0-9]+")
+_VOWELS = set("аеиоуыэюя")
+# Возвратные окончания снимаются первыми, затем – одно самое длинное подходящее окончание
+_REFLEXIVE = ("ся", "сь")
+_ENDINGS = sorted((
+    "иями", "ями", "ами", "иях", "иям", "ием", "ией",
+    "ого", "его", "ому", "ему", "ыми", "ими", "ешь", "ете", "ишь", "ила", "ило", "или",
+    "ала", "ало", "али", "ыла", "ыло", "ыли", "ать", "ять", "ить", "еть", "ует", "уют",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ей", "ую", "юю", "ом", "ем",
+    "ах", "ях", "ам", "ям", "ов", "ев", "ью", "ия", "ии", "ию", "ет", "ут", "ют", "ит",
+    "ат", "ят", "ть", "ла", "ло", "ли",
+    "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "й",
+), key=len, reverse=True)
+# Минимальная длина основы после отсечения окончания
+_MIN_STEM = 3
+
+STOP_WORDS = frozenset("""
+и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне
+было вот от меня еще нет о из ему теперь когда даже ну ли если уже или ни быть был него до вас
+нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их
+чем была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому этого
+какой совсем ним здесь этом один почти мой тем чтобы нее сейчас были куда зачем всех никогда
+можно при об хоть после над больше тот через эти нас про всего них какая много разве эту моя
+впрочем свою этой перед иногда чуть том нельзя такой им более всегда конечно всю между это
+""".split())
+
+
+@lru_cache(maxsize=200000)
+def stem(word):
+    """
+    Лёгкий стемминг русского слова: снимает возвратную частицу и одно окончание
+    (падежное, глагольное или прилагательного), оставляя основу не короче _MIN_STEM букв
+    и содержащую гласную. Например: "уроками" -> "урок", "отношениях" -> "отношен".
+    """
+    if len(word) <= _MIN_STEM or not word.isalpha():
+        return word
+    for ending in _REFLEXIVE:
+        if word.endswith(ending) and len(word) - len(ending) > _MIN_STEM:
+            word = word[:-len(ending)]
+            break
+    for ending in _ENDINGS:
+        if word.endswith(ending):
+            base = word[:-len(ending)]
+            if len(base) >= _MIN_STEM and _VOWELS.intersection(base):
+                return base
+    return word
+
+
+def tokenize(text):
+    """Разбивает текст на основы слов: нижний регистр, ё -> е, без стоп-слов."""
+    text = (text or "").lower().replace("ё", "е")
+    return [stem(word) for word in _WORD.findall(text) if word not in STOP_WORDS]
+
+
+def entry_terms(entry):
+    """Возвращает основы слов записи базы знаний (слова вопроса – с весом QUESTION_WEIGHT)."""
+    return tokenize(entry.get("question", "")) * QUESTION_WEIGHT + tokenize(entry.get("answer", ""))
+
+
+class SearchIndex:
+    """
+    Инвертированный индекс записей базы знаний с ранжированием BM25.
+
+    Для каждой основы слова хранится список (posting) номеров записей и числа вхождений
+    в компактных массивах array, поэтому индекс на сотни тысяч записей быстро
+    сохраняется и загружается через pickle. Номер записи – её индекс в списке базы знаний;
+    списки упорядочены по номеру, поэтому замена одной записи не требует перестройки индекса.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_lengths = array("I")
+        # Версия данных, по которой построен индекс (для проверки актуальности при загрузке)
+        self.fingerprint = None
+        self._norms = None
+
+    @classmethod
+    def build(cls, entries):
+        """Строит индекс по списку записей базы знаний."""
+        index = cls()
+        for entry in entries:
+            index.add(entry)
+        return index
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, entry):
+        """Добавляет запись в конец индекса и возвращает её номер."""
+        doc_id = len(self.doc_lengths)
+        self.doc_lengths.append(0)
+        self._index_terms(doc_id, entry_terms(entry))
+        return doc_id
+
+    def update(self, doc_id, entry, old_entry=None):
+        """
+        Заменяет запись doc_id новой версией entry (или добавляет, если doc_id = len(index)).
+        Если известна прежняя версия old_entry, затрагиваются только списки её слов,
+        иначе номер записи ищется во всех списках.
+        """
+        if doc_id == len(self.doc_lengths):
+            return self.add(entry)
+        self.remove(doc_id, old_entry)
+        self._index_terms(doc_id, entry_terms(entry))
+        return doc_id
+
+    def remove(self, doc_id, old_entry=None):
+        """Убирает запись doc_id из списков слов; её номер остаётся занятым (с нулевой длиной)."""
+        terms = set(entry_terms(old_entry)) if old_entry is not None else list(self.postings)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, counts = posting
+            position = bisect.bisect_left(docs, doc_id)
+            if position < len(docs) and docs[position] == doc_id:
+                del docs[position]
+                del counts[position]
+                if not docs:
+                    del self.postings[term]
+        self.doc_lengths[doc_id] = 0
+        self._norms = None
+
+    def _index_terms(self, doc_id, terms):
+        """Добавляет doc_id в списки слов terms; списки остаются упорядоченными по номеру записи."""
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("I"), array("H"))
+            docs, tfs = posting
+            if docs and docs[-1] > doc_id:
+                position = bisect.bisect_left(docs, doc_id)
+                docs.insert(position, doc_id)
+                tfs.insert(position, min(count, 0xFFFF))
+            else:
+                docs.append(doc_id)
+                tfs.append(min(count, 0xFFFF))
+        self.doc_lengths[doc_id] = len(terms)
+        self._norms = None
+
+    def _length_norms(self):
+        """Предвычисляет знаменатель BM25 k1 * (1 - b + b * dl / avgdl) для каждой записи."""
+        if self._norms is None:
+            average = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 1.0
+            average = average or 1.0
+            self._norms = array("d", (BM25_K1 * (1 - BM25_B + BM25_B * length / average)
+                                      for length in self.doc_lengths))
+        return self._norms
+
+    def search(self, query, top_k=10):
+        """Возвращает до top_k пар (номер записи, оценка BM25) по убыванию оценки."""
+        norms = self._length_norms()
+        total = len(self.doc_lengths)
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, counts = posting
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            weight = idf * (BM25_K1 + 1)
+            for doc_id, count in zip(docs, counts):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight * count / (count + norms[doc_id])
+        return heapq.nlargest(top_k, scores.items(), key=itemgetter(1))
+
+    def save(self, path):
+        """Сохраняет индекс в файл (атомарно: через временный файл и замену)."""
+        temp_file = f"{path}.tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump({"version": INDEX_VERSION, "fingerprint": self.fingerprint,
+                         "doc_lengths": self.doc_lengths, "postings": self.postings},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        """Загружает индекс из файла; возвращает None, если файла нет или формат устарел."""
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Ошибка чтения поискового индекса {path}: {e}")
+            return None
+        if state.get("version") != INDEX_VERSION:
+            return None
+        index = cls()
+        index.fingerprint = state["fingerprint"]
+        index.doc_lengths = state["doc_lengths"]
+        index.postings = state["postings"]
+        return index
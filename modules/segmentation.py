@@ -0,0 +1,124 @@
+import os
+import re
+import csv
+import glob
+import logging
+import subprocess
+from modules.utils import load_config
+
+config = load_config()
+
+# Целевая длина сегмента длинной записи (сек); 0 – записи не разбиваются
+SEGMENT_DURATION = float(config.get("SEGMENT_DURATION", 0))
+# Насколько далеко от целевой границы (сек) можно искать паузу для разреза
+SEGMENT_SEARCH_WINDOW = float(config.get("SEGMENT_SEARCH_WINDOW", 120))
+# Параметры фильтра silencedetect: уровень тишины и минимальная длина паузы (сек)
+SILENCE_NOISE = "-35dB"
+SILENCE_MIN_DURATION = 0.5
+
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+def detect_silences(audio_path):
+    """
+    Находит паузы в аудиофайле фильтром ffmpeg silencedetect.
+    Возвращает список интервалов (начало, конец) в секундах.
+    """
+    command = [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", audio_path,
+        "-af", f"silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_DURATION}",
+        "-f", "null", "-",
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        logging.error(f"ffmpeg ошибка поиска пауз в {audio_path}: {result.stderr[-2000:]}")
+        return []
+    silences = []
+    start = None
+    for line in result.stderr.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+
+def choose_split_points(duration, silences, segment_duration, window=SEGMENT_SEARCH_WINDOW):
+    """
+    Выбирает точки разреза записи длиной duration на сегменты около segment_duration секунд.
+    Каждая граница ставится в середину ближайшей к целевой точке паузы в пределах window;
+    если подходящей паузы нет, запись режется точно по целевой точке.
+    Последний сегмент не делается короче половины segment_duration.
+    """
+    points = []
+    previous = 0.0
+    while duration - previous > segment_duration * 1.5:
+        target = previous + segment_duration
+        candidates = [(start + end) / 2 for start, end in silences
+                      if abs((start + end) / 2 - target) <= window and (start + end) / 2 > previous]
+        point = min(candidates, key=lambda middle: abs(middle - target)) if candidates else target
+        points.append(point)
+        previous = point
+    return points
+
+
+def split_audio(audio_path, points):
+    """
+    Разрезает OggOpus-файл в точках points без перекодирования (segment muxer, -c copy).
+    Возвращает список сегментов {"path", "offset", "duration"} в порядке следования,
+    где offset – фактическое начало сегмента в исходной записи (сек), или None при ошибке.
+    """
+    stem = os.path.splitext(audio_path)[0]
+    segment_pattern = f"{stem}_part%03d.ogg"
+    segment_list = f"{stem}_parts.csv"
+    command = [
+        "ffmpeg", "-y", "-hide_banner", "-i", audio_path,
+        "-c", "copy", "-map", "0:a",
+        "-f", "segment", "-segment_times", ",".join(f"{point:.3f}" for point in points),
+        "-segment_list", segment_list, "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        segment_pattern,
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            logging.error(f"ffmpeg ошибка разбиения {audio_path} на сегменты: {result.stderr[-2000:]}")
+            for partial in glob.glob(f"{glob.escape(stem)}_part*.ogg"):
+                os.remove(partial)
+            return None
+        segments = []
+        with open(segment_list, "r", encoding="utf-8") as f:
+            for name, start, end in csv.reader(f):
+                segments.append({
+                    "path": os.path.join(os.path.dirname(audio_path), name),
+                    "offset": float(start),
+                    "duration": float(end) - float(start),
+                })
+        return segments
+    except Exception as e:
+        logging.error(f"Исключение при разбиении {audio_path} на сегменты: {e}")
+        return None
+    finally:
+        if os.path.exists(segment_list):
+            os.remove(segment_list)
+
+
+def segment_audio(audio_path, audio_duration, segment_duration=None):
+    """
+    Разбивает длинную запись на сегменты по паузам для параллельного распознавания.
+    Возвращает список сегментов (см. split_audio) или None, если запись короткая,
+    разбиение выключено (SEGMENT_DURATION = 0) или не удалось.
+    """
+    segment_duration = segment_duration or SEGMENT_DURATION
+    if not segment_duration or audio_duration <= segment_duration * 1.5:
+        return None
+    points = choose_split_points(audio_duration, detect_silences(audio_path), segment_duration)
+    segments = split_audio(audio_path, points)
+    if segments:
+        logging.info(f"Запись {audio_path} ({audio_duration:.0f} сек) разбита на {len(segments)} сегментов")
+    return segments
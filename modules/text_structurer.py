@@ -1,6 +1,9 @@
 import os
-import re
+import json
+import hashlib
 import logging
+import argparse
+from modules import transcript_store
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -8,40 +11,103 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Путь к Obsidian Vault – скрипт запускается в корне Vault.
 VAULT_ROOT = os.getcwd()
 
+# Файл состояния инкрементального режима: до какого байта обработан каждый исходный файл
+STATE_FILE = ".text_structurer_state.json"
+# Сколько первых байт исходного файла хэшируется, чтобы заметить его замену или усечение
+SIGNATURE_BYTES = 4096
+# Начало блока урока и маркер начала транскрипта (в байтах: файл читается без декодирования целиком)
+_LESSON_HEADER = "=== Файл:".encode("utf-8")
+_TRANSCRIPT_MARKER = "Распознанный текст:".encode("utf-8")
+# Манифест transcript_store (каталог – TRANSCRIPTS_DIR): тексты видео лежат в отдельных файлах рядом с ним
+MANIFEST_FILE = transcript_store.manifest_path()
 
-def read_file(filepath):
-    """Читает содержимое файла с кодировкой UTF-8."""
+
+def load_state(state_path):
+    """Читает состояние инкрементального режима ({путь исходного файла: {offset, signature}})."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        logging.error(f"Ошибка чтения файла {filepath}: {e}")
-        return ""
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logging.error(f"Ошибка чтения состояния {state_path}, файлы будут обработаны заново: {e}")
+        return {}
+
+
+def save_state(state_path, state):
+    """Атомарно сохраняет состояние инкрементального режима (через временный файл и os.replace)."""
+    temp_file = f"{state_path}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, state_path)
 
 
-def split_into_lessons(text):
+def file_signature(filepath, length):
     """
-    Разбивает текст на блоки-уроки по маркеру '=== Файл:'.
-    Возвращает список блоков (каждый блок – строка, содержащая заголовок и транскрипт).
+    Хэш первых length байт файла (не больше SIGNATURE_BYTES). Дописывание в конец его
+    не меняет, а замена или перезапись файла – меняет.
     """
-    lessons = re.split(r'\n=== Файл:', text)
-    lessons = [lesson.strip() for lesson in lessons if lesson.strip()]
-    logging.info(f"Найдено уроков: {len(lessons)}")
-    return lessons
+    with open(filepath, "rb") as f:
+        return hashlib.sha256(f.read(min(length, SIGNATURE_BYTES))).hexdigest()
 
 
-def extract_transcript(lesson_text):
+def _lesson_from_lines(header, lines):
     """
-    Извлекает текст после маркера 'Распознанный текст:'.
-    Если маркер не найден – возвращает пустую строку.
+    Собирает урок из строк одного блока (bytes): возвращает (заголовок, транскрипт).
+    Транскрипт – текст после маркера 'Распознанный текст:'; если маркера нет, он пустой.
     """
-    match = re.search(r'Распознанный текст:\s*(.*)', lesson_text, re.DOTALL)
-    if match:
-        transcript = match.group(1).strip()
-        return transcript
-    else:
-        logging.warning("Маркер 'Распознанный текст:' не найден в блоке урока.")
-        return ""
+    header_line = header.decode("utf-8", errors="replace").strip()
+    for index, line in enumerate(lines):
+        if line.startswith(_TRANSCRIPT_MARKER):
+            body = [line[len(_TRANSCRIPT_MARKER):]] + lines[index + 1:]
+            return header_line, b"".join(body).decode("utf-8", errors="replace").strip()
+    logging.warning("Маркер 'Распознанный текст:' не найден в блоке урока.")
+    return header_line, ""
+
+
+def iter_lessons(filepath, offset=0, include_incomplete=False):
+    """
+    Потоково читает файл транскрипций с байтового смещения offset и по одному выдаёт уроки
+    в виде (заголовок, транскрипт, смещение конца блока в байтах). В памяти одновременно
+    находится только текущий блок, поэтому потребление памяти не зависит от размера архива.
+
+    Блок считается дописанным, если за ним начинается следующий блок или файл заканчивается
+    пустой строкой. Недописанный последний блок пропускается, если не задан include_incomplete;
+    иначе он выдаётся со смещением своего начала, чтобы следующий запуск прочитал его снова.
+    """
+    with open(filepath, "rb") as f:
+        f.seek(offset)
+        position = offset
+        block_start = offset
+        header = None
+        lines = []
+        for line in f:
+            if line.startswith(_LESSON_HEADER):
+                if header is not None:
+                    yield _lesson_from_lines(header, lines) + (position,)
+                header, lines = line, []
+                block_start = position
+            elif header is not None:
+                lines.append(line)
+            position += len(line)
+        if header is not None:
+            if lines and lines[-1] == b"\n":
+                yield _lesson_from_lines(header, lines) + (position,)
+            elif include_incomplete:
+                yield _lesson_from_lines(header, lines) + (block_start,)
+
+
+def iter_manifest_lessons(manifest_path, offset=0):
+    """
+    Читает уроки по манифесту transcript_store: для каждой записи со смещением не меньше offset
+    открывается только файл этого урока. Выдаёт (заголовок, транскрипт, смещение конца блока);
+    смещения совпадают со смещениями в собранном из манифеста raw_transcript.txt.
+    """
+    directory = os.path.dirname(manifest_path)
+    for record in transcript_store.iter_manifest(offset, directory):
+        lesson_path = os.path.join(directory, record["file"])
+        for header_line, transcript, _ in iter_lessons(lesson_path, include_incomplete=True):
+            yield header_line, transcript, record["offset"] + record["size"]
 
 
 def remove_extension(filename):
@@ -144,10 +210,34 @@ def parse_file_path(header_line, source):
     return course, module, lesson
 
 
+def content_hash(data):
+    """Возвращает sha256 содержимого (bytes)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_if_changed(filepath, content):
+    """
+    Записывает content в файл, только если хэш нового содержимого отличается от хэша
+    существующего файла. Неизменённые файлы не перезаписываются и сохраняют mtime,
+    поэтому Obsidian не переиндексирует их. Возвращает True, если файл записан.
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(filepath, "rb") as f:
+            if content_hash(f.read()) == content_hash(data):
+                return False
+    except FileNotFoundError:
+        pass
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return True
+
+
 def create_markdown_file(course, module, lesson, transcript, importance):
     """
     Создает .md файл с YAML front matter для Obsidian.
     Файл сохраняется по пути: VAULT_ROOT/course/[module/]<lesson>.md
+    Если файл уже существует с тем же содержимым, он не перезаписывается.
     """
     # Формируем директорию для курса
     course_dir = os.path.join(VAULT_ROOT, course)
@@ -175,63 +265,115 @@ importance: "{importance}"
 {transcript}
 """
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(md_content)
-        logging.info(f"Создан файл: {filepath}")
+        if write_if_changed(filepath, md_content):
+            logging.info(f"Создан файл: {filepath}")
+        else:
+            logging.debug(f"Файл не изменился: {filepath}")
     except Exception as e:
         logging.error(f"Ошибка при создании файла {filepath}: {e}")
 
 
-def process_file(input_filepath, source, importance):
+def process_lesson(header_line, transcript, source, importance):
     """
-    Обрабатывает входной файл (raw_transcript.txt или recognized_texts.txt):
-    - Читает содержимое.
-    - Разбивает его на блоки-уроки.
-    - Для каждого блока:
-        * Извлекает заголовок (первая строка блока) как путь файла.
-        * Парсит путь для определения course, module и lesson.
-        * Извлекает транскрипт.
-        * Создает markdown файл в соответствующей директории.
+    Обрабатывает один урок:
+        * Парсит заголовок (путь файла) для определения course, module и lesson.
+        * Создает markdown файл с транскриптом в соответствующей директории.
     """
-    logging.info(f"Обработка файла {input_filepath} (source: {source}, importance: {importance})")
-    content = read_file(input_filepath)
-    if not content:
-        logging.error(f"Файл {input_filepath} пуст или не прочитан.")
+    if not transcript:
         return
+    course, module, lesson = parse_file_path(header_line, source)
+    # Если название урока не найдено, попробуем взять его из последнего сегмента заголовка
+    if lesson == "Unknown" or not lesson:
+        parts = header_line.split("/")
+        if parts:
+            lesson = remove_extension(parts[-1])
+    create_markdown_file(course, module, lesson, transcript, importance)
 
-    lessons = split_into_lessons(content)
-    for lesson_block in lessons:
-        lines = lesson_block.splitlines()
-        if not lines:
-            continue
-        header_line = lines[0]
-        transcript = extract_transcript(lesson_block)
-        if not transcript:
-            continue
-
-        course, module, lesson = parse_file_path(header_line, source)
-        # Если название урока не найдено, попробуем взять его из последнего сегмента заголовка
-        if lesson == "Unknown" or not lesson:
-            parts = header_line.split("/")
-            if parts:
-                lesson = remove_extension(parts[-1])
-        create_markdown_file(course, module, lesson, transcript, importance)
 
+def process_file(input_filepath, source, importance, state=None, incremental=True):
+    """
+    Обрабатывает входной файл (raw_transcript.txt или recognized_texts.txt):
+    уроки читаются потоково по одному (см. iter_lessons), и для каждого сразу
+    создаётся markdown файл (см. process_lesson).
 
-def main():
+    Если передан state, в нём сохраняется смещение (в байтах), до которого файл обработан.
+    При incremental=True читаются только уроки, дописанные после сохранённого смещения;
+    если файл был заменён или усечён, он обрабатывается с начала.
+    """
+    logging.info(f"Обработка файла {input_filepath} (source: {source}, importance: {importance})")
+    if not os.path.exists(input_filepath):
+        logging.error(f"Файл {input_filepath} не найден.")
+        return
+    offset = 0
+    saved = (state or {}).get(input_filepath)
+    if incremental and saved:
+        if (saved["offset"] <= os.path.getsize(input_filepath)
+                and file_signature(input_filepath, saved["offset"]) == saved["signature"]):
+            offset = saved["offset"]
+        else:
+            logging.info(f"Файл {input_filepath} изменён не дописыванием, обрабатывается с начала.")
+
+    count = 0
+    # Последний блок обрабатывается, даже если файл не заканчивается пустой строкой
+    # (write_if_changed не перезаписывает неизменённый урок), но сохранённое смещение
+    # остаётся перед ним, пока блок может дописываться
+    for header_line, transcript, end_offset in iter_lessons(input_filepath, offset, include_incomplete=True):
+        process_lesson(header_line, transcript, source, importance)
+        offset = end_offset
+        count += 1
+    logging.info(f"Обработано уроков: {count}")
+    if state is not None:
+        state[input_filepath] = {"offset": offset, "signature": file_signature(input_filepath, offset)}
+
+
+def process_manifest(manifest_path, source, importance, state, incremental=True, legacy_filepath=None):
+    """
+    Обрабатывает тексты видео по манифесту transcript_store. В state сохраняется смещение,
+    до которого уроки обработаны; манифест только дописывается, поэтому в инкрементальном
+    режиме читаются лишь файлы новых уроков. Если манифест ещё не обрабатывался, берётся
+    смещение legacy_filepath (raw_transcript.txt): при переносе в манифест смещения блоков сохраняются.
+    """
+    logging.info(f"Обработка манифеста {manifest_path} (source: {source}, importance: {importance})")
+    saved = state.get(manifest_path) or state.get(legacy_filepath) if incremental else None
+    offset = saved["offset"] if saved else 0
+    count = 0
+    for header_line, transcript, end_offset in iter_manifest_lessons(manifest_path, offset):
+        process_lesson(header_line, transcript, source, importance)
+        offset = end_offset
+        count += 1
+    logging.info(f"Обработано уроков: {count}")
+    state[manifest_path] = {"offset": offset}
+
+
+def main(incremental=True):
     """
     Основная функция:
-    - Обрабатывает файл raw_transcript.txt с актуальными данными (importance: high).
+    - Обрабатывает актуальные данные (importance: high): тексты видео по манифесту
+      transcript_store, а если его нет – файл raw_transcript.txt.
     - Обрабатывает файл recognized_texts.txt с архивными данными (importance: low).
     Все файлы создаются в текущей директории (корень Obsidian Vault).
+    В инкрементальном режиме (по умолчанию) обрабатываются только уроки, дописанные
+    с прошлого запуска (см. STATE_FILE); при incremental=False файлы читаются с начала.
+    В обоих режимах перезаписываются только изменившиеся .md файлы.
     """
     raw_transcript_path = "raw_transcript.txt"
     recognized_texts_path = "recognized_texts.txt"
+    state_path = os.path.join(VAULT_ROOT, STATE_FILE)
+    state = load_state(state_path)
 
-    process_file(raw_transcript_path, source="raw", importance="high")
-    process_file(recognized_texts_path, source="recognized", importance="low")
+    if os.path.exists(MANIFEST_FILE):
+        process_manifest(MANIFEST_FILE, source="raw", importance="high", state=state, incremental=incremental,
+                         legacy_filepath=raw_transcript_path)
+    else:
+        process_file(raw_transcript_path, source="raw", importance="high", state=state, incremental=incremental)
+    process_file(recognized_texts_path, source="recognized", importance="low", state=state,
+                 incremental=incremental)
+    save_state(state_path, state)
     logging.info("Обработка всех файлов завершена.")
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Экспорт транскрипций в Obsidian Vault")
+    parser.add_argument("--full", action="store_true",
+                        help="обработать исходные файлы целиком, а не только новые уроки")
+    main(incremental=not parser.parse_args().full)
@@ -0,0 +1,230 @@
+"""
+Управляемый запуск ffmpeg для извлечения аудио.
+
+ffmpeg запускается с -progress: отдельный поток читает его stderr построчно, отслеживает
+закодированное время и скорость кодирования и сохраняет только последние строки
+сообщений об ошибках. Если закодированное время не растёт FFMPEG_STALL_TIMEOUT секунд
+(битый файл, зависшее чтение по сети), процесс завершается принудительно. Пока читатель
+stdout занят (см. FfmpegJob.hold), ffmpeg ждёт его на записи в pipe, и это зависанием не считается.
+Приоритет процесса понижается до FFMPEG_NICE, чтобы кодирование не вытесняло
+остальные потоки сервиса.
+
+Число параллельных заданий извлечения (transcode_workers) и потоков ffmpeg на задание
+(ffmpeg_threads) по умолчанию подбираются по числу доступных ядер и свободному месту
+во временном каталоге.
+"""
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+from modules.utils import load_config
+
+config = load_config()
+
+# Число потоков ffmpeg на одно задание (декодирование и кодирование);
+# auto – доступные ядра делятся поровну между параллельными заданиями
+FFMPEG_THREADS = config.get("FFMPEG_THREADS", "auto")
+# Какую долю свободного места во временном каталоге могут занять видео, ожидающие извлечения аудио
+TEMP_SPACE_FRACTION = 0.8
+# Приоритет (nice) процессов ffmpeg относительно сервиса
+FFMPEG_NICE = int(config.get("FFMPEG_NICE", 10))
+# Через сколько секунд без роста закодированного времени ffmpeg считается зависшим
+FFMPEG_STALL_TIMEOUT = float(config.get("FFMPEG_STALL_TIMEOUT", 120))
+# Интервал записи прогресса кодирования в лог (сек)
+PROGRESS_LOG_INTERVAL = 10
+# Сколько последних строк сообщений ffmpeg сохраняется для лога ошибки
+STDERR_TAIL_LINES = 40
+# Ключи блоков -progress; остальные строки stderr – сообщения ffmpeg
+_PROGRESS_KEYS = {
+    "frame", "fps", "bitrate", "total_size", "out_time_us", "out_time_ms", "out_time",
+    "dup_frames", "drop_frames", "speed", "progress",
+}
+
+
+class FfmpegJob:
+    """
+    Процесс ffmpeg с отслеживанием прогресса. После wait() доступны: ok – ffmpeg завершился
+    успешно, encoded_seconds – длительность закодированного вывода (сек, None – ffmpeg её не сообщил),
+    speed – скорость кодирования относительно реального времени, stalled – процесс
+    был остановлен из-за зависания, error_output – последние строки сообщений ffmpeg.
+    Вывод ffmpeg (stdout) можно читать через атрибут stdout, если передан stdout=subprocess.PIPE;
+    ожидание читателя (например, медленной загрузки) оборачивается в hold().
+    """
+
+    def __init__(self, command, label=None, stdout=subprocess.DEVNULL, nice=FFMPEG_NICE,
+                 stall_timeout=FFMPEG_STALL_TIMEOUT):
+        # Прогресс выводится в stderr блоками key=value; статистика в одну строку не нужна
+        self.command = command[:1] + ["-hide_banner", "-nostdin", "-nostats", "-progress", "pipe:2"] + command[1:]
+        self.label = label or command[-1]
+        self.nice = nice
+        self.stall_timeout = stall_timeout
+        self._stdout = stdout
+        self.process = None
+        self.stdout = None
+        self.encoded_seconds = None
+        self.speed = None
+        self.stalled = False
+        self.ok = None
+        self._total_size = None
+        self._last_advance = None
+        # Сколько ожиданий читателя stdout сейчас идёт (см. hold)
+        self._holds = 0
+        self._stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        self._done = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdout=self._stdout, stderr=subprocess.PIPE)
+        self.stdout = self.process.stdout
+        if self.nice:
+            try:
+                os.setpriority(os.PRIO_PROCESS, self.process.pid, self.nice)
+            except (AttributeError, OSError) as e:
+                logging.warning(f"Не удалось понизить приоритет ffmpeg для {self.label}: {e}")
+        self._last_advance = time.monotonic()
+        self._threads = [
+            threading.Thread(target=self._read_stderr, name="ffmpeg-stderr", daemon=True),
+            threading.Thread(target=self._watch, name="ffmpeg-watchdog", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _read_stderr(self):
+        """Разбирает блоки -progress и сохраняет последние строки сообщений ffmpeg."""
+        last_report = time.monotonic()
+        for line in self.process.stderr:
+            line = line.decode("utf-8", errors="replace").rstrip()
+            key, separator, value = line.partition("=")
+            if not separator or key not in _PROGRESS_KEYS:
+                if line:
+                    self._stderr_tail.append(line)
+                continue
+            if key == "out_time_us" and value.lstrip("-").isdigit():
+                seconds = max(0, int(value)) / 1e6
+                if self.encoded_seconds is None or seconds > self.encoded_seconds:
+                    self.encoded_seconds = seconds
+                    self._last_advance = time.monotonic()
+            elif key == "total_size" and value.isdigit() and value != self._total_size:
+                # Рост вывода без роста времени (например, заголовки) тоже считается прогрессом
+                self._total_size = value
+                self._last_advance = time.monotonic()
+            elif key == "speed" and value.endswith("x"):
+                try:
+                    self.speed = float(value[:-1])
+                except ValueError:
+                    pass
+            elif key == "progress" and time.monotonic() - last_report >= PROGRESS_LOG_INTERVAL:
+                last_report = time.monotonic()
+                logging.info(f"Извлечение аудио {self.label}: закодировано {self.encoded_seconds or 0:.0f} сек, "
+                             f"скорость {self.speed or 0:.1f}x")
+
+    def _watch(self):
+        """Останавливает ffmpeg, если закодированное время не растёт stall_timeout секунд."""
+        while not self._done.wait(1):
+            if self.process.poll() is not None:
+                return
+            if self._holds:
+                continue
+            if self.stall_timeout and time.monotonic() - self._last_advance > self.stall_timeout:
+                logging.error(f"ffmpeg не продвигается {self.stall_timeout:.0f} сек, процесс остановлен: "
+                              f"{self.label} (закодировано {self.encoded_seconds or 0:.0f} сек)")
+                self.stalled = True
+                self.process.kill()
+                return
+
+    @contextmanager
+    def hold(self):
+        """
+        Приостанавливает отслеживание зависания, пока читатель stdout занят: ffmpeg в это время
+        стоит на записи в заполненный pipe. После выхода отсчёт stall_timeout начинается заново.
+        """
+        self._holds += 1
+        try:
+            yield
+        finally:
+            self._last_advance = time.monotonic()
+            self._holds -= 1
+
+    @property
+    def error_output(self) -> str:
+        return "\n".join(self._stderr_tail)
+
+    def wait(self) -> bool:
+        """Дожидается завершения ffmpeg. Возвращает True, если он завершился успешно и не был остановлен."""
+        returncode = self.process.wait()
+        self._done.set()
+        for thread in self._threads:
+            thread.join()
+        self.ok = returncode == 0 and not self.stalled
+        return self.ok
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.kill()
+        self.wait()
+        if self.stdout is not None:
+            self.stdout.close()
+        self.process.stderr.close()
+
+
+def run_ffmpeg(command, label=None, **options) -> FfmpegJob:
+    """Запускает ffmpeg (см. FfmpegJob) и дожидается его завершения."""
+    with FfmpegJob(command, label, **options) as job:
+        job.wait()
+    return job
+
+
+def available_cpus() -> int:
+    """Число ядер, доступных процессу (с учётом привязки к ядрам, например taskset или cgroup cpuset)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def transcode_workers(setting="auto", video_sizes=(), temp_dir=None, reserved=0) -> int:
+    """
+    Число одновременных заданий извлечения аудио. Явное значение setting возвращается как есть;
+    при auto – по одному заданию на доступное ядро (кодирование аудио почти не распараллеливается
+    внутри ffmpeg), но не больше, чем помещается во временный каталог: каждое задание держит
+    на диске скачанное видео, поэтому TEMP_SPACE_FRACTION свободного места делится на размер
+    самого большого видео из video_sizes, а reserved видео (в работе у других стадий) вычитаются.
+    """
+    if str(setting).lower() != "auto":
+        return max(1, int(setting))
+    workers = available_cpus()
+    largest = max(video_sizes, default=0)
+    if largest and temp_dir:
+        try:
+            free = shutil.disk_usage(temp_dir).free * TEMP_SPACE_FRACTION
+            workers = min(workers, int(free // largest) - reserved)
+        except OSError as e:
+            logging.warning(f"Не удалось определить свободное место в {temp_dir}: {e}")
+    return max(1, workers)
+
+
+def ffmpeg_threads(workers=1) -> int:
+    """Число потоков ffmpeg на задание при workers одновременных заданиях (FFMPEG_THREADS или доля ядер)."""
+    if str(FFMPEG_THREADS).lower() != "auto":
+        return int(FFMPEG_THREADS)
+    return max(1, available_cpus() // max(1, workers))
+
+
+def threads_options(threads=None) -> list:
+    """
+    Параметр ffmpeg, ограничивающий число потоков задания (по умолчанию ffmpeg_threads()).
+    При threads = 0 число потоков выбирает ffmpeg.
+    """
+    threads = ffmpeg_threads() if threads is None else threads
+    return ["-threads", str(threads)] if threads else []
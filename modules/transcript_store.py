@@ -0,0 +1,346 @@
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import logging
+import argparse
+import itertools
+import threading
+import pandas as pd
+from modules.utils import load_config
+
+config = load_config()
+
+# Каталог структурированных результатов распознавания: по два Parquet-файла на видео
+TRANSCRIPTS_DIR = config.get("TRANSCRIPTS_DIR", "transcripts")
+# Строк в группе строк Parquet: при чтении диапазона времени лишние группы пропускаются целиком
+ROW_GROUP_SIZE = 10000
+# Текстовая выгрузка в прежнем формате: собирается по манифесту из файлов отдельных видео
+RAW_TRANSCRIPT_FILE = "raw_transcript.txt"
+# Манифест – журнал только на дописывание: одна JSON-строка на сохранённый текст видео
+MANIFEST_FILE = "manifest.jsonl"
+# Сколько байт с конца манифеста читается, чтобы найти последнюю запись
+MANIFEST_TAIL_BYTES = 64 * 1024
+
+# Фрагменты (chunks) ответа SpeechKit с текстом лучшей альтернативы и слова этой альтернативы.
+# Время – в секундах от начала исходной записи, channel – channelTag, NaN – значения нет в ответе
+CHUNKS_SUFFIX = ".chunks.parquet"
+WORDS_SUFFIX = ".words.parquet"
+TEXT_SUFFIX = ".txt"
+CHUNK_COLUMNS = {"chunk": "int32", "channel": "int8", "start": "float64", "end": "float64",
+                 "confidence": "float64", "text": "object"}
+WORD_COLUMNS = {"chunk": "int32", "channel": "int8", "start": "float64", "end": "float64",
+                "confidence": "float64", "word": "object"}
+
+_UNSAFE = re.compile(r'[\\/:*?"<>|\s]+')
+_LEGACY_HEADER = "=== Файл:".encode("utf-8")
+_import_lock = threading.Lock()
+
+
+def transcript_stem(file_path, directory=None):
+    """
+    Путь к файлам результата видео без суффикса: <каталог>/<имя видео>-<хэш пути>.
+    Хэш пути различает одноимённые видео из разных уроков.
+    """
+    name = _UNSAFE.sub("_", os.path.splitext(os.path.basename(file_path))[0])[:80]
+    digest = hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory or TRANSCRIPTS_DIR, f"{name}-{digest}")
+
+
+def manifest_path(directory=None):
+    return os.path.join(directory or TRANSCRIPTS_DIR, MANIFEST_FILE)
+
+
+def _seconds(value):
+    """Переводит время SpeechKit ("1.23s" или число) в секунды; NaN, если времени нет."""
+    if value is None:
+        return float("nan")
+    return float(str(value).rstrip("s"))
+
+
+def _confidence(value):
+    return float("nan") if value is None else float(value)
+
+
+def response_to_frames(response):
+    """
+    Раскладывает ответ SpeechKit по двум таблицам: фрагменты (chunks) и слова.
+    Берётся лучшая альтернатива каждого фрагмента, как в chunks_to_text;
+    фрагменты без альтернатив пропускаются. Слова упорядочены по времени начала.
+    """
+    chunks = {column: [] for column in CHUNK_COLUMNS}
+    words = {column: [] for column in WORD_COLUMNS}
+    number = 0
+    for chunk in (response or {}).get("chunks", []):
+        if not chunk.get("alternatives"):
+            continue
+        best = chunk["alternatives"][0]
+        channel = int(chunk.get("channelTag", 1))
+        chunk_words = best.get("words", [])
+        for word in chunk_words:
+            words["chunk"].append(number)
+            words["channel"].append(channel)
+            words["start"].append(_seconds(word.get("startTime")))
+            words["end"].append(_seconds(word.get("endTime")))
+            words["confidence"].append(_confidence(word.get("confidence")))
+            words["word"].append(word.get("word", ""))
+        chunks["chunk"].append(number)
+        chunks["channel"].append(channel)
+        chunks["start"].append(_seconds(chunk_words[0].get("startTime")) if chunk_words else float("nan"))
+        chunks["end"].append(_seconds(chunk_words[-1].get("endTime")) if chunk_words else float("nan"))
+        chunks["confidence"].append(_confidence(best.get("confidence")))
+        chunks["text"].append(best.get("text", ""))
+        number += 1
+    chunks_frame = pd.DataFrame(chunks).astype(CHUNK_COLUMNS)
+    words_frame = pd.DataFrame(words).astype(WORD_COLUMNS)
+    words_frame = words_frame.sort_values("start", kind="stable", ignore_index=True)
+    return chunks_frame, words_frame
+
+
+def _write_parquet(frame, path):
+    """Записывает таблицу в Parquet атомарно: через временный файл и замену."""
+    temp_file = f"{path}.tmp"
+    frame.to_parquet(temp_file, index=False, compression="zstd", row_group_size=ROW_GROUP_SIZE)
+    os.replace(temp_file, path)
+
+
+def save_transcript(file_path, response, directory=None):
+    """
+    Сохраняет полный результат распознавания видео (время, канал и уверенность
+    каждого слова и фрагмента) в Parquet. Возвращает путь без суффикса или None при ошибке.
+    """
+    try:
+        stem = transcript_stem(file_path, directory)
+        chunks, words = response_to_frames(response)
+        os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+        _write_parquet(words, stem + WORDS_SUFFIX)
+        _write_parquet(chunks, stem + CHUNKS_SUFFIX)
+        logging.debug(f"Результат распознавания {file_path} сохранён: {len(chunks)} фрагментов, {len(words)} слов")
+        return stem
+    except Exception as e:
+        logging.error(f"Ошибка сохранения структурированного транскрипта для файла {file_path}: {e}")
+        return None
+
+
+def copy_transcript(source_path, target_path, recognized_text=None, directory=None):
+    """
+    Копирует сохранённый результат распознавания видео source_path для его копии target_path:
+    файлы Parquet и блок текста с записью в манифесте. Текст копии собирается из скопированных
+    фрагментов (transcript_text), поэтому выгрузка raw_transcript.txt совпадает с Parquet;
+    если структурированного результата нет, сохраняется recognized_text.
+    Возвращает запись манифеста копии или None.
+    """
+    source, target = transcript_stem(source_path, directory), transcript_stem(target_path, directory)
+    try:
+        for suffix in (WORDS_SUFFIX, CHUNKS_SUFFIX):
+            if os.path.exists(source + suffix):
+                shutil.copyfile(source + suffix, f"{target}{suffix}.tmp")
+                os.replace(f"{target}{suffix}.tmp", target + suffix)
+        if has_transcript(target_path, directory):
+            recognized_text = transcript_text(target_path, directory)
+    except Exception as e:
+        logging.error(f"Ошибка копирования структурированного транскрипта {source_path} -> {target_path}: {e}")
+    if recognized_text is None:
+        return None
+    return save_text(target_path, recognized_text, directory)
+
+
+def has_transcript(file_path, directory=None):
+    return os.path.exists(transcript_stem(file_path, directory) + CHUNKS_SUFFIX)
+
+
+def load_chunks(file_path, directory=None):
+    """Возвращает фрагменты распознанного текста видео в порядке следования."""
+    return pd.read_parquet(transcript_stem(file_path, directory) + CHUNKS_SUFFIX)
+
+
+def load_words(file_path, start=None, end=None, max_confidence=None, channel=None, directory=None):
+    """
+    Возвращает слова видео, пересекающиеся с интервалом [start, end) секунд,
+    с уверенностью не выше max_confidence и из канала channel (None – без условия).
+    Условия передаются в Parquet как фильтры, поэтому группы строк вне интервала не читаются.
+    """
+    filters = []
+    if start is not None:
+        filters.append(("end", ">", float(start)))
+    if end is not None:
+        filters.append(("start", "<", float(end)))
+    if max_confidence is not None:
+        filters.append(("confidence", "<=", float(max_confidence)))
+    if channel is not None:
+        filters.append(("channel", "==", int(channel)))
+    return pd.read_parquet(transcript_stem(file_path, directory) + WORDS_SUFFIX, filters=filters or None)
+
+
+def transcript_text(file_path, directory=None):
+    """Текст видео, склеенный из фрагментов так же, как chunks_to_text."""
+    return " ".join(load_chunks(file_path, directory)["text"])
+
+
+def _block(file_path, recognized_text):
+    """Блок текста видео в формате raw_transcript.txt (bytes)."""
+    return f"=== Файл: {file_path} ===\nРаспознанный текст:\n{recognized_text}\n\n".encode("utf-8")
+
+
+def _last_record(f):
+    """Возвращает последнюю запись открытого манифеста (или None, если он пуст)."""
+    end = f.seek(0, os.SEEK_END)
+    if not end:
+        return None
+    f.seek(max(0, end - MANIFEST_TAIL_BYTES))
+    line = f.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    return json.loads(line)
+
+
+def _append_manifest(file_path, name, data, manifest):
+    """
+    Дописывает в манифест запись о файле видео. Смещение записи – позиция её блока
+    в собранном raw_transcript.txt: конец предыдущей записи. Дописывание выполняется
+    под блокировкой файла манифеста (flock), поэтому смещения не пересекаются
+    и при записи из нескольких потоков или процессов.
+    """
+    with open(manifest, "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            last = _last_record(f)
+            record = {
+                "path": file_path,
+                "file": name,
+                "hash": f"sha256:{hashlib.sha256(data).hexdigest()}",
+                "offset": last["offset"] + last["size"] if last else 0,
+                "size": len(data),
+                "time": time.time(),
+            }
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return record
+
+
+def _write_block(file_path, data, directory=None, manifest=None):
+    """
+    Записывает блок текста видео в собственный файл (временный файл и os.replace) и
+    регистрирует его в манифесте. Имя файла включает хэш содержимого, поэтому повторное
+    распознавание того же видео не меняет файлы, на которые ссылаются прежние записи.
+    """
+    stem = transcript_stem(file_path, directory)
+    name = f"{os.path.basename(stem)}.{hashlib.sha256(data).hexdigest()[:12]}{TEXT_SUFFIX}"
+    path = os.path.join(os.path.dirname(stem), name)
+    temp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(data)
+    os.replace(temp_file, path)
+    return _append_manifest(file_path, name, data, manifest or manifest_path(directory))
+
+
+def _import_legacy_raw_transcript(directory=None):
+    """
+    Переносит блоки существующего raw_transcript.txt в отдельные файлы с записями в манифесте.
+    Выполняется один раз, пока манифеста нет; блоки переносятся байт в байт, поэтому
+    собранный из манифеста raw_transcript.txt совпадает с исходным.
+    """
+    manifest = manifest_path(directory)
+    if os.path.exists(manifest) or not os.path.exists(RAW_TRANSCRIPT_FILE):
+        return
+    with _import_lock:
+        if os.path.exists(manifest):
+            return
+        os.makedirs(os.path.dirname(manifest) or ".", exist_ok=True)
+        temp_manifest = f"{manifest}.import"
+        if os.path.exists(temp_manifest):
+            os.remove(temp_manifest)
+        count = 0
+        header, lines = None, []
+        with open(RAW_TRANSCRIPT_FILE, "rb") as f:
+            for line in itertools.chain(f, [None]):
+                if line is None or line.startswith(_LEGACY_HEADER):
+                    if header is not None:
+                        file_path = header[len(_LEGACY_HEADER):].decode("utf-8", errors="replace").strip(" =\n")
+                        _write_block(file_path, header + b"".join(lines), directory, temp_manifest)
+                        count += 1
+                    elif lines:
+                        logging.warning(f"Текст до первого блока в {RAW_TRANSCRIPT_FILE} не перенесён")
+                    header, lines = line, []
+                else:
+                    lines.append(line)
+        os.replace(temp_manifest, manifest)
+        logging.info(f"{RAW_TRANSCRIPT_FILE} перенесён в {manifest}: {count} блоков")
+
+
+def save_text(file_path, recognized_text, directory=None):
+    """
+    Сохраняет распознанный текст видео в отдельный файл и добавляет запись в манифест.
+    Возвращает запись манифеста или None при ошибке.
+    """
+    try:
+        _import_legacy_raw_transcript(directory)
+        os.makedirs(directory or TRANSCRIPTS_DIR, exist_ok=True)
+        return _write_block(file_path, _block(file_path, recognized_text), directory)
+    except Exception as e:
+        logging.error(f"Ошибка сохранения транскрипта для файла {file_path}: {e}")
+        return None
+
+
+def iter_manifest(offset=0, directory=None):
+    """
+    Выдаёт записи манифеста по порядку, начиная с записи со смещением offset
+    (смещение в собранном raw_transcript.txt). Недописанная последняя строка пропускается.
+    """
+    _import_legacy_raw_transcript(directory)
+    try:
+        with open(manifest_path(directory), "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    return
+                record = json.loads(line)
+                if record["offset"] >= offset:
+                    yield record
+    except FileNotFoundError:
+        return
+
+
+def read_text(record, directory=None):
+    """Возвращает распознанный текст из файла записи манифеста."""
+    with open(os.path.join(directory or TRANSCRIPTS_DIR, record["file"]), "rb") as f:
+        block = f.read().decode("utf-8")
+    body = block.split("Распознанный текст:\n", 1)[-1]
+    return body[:-2] if body.endswith("\n\n") else body
+
+
+def latest_text(file_path, directory=None):
+    """Последний сохранённый текст видео (по манифесту) или None."""
+    record = None
+    for candidate in iter_manifest(directory=directory):
+        if candidate["path"] == file_path:
+            record = candidate
+    return read_text(record, directory) if record else None
+
+
+def export_raw_transcript(output=RAW_TRANSCRIPT_FILE, directory=None):
+    """
+    Собирает raw_transcript.txt из файлов видео в порядке манифеста (потоково, через
+    временный файл). Блок каждой записи начинается в выгрузке с её смещения offset.
+    Возвращает число блоков.
+    """
+    directory = directory or TRANSCRIPTS_DIR
+    temp_file = f"{output}.tmp"
+    count = 0
+    with open(temp_file, "wb") as out:
+        for record in iter_manifest(directory=directory):
+            with open(os.path.join(directory, record["file"]), "rb") as f:
+                shutil.copyfileobj(f, out)
+            count += 1
+    os.replace(temp_file, output)
+    logging.info(f"Тексты {count} видео выгружены в {output}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка raw_transcript.txt из файлов транскрипций по манифесту")
+    parser.add_argument("--output", default=RAW_TRANSCRIPT_FILE)
+    args = parser.parse_args()
+    export_raw_transcript(args.output)
@@ -11,6 +11,9 @@ def load_config() -> dict:
     return {
         "YANDEX_DISK_OAUTH_TOKEN": os.environ.get("YANDEX_DISK_OAUTH_TOKEN"),
         "DISK_FOLDER_PATH": os.environ.get("DISK_FOLDER_PATH", "disk:/Настя Рыбка/Школа Насти Рыбки/1-я ступень"),
+        "DISK_API_URL": os.environ.get("DISK_API_URL", "https://cloud-api.yandex.net/v1/disk"),
+        "DISK_LISTING_MODE": os.environ.get("DISK_LISTING_MODE", "tree"),
+        "DISK_LIST_WORKERS": os.environ.get("DISK_LIST_WORKERS", "8"),
         "YANDEX_SPEECHKIT_API_KEY": os.environ.get("YANDEX_SPEECHKIT_API_KEY"),
         "RECOGNITION_MODEL": os.environ.get("RECOGNITION_MODEL", "general"),
         "YOBJECT_STORAGE_BUCKET": os.environ.get("YOBJECT_STORAGE_BUCKET", "video-to-text"),
@@ -18,5 +21,41 @@ def load_config() -> dict:
         "YOBJECT_STORAGE_SECRET_KEY": os.environ.get("YOBJECT_STORAGE_SECRET_KEY"),
         "YOBJECT_STORAGE_ENDPOINT": os.environ.get("YOBJECT_STORAGE_ENDPOINT", "https://storage.yandexcloud.net"),
         "SPEECHKIT_ASYNC_URL": os.environ.get("SPEECHKIT_ASYNC_URL", "https://transcribe.api.cloud.yandex.net/speech/stt/v2/longRunningRecognize"),
-        "LANGUAGE": os.environ.get("LANGUAGE", "ru-RU")
+        "SPEECHKIT_OPERATION_URL": os.environ.get("SPEECHKIT_OPERATION_URL", "https://operation.api.cloud.yandex.net/operations"),
+        "LANGUAGE": os.environ.get("LANGUAGE", "ru-RU"),
+        "RECOGNITION_POLL_TICK": os.environ.get("RECOGNITION_POLL_TICK", "5"),
+        "RECOGNITION_POLL_WORKERS": os.environ.get("RECOGNITION_POLL_WORKERS", "4"),
+        "SPEECHKIT_SUBMIT_LIMIT": os.environ.get("SPEECHKIT_SUBMIT_LIMIT", "500"),
+        "SPEECHKIT_STATUS_LIMIT": os.environ.get("SPEECHKIT_STATUS_LIMIT", "2500"),
+        "SEGMENT_DURATION": os.environ.get("SEGMENT_DURATION", "0"),
+        "SEGMENT_SEARCH_WINDOW": os.environ.get("SEGMENT_SEARCH_WINDOW", "120"),
+        "AUDIO_QUEUE_SIZE": os.environ.get("AUDIO_QUEUE_SIZE", "100"),
+        "MAX_ACTIVE_RECOGNITIONS": os.environ.get("MAX_ACTIVE_RECOGNITIONS", "200"),
+        "HTTP_RETRIES": os.environ.get("HTTP_RETRIES", "3"),
+        "HTTP_BACKOFF": os.environ.get("HTTP_BACKOFF", "0.5"),
+        "HTTP_CONNECT_TIMEOUT": os.environ.get("HTTP_CONNECT_TIMEOUT", "10"),
+        "HTTP_READ_TIMEOUT": os.environ.get("HTTP_READ_TIMEOUT", "120"),
+        "DOWNLOAD_WORKERS": os.environ.get("DOWNLOAD_WORKERS", "2"),
+        "DOWNLOAD_CONNECTIONS": os.environ.get("DOWNLOAD_CONNECTIONS", "4"),
+        "DOWNLOAD_CHUNK_MB": os.environ.get("DOWNLOAD_CHUNK_MB", "16"),
+        "TRANSCODE_WORKERS": os.environ.get("TRANSCODE_WORKERS", "auto"),
+        "UPLOAD_WORKERS": os.environ.get("UPLOAD_WORKERS", "2"),
+        "PIPELINE_QUEUE_SIZE": os.environ.get("PIPELINE_QUEUE_SIZE", "2"),
+        "STREAM_EXTRACTION": os.environ.get("STREAM_EXTRACTION", "true"),
+        "STREAM_UPLOAD": os.environ.get("STREAM_UPLOAD", "false"),
+        "S3_MULTIPART_THRESHOLD_MB": os.environ.get("S3_MULTIPART_THRESHOLD_MB", "8"),
+        "S3_MULTIPART_CHUNKSIZE_MB": os.environ.get("S3_MULTIPART_CHUNKSIZE_MB", "8"),
+        "S3_MAX_CONCURRENCY": os.environ.get("S3_MAX_CONCURRENCY", "8"),
+        "KNOWLEDGE_MMAP_MB": os.environ.get("KNOWLEDGE_MMAP_MB", "256"),
+        "TRANSCRIPTS_DIR": os.environ.get("TRANSCRIPTS_DIR", "transcripts"),
+        "FFMPEG_THREADS": os.environ.get("FFMPEG_THREADS", "auto"),
+        "FFMPEG_NICE": os.environ.get("FFMPEG_NICE", "10"),
+        "FFMPEG_STALL_TIMEOUT": os.environ.get("FFMPEG_STALL_TIMEOUT", "120"),
+        "AUDIO_PROFILE": os.environ.get("AUDIO_PROFILE", "legacy"),
+        "VAD_ENABLED": os.environ.get("VAD_ENABLED", "false"),
+        "VAD_MIN_SILENCE": os.environ.get("VAD_MIN_SILENCE", "3"),
+        "VAD_PADDING": os.environ.get("VAD_PADDING", "0.5"),
+        "VAD_MARGIN_DB": os.environ.get("VAD_MARGIN_DB", "10"),
+        "METRICS_HOST": os.environ.get("METRICS_HOST", "127.0.0.1"),
+        "METRICS_PORT": os.environ.get("METRICS_PORT", "9108")
     }
@@ -0,0 +1,241 @@
+"""
+Вырезание длинных пауз из аудио перед загрузкой на распознавание (VAD по энергии).
+
+SpeechKit тарифицирует длительность аудио, поэтому длинные паузы, перерывы
+и тишину в начале и в конце записи выгоднее не отправлять. Аудио декодируется в PCM,
+по кадрам FRAME_DURATION считается уровень сигнала (NumPy); кадры тише порога
+(уровень шума записи + VAD_MARGIN_DB) считаются паузой. Паузы длиннее VAD_MIN_SILENCE
+вырезаются, по краям речи остаётся VAD_PADDING секунд.
+
+Для каждого оставленного интервала сохраняется карта смещений
+[начало в обрезанном аудио, начало в исходном, длительность], по которой время слов
+из ответа SpeechKit переводится обратно во время исходного видео (restore_timestamps).
+Громкие фрагменты без речи (например, музыкальные заставки) по энергии не отличаются
+от речи и остаются в записи.
+"""
+import bisect
+import logging
+import subprocess
+
+import numpy as np
+
+from modules.utils import load_config
+from modules.audio_profiles import encoder_options, resolve_profile
+
+config = load_config()
+
+# Включает вырезание пауз перед загрузкой аудио (не применяется при STREAM_UPLOAD)
+VAD_ENABLED = config.get("VAD_ENABLED", "false").lower() == "true"
+# Паузы длиннее этого (сек) вырезаются
+VAD_MIN_SILENCE = float(config.get("VAD_MIN_SILENCE", 3))
+# Сколько секунд паузы остаётся до и после речи
+VAD_PADDING = float(config.get("VAD_PADDING", 0.5))
+# На сколько дБ кадр речи громче уровня шума записи
+VAD_MARGIN_DB = float(config.get("VAD_MARGIN_DB", 10))
+# Если вырезается меньше этой доли записи, аудио не перекодируется
+VAD_MIN_SAVING = 0.05
+
+# Частота анализа и длина кадра
+ANALYSIS_RATE = 16000
+FRAME_DURATION = 0.03
+# Уровень шума – этот перцентиль уровней кадров; кадры тише ABSOLUTE_FLOOR_DB всегда считаются паузой
+NOISE_PERCENTILE = 10
+ABSOLUTE_FLOOR_DB = -55.0
+# Частота PCM, в которой вырезаются интервалы (кодировщик приводит её к частоте профиля)
+OUTPUT_RATE = 48000
+# Размер блока чтения PCM (байт)
+READ_BLOCK = 1024 ** 2
+
+
+def _decode_command(audio_path, rate):
+    return ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", audio_path,
+            "-f", "s16le", "-ac", "1", "-ar", str(rate), "pipe:1"]
+
+
+def frame_levels(audio_path):
+    """
+    Декодирует аудио в PCM 16 кГц и возвращает уровень каждого кадра FRAME_DURATION в дБ
+    относительно полной шкалы (массив NumPy) или None при ошибке ffmpeg.
+    PCM читается блоками, поэтому память не зависит от длины записи.
+    """
+    frame_bytes = int(ANALYSIS_RATE * FRAME_DURATION) * 2
+    block_size = READ_BLOCK // frame_bytes * frame_bytes
+    levels = []
+    rest = b""
+    with subprocess.Popen(_decode_command(audio_path, ANALYSIS_RATE), stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL) as process:
+        while True:
+            block = process.stdout.read(block_size)
+            if not block:
+                break
+            data = rest + block
+            usable = len(data) // frame_bytes * frame_bytes
+            rest = data[usable:]
+            if not usable:
+                continue
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32).reshape(-1, frame_bytes // 2)
+            rms = np.sqrt(np.mean(samples * samples, axis=1))
+            levels.append(20 * np.log10(np.maximum(rms, 1.0) / 32768))
+    if process.returncode != 0:
+        logging.error(f"ffmpeg ошибка декодирования {audio_path} для поиска пауз")
+        return None
+    return np.concatenate(levels) if levels else np.empty(0, dtype=np.float32)
+
+
+def speech_intervals(levels, min_silence=None, padding=None, margin_db=None):
+    """
+    По уровням кадров выбирает интервалы (начало, конец) в секундах, которые нужно оставить:
+    паузы длиннее min_silence вырезаются, по краям речи остаётся padding секунд.
+    Пустой список – речи в записи не найдено.
+    """
+    min_silence = VAD_MIN_SILENCE if min_silence is None else min_silence
+    padding = VAD_PADDING if padding is None else padding
+    margin_db = VAD_MARGIN_DB if margin_db is None else margin_db
+    if not len(levels):
+        return []
+    threshold = max(float(np.percentile(levels, NOISE_PERCENTILE)) + margin_db, ABSOLUTE_FLOOR_DB)
+    speech = np.flatnonzero(levels > threshold)
+    if not speech.size:
+        return []
+    total = len(levels) * FRAME_DURATION
+    # Разрывы между соседними кадрами речи длиннее min_silence делят запись на интервалы
+    gaps = np.flatnonzero(np.diff(speech) - 1 > min_silence / FRAME_DURATION)
+    starts = np.concatenate(([speech[0]], speech[gaps + 1])) * FRAME_DURATION
+    ends = (np.concatenate((speech[gaps], [speech[-1]])) + 1) * FRAME_DURATION
+    intervals = [[max(0.0, start - padding), min(total, end + padding)] for start, end in zip(starts, ends)]
+    # Короткая тишина в начале и в конце записи не вырезается
+    if intervals[0][0] <= min_silence:
+        intervals[0][0] = 0.0
+    if total - intervals[-1][1] <= min_silence:
+        intervals[-1][1] = total
+    return [(round(float(start), 3), round(float(end), 3)) for start, end in intervals]
+
+
+def offset_map(intervals):
+    """Карта смещений для оставленных интервалов: [[начало в обрезанном, начало в исходном, длительность], ...]."""
+    result = []
+    position = 0.0
+    for start, end in intervals:
+        result.append([round(position, 3), start, round(end - start, 3)])
+        position += end - start
+    return result
+
+
+def to_original_time(seconds, offsets, starts=None):
+    """
+    Переводит время в обрезанном аудио во время исходной записи по карте смещений.
+    starts – заранее выбранные начала интервалов в обрезанном аудио (для серии вызовов).
+    """
+    if not offsets:
+        return seconds
+    starts = starts if starts is not None else [entry[0] for entry in offsets]
+    index = max(0, bisect.bisect_right(starts, seconds) - 1)
+    trimmed_start, original_start, duration = offsets[index]
+    return original_start + min(max(seconds - trimmed_start, 0.0), duration)
+
+
+def restore_timestamps(response, offsets):
+    """Возвращает копию ответа SpeechKit, в которой время слов переведено во время исходной записи."""
+    if not offsets:
+        return response
+    starts = [entry[0] for entry in offsets]
+
+    def convert(value):
+        return f"{to_original_time(float(str(value).rstrip('s')), offsets, starts):.3f}s"
+
+    chunks = []
+    for chunk in (response or {}).get("chunks", []):
+        chunk = dict(chunk)
+        chunk["alternatives"] = [
+            dict(alternative, words=[
+                dict(word, startTime=convert(word["startTime"]), endTime=convert(word["endTime"]))
+                if "startTime" in word and "endTime" in word else word
+                for word in alternative.get("words", [])
+            ])
+            for alternative in chunk.get("alternatives", [])
+        ]
+        chunks.append(chunk)
+    return dict(response, chunks=chunks)
+
+
+def cut_audio(audio_path, output_path, intervals, profile="legacy"):
+    """
+    Собирает из audio_path только интервалы intervals и кодирует их в OggOpus output_path
+    по профилю кодирования profile (фильтры профиля повторно не применяются).
+    PCM исходного аудио передаётся из декодирующего ffmpeg в кодирующий через процесс сервиса
+    блоками; вырезание выполняется с точностью до отсчёта. Возвращает True при успехе
+    и False, если декодирование или кодирование завершились ошибкой.
+    """
+    bounds = [(int(round(start * OUTPUT_RATE)), int(round(end * OUTPUT_RATE))) for start, end in intervals]
+    encode_command = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                      "-f", "s16le", "-ac", "1", "-ar", str(OUTPUT_RATE), "-i", "pipe:0",
+                      ] + encoder_options(profile, filters=False) + [output_path]
+    with subprocess.Popen(_decode_command(audio_path, OUTPUT_RATE), stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL) as decoder, \
+            subprocess.Popen(encode_command, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL) as encoder:
+        position = 0
+        index = 0
+        rest = b""
+        # Декодер дочитан до конца: его код возврата нужно проверить
+        decoded = False
+        try:
+            while index < len(bounds):
+                block = decoder.stdout.read(READ_BLOCK)
+                if not block:
+                    decoded = True
+                    break
+                data = rest + block
+                usable = len(data) // 2 * 2
+                rest = data[usable:]
+                block_end = position + usable // 2
+                while index < len(bounds) and bounds[index][0] < block_end:
+                    start, end = bounds[index]
+                    first = max(start, position) - position
+                    last = min(end, block_end) - position
+                    if last > first:
+                        encoder.stdin.write(data[first * 2:last * 2])
+                    if end > block_end:
+                        break
+                    index += 1
+                position = block_end
+        finally:
+            encoder.stdin.close()
+            # Если все интервалы уже собраны, оставшуюся часть записи декодировать незачем
+            if decoded:
+                decoder.wait()
+            else:
+                decoder.kill()
+    if decoded and decoder.returncode != 0:
+        logging.error(f"ffmpeg ошибка декодирования {audio_path}, паузы не вырезаются")
+        return False
+    if encoder.returncode != 0:
+        logging.error(f"ffmpeg ошибка кодирования аудио без пауз {output_path}")
+        return False
+    return True
+
+
+def trim_silence(audio_path, output_path, audio_duration, profile=None):
+    """
+    Вырезает длинные паузы из audio_path в output_path; обрезанное аудио кодируется
+    по профилю profile – тому же, что и при извлечении (по умолчанию см. resolve_profile).
+    Возвращает (длительность обрезанного аудио, карта смещений) или None, если пауз
+    меньше VAD_MIN_SAVING записи, речь не найдена или произошла ошибка –
+    тогда загружается исходное аудио.
+    """
+    try:
+        levels = frame_levels(audio_path)
+        if levels is None:
+            return None
+        intervals = speech_intervals(levels)
+        kept = sum(end - start for start, end in intervals)
+        if not intervals or audio_duration - kept < audio_duration * VAD_MIN_SAVING:
+            return None
+        if not cut_audio(audio_path, output_path, intervals, profile or resolve_profile(audio_path)):
+            return None
+        logging.info(f"Из {audio_path} вырезано {audio_duration - kept:.0f} сек пауз "
+                     f"({(audio_duration - kept) / audio_duration:.0%}), осталось {kept:.0f} сек "
+                     f"в {len(intervals)} интервалах")
+        return kept, offset_map(intervals)
+    except Exception as e:
+        logging.error(f"Исключение при вырезании пауз из {audio_path}: {e}")
+        return None
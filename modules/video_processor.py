@@ -1,14 +1,30 @@
 import os
 import json
 import time
+import hashlib
+import contextlib
+import threading
 import subprocess
 import requests
 import logging
 from urllib.parse import quote
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from modules.utils import load_config
+from modules.pipeline import run_stages
+from modules import job_store
+from modules.http_session import get_session
+from modules.recognition import (submit_recognition, track_operation, submit_segments, track_segments,
+                                 chunks_to_text)
+from modules.segmentation import segment_audio
+from modules import transcript_store
+from modules.metrics import stage_timer
+from modules.ogg_opus import opus_duration
+from modules import vad
+from modules.audio_profiles import encoder_options, resolve_profile
+from modules.transcoder import FfmpegJob, run_ffmpeg, threads_options, transcode_workers, ffmpeg_threads
 import concurrent.futures
 
 load_dotenv()
@@ -16,6 +32,9 @@ config = load_config()
 
 YANDEX_DISK_OAUTH_TOKEN = os.environ.get("YANDEX_DISK_OAUTH_TOKEN")
 DISK_FOLDER_PATH = config.get("DISK_FOLDER_PATH")
+DISK_API_URL = config.get("DISK_API_URL").rstrip("/")
+DISK_LISTING_MODE = config.get("DISK_LISTING_MODE", "tree")
+DISK_LIST_WORKERS = int(config.get("DISK_LIST_WORKERS", 8))
 YANDEX_SPEECHKIT_API_KEY = os.environ.get("YANDEX_SPEECHKIT_API_KEY")
 RECOGNITION_MODEL = config.get("RECOGNITION_MODEL", "general")
 YOBJECT_STORAGE_BUCKET = config.get("YOBJECT_STORAGE_BUCKET")
@@ -24,13 +43,39 @@ YOBJECT_STORAGE_SECRET_KEY = os.environ.get("YOBJECT_STORAGE_SECRET_KEY")
 YOBJECT_STORAGE_ENDPOINT = config.get("YOBJECT_STORAGE_ENDPOINT")
 SPEECHKIT_ASYNC_URL = config.get("SPEECHKIT_ASYNC_URL")
 LANGUAGE = config.get("LANGUAGE", "ru-RU")
+DOWNLOAD_WORKERS = int(config.get("DOWNLOAD_WORKERS", 2))
+# Число параллельных заданий извлечения аудио; auto – по ядрам и свободному месту (см. transcoder)
+TRANSCODE_WORKERS = config.get("TRANSCODE_WORKERS", "auto")
+UPLOAD_WORKERS = int(config.get("UPLOAD_WORKERS", 2))
+PIPELINE_QUEUE_SIZE = int(config.get("PIPELINE_QUEUE_SIZE", 2))
+STREAM_EXTRACTION = config.get("STREAM_EXTRACTION", "true").lower() == "true"
+STREAM_UPLOAD = config.get("STREAM_UPLOAD", "false").lower() == "true"
+S3_MULTIPART_THRESHOLD = int(config.get("S3_MULTIPART_THRESHOLD_MB", 8)) * 1024 ** 2
+S3_MULTIPART_CHUNKSIZE = int(config.get("S3_MULTIPART_CHUNKSIZE_MB", 8)) * 1024 ** 2
+S3_MAX_CONCURRENCY = int(config.get("S3_MAX_CONCURRENCY", 8))
 
 # Параметры и настройки
-PROCESSED_FILES_RECORD = "processed_files.json"
-UPLOAD_ERRORS_FILE = "upload_errors.json"
-AUDIO_QUEUE_FILE = "audio_queue.json"
 TEMP_DIR = "temp"
 SCAN_INTERVAL = 43200  # 12 часов
+MAX_FILE_SIZE = 45 * 1024 ** 3  # 45 ГБ в байтах
+DISK_PAGE_LIMIT = 1000  # Элементов на страницу при листинге Диска
+# Скачивание видео: число параллельных Range-соединений, размер части и буфер чтения
+DOWNLOAD_CONNECTIONS = int(config.get("DOWNLOAD_CONNECTIONS", 4))
+DOWNLOAD_CHUNK_SIZE = int(config.get("DOWNLOAD_CHUNK_MB", 16)) * 1024 ** 2
+DOWNLOAD_BUFFER_SIZE = 1024 ** 2
+# Сколько раз скачивать одну часть заново при обрыве соединения
+DOWNLOAD_RANGE_RETRIES = 3
+# Параметры ffmpeg для чтения видео по HTTP: переподключение при обрывах соединения
+HTTP_INPUT_OPTIONS = [
+    "-reconnect", "1",
+    "-reconnect_streamed", "1",
+    "-reconnect_on_network_error", "1",
+    "-reconnect_delay_max", "30",
+]
+# Контейнеры, которые ffmpeg читает последовательно без перемотки
+STREAMABLE_EXTENSIONS = {".mkv", ".webm", ".ts", ".mts", ".m2ts", ".flv", ".mpg", ".mpeg"}
+# Контейнеры ISO BMFF: потоковая обработка возможна, только если moov в начале файла
+MP4_EXTENSIONS = {".mp4", ".m4v", ".mov", ".3gp"}
 
 # ====== Настройка логирования ======
 # logging.basicConfig(filename='video_processor.log',
@@ -40,131 +85,178 @@ SCAN_INTERVAL = 43200  # 12 часов
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
-if not os.path.exists(PROCESSED_FILES_RECORD):
-    with open(PROCESSED_FILES_RECORD, 'w', encoding='utf-8') as f:
-        f.write("{}")
-
 # ====== Инициализация клиента Yandex Object Storage ======
 s3_client = boto3.client('s3',
                          endpoint_url=YOBJECT_STORAGE_ENDPOINT,
                          aws_access_key_id=YOBJECT_STORAGE_ACCESS_KEY,
                          aws_secret_access_key=YOBJECT_STORAGE_SECRET_KEY)
+# Параметры multipart-загрузки: размер части и число параллельно загружаемых частей
+s3_transfer_config = TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD,
+                                    multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+                                    max_concurrency=S3_MAX_CONCURRENCY,
+                                    use_threads=True)
+# Минимальный размер части multipart-загрузки в S3 (кроме последней)
+S3_MIN_PART_SIZE = 5 * 1024 ** 2
+# Число сегментов длинной записи, загружаемых в Object Storage одновременно
+SEGMENT_UPLOAD_WORKERS = 4
+
+
+def job_metadata(job) -> dict:
+    """Формирует аудио-метаданные для очереди распознавания из записи базы заданий."""
+    return {
+        "transcript_name": job.get("transcript_name"),
+        "public_url": job.get("public_url"),
+        "audio_duration": job.get("audio_duration"),
+        "file_path": job.get("file_path"),
+        "segments": json.loads(job["segments"]) if job.get("segments") else None,
+    }
 
 
-def load_upload_errors() -> list:
+def load_audio_queue():
     """
-    Загружает список аудио-метаданных с ошибками загрузки из UPLOAD_ERRORS_FILE.
-    Если файл не найден или произошла ошибка, возвращает пустой список.
+    Перебирает аудио-метаданные, ожидающие распознавания (задания в состоянии uploaded
+    в базе заданий). Задания читаются из базы постранично, поэтому большой накопленный
+    объём не загружается в память целиком.
     """
-    try:
-        with open(UPLOAD_ERRORS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Ошибка загрузки ошибок загрузки. Файл {UPLOAD_ERRORS_FILE} не найден или пуст: {e}")
-        return []
+    return (job_metadata(job) for job in job_store.iter_jobs(job_store.UPLOADED))
 
 
-def save_upload_errors(errors_list: list) -> None:
-    """
-    Сохраняет текущий список аудио-метаданных с ошибками загрузки в UPLOAD_ERRORS_FILE.
-    """
-    try:
-        with open(UPLOAD_ERRORS_FILE, "w", encoding="utf-8") as f:
-            json.dump(errors_list, f, ensure_ascii=False, indent=4)
-        logging.info("Ошибки загрузки успешно сохранены.")
-    except Exception as e:
-        logging.error(f"Ошибка сохранения файла ошибок загрузки: {e}")
+# Защищает нумерацию подкастов от параллельных стадий конвейера
+state_lock = threading.RLock()
+# Используется для нумерации файлов в одном подкасте
+podcast_file_counter = {}
 
 
-def load_processed_files():
-    """Загружает список уже обработанных файлов из JSON-файла."""
-    if os.path.exists(PROCESSED_FILES_RECORD):
-        try:
-            with open(PROCESSED_FILES_RECORD, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logging.error(f"Ошибка загрузки обработанных файлов: {e}")
-            return {}
-    return {}
+def _is_video_item(item):
+    """Проверяет, что элемент Диска – видеофайл допустимого размера (не больше MAX_FILE_SIZE)."""
+    if item.get("type") != "file" or not item.get("mime_type", "").startswith("video/"):
+        return False
+    if item.get("size", 0) > MAX_FILE_SIZE:
+        logging.info(f"Пропуск файла {item.get('name')} (размер {item.get('size')} байт, больше 45 ГБ)")
+        return False
+    return True
 
 
-def save_processed_files(processed):
-    """Сохраняет обновлённый список обработанных файлов в JSON-файл."""
-    try:
-        with open(PROCESSED_FILES_RECORD, 'w', encoding='utf-8') as f:
-            json.dump(processed, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        logging.error(f"Ошибка сохранения обработанных файлов: {e}")
+def _disk_session():
+    """
+    Возвращает общую сессию для запросов к Диску (API и скачивание файлов) с keep-alive
+    соединениями: пул рассчитан на параллельный листинг и все потоки скачивания конвейера.
+    """
+    return get_session("disk", max(DISK_LIST_WORKERS,
+                                   (DOWNLOAD_WORKERS + transcode_workers(TRANSCODE_WORKERS)) * DOWNLOAD_CONNECTIONS))
 
 
-def load_audio_queue() -> list:
+def _list_folder_items(session, folder_path):
     """
-    Загружает сохранённые аудио-метаданные из файла AUDIO_QUEUE_FILE.
-    Если файл не найден или произошла ошибка, возвращает пустой список.
+    Возвращает все элементы папки на Диске, постранично запрашивая их по DISK_PAGE_LIMIT
+    через offset, пока не будут получены все total элементов.
     """
-    try:
-        with open(AUDIO_QUEUE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Ошибка загрузки аудио-метаданных. Файл {AUDIO_QUEUE_FILE} не найден или пуст: {e}")
-        return []
+    headers = {"Authorization": f"OAuth {YANDEX_DISK_OAUTH_TOKEN}"}
+    items = []
+    offset = 0
+    while True:
+        response = session.get(f"{DISK_API_URL}/resources",
+                               params={"path": folder_path, "limit": DISK_PAGE_LIMIT, "offset": offset},
+                               headers=headers)
+        if response.status_code != 200:
+            logging.error(f"Ошибка получения списка файлов для {folder_path}: {response.text}")
+            return items
+        embedded = response.json().get("_embedded", {})
+        page = embedded.get("items", [])
+        items.extend(page)
+        offset += len(page)
+        total = embedded.get("total")
+        if not page or (total is not None and offset >= total) or (total is None and len(page) < DISK_PAGE_LIMIT):
+            return items
 
 
-def save_audio_queue(queue_items: list) -> None:
+def list_video_files_flat(folder_path):
     """
-    Сохраняет текущий список аудио-метаданных в файл AUDIO_QUEUE_FILE.
+    Возвращает видеофайлы из плоского списка всех файлов Диска (/resources/files с media_type=video),
+    оставляя только файлы внутри folder_path. Не требует обхода папок, но не учитывает
+    порядок элементов внутри папок, поэтому результат сортируется по пути.
     """
+    headers = {"Authorization": f"OAuth {YANDEX_DISK_OAUTH_TOKEN}"}
+    prefix = folder_path.rstrip("/") + "/"
+    video_files = []
+    offset = 0
+    session = _disk_session()
     try:
-        with open(AUDIO_QUEUE_FILE, "w", encoding="utf-8") as f:
-            json.dump(queue_items, f, ensure_ascii=False, indent=4)
-        logging.info("Аудио метаданные успешно сохранены.")
+        while True:
+            response = session.get(f"{DISK_API_URL}/resources/files",
+                                   params={"media_type": "video", "limit": DISK_PAGE_LIMIT, "offset": offset},
+                                   headers=headers)
+            if response.status_code != 200:
+                logging.error(f"Ошибка получения плоского списка файлов: {response.text}")
+                break
+            page = response.json().get("items", [])
+            video_files.extend(item for item in page
+                               if item.get("path", "").startswith(prefix) and _is_video_item(item))
+            offset += len(page)
+            if len(page) < DISK_PAGE_LIMIT:
+                break
     except Exception as e:
-        logging.error(f"Ошибка сохранения файла аудио-метаданных: {e}")
-
-
-processed_files = load_processed_files()
-# Глобальный список для хранения метаданных аудиофайлов в режиме deferred-general
-audio_metadata_list = []
-# Используется для нумерации файлов в одном подкасте
-podcast_file_counter = {}
+        logging.error(f"Исключение при получении плоского списка файлов: {e}")
+    return sorted(video_files, key=lambda item: item.get("path", ""))
 
 
-def list_video_files(folder_path):
+@stage_timer("scan")
+def list_video_files(folder_path, mode=None):
     """
     Рекурсивно обходит указанную папку на Яндекс.Диске
     и возвращает список видеофайлов.
+
+    Каждая папка читается постранично целиком, а соседние папки запрашиваются параллельно
+    (не больше DISK_LIST_WORKERS запросов одновременно) через общий пул соединений.
+    Порядок результата совпадает с последовательным обходом в глубину, поэтому
+    нумерация транскрипций в get_transcript_name не зависит от порядка ответов.
+    При mode == "flat" (или DISK_LISTING_MODE=flat) используется list_video_files_flat.
     """
-    video_files = []
-    headers = {"Authorization": f"OAuth {YANDEX_DISK_OAUTH_TOKEN}"}
-    MAX_FILE_SIZE = 45 * 1024 ** 3  # 45 ГБ в байтах
+    if (mode or DISK_LISTING_MODE) == "flat":
+        return list_video_files_flat(folder_path)
 
+    folder_items = {}
+    session = _disk_session()
     try:
-        response = requests.get("https://cloud-api.yandex.net/v1/disk/resources",
-                                params={"path": folder_path, "limit": 1000},
-                                headers=headers)
-        if response.status_code == 200:
-            items = response.json().get("_embedded", {}).get("items", [])
-            for item in items:
-                if item.get("type") == "dir":
-                    subfolder = item.get("path")
-                    video_files.extend(list_video_files(subfolder))
-                elif item.get("type") == "file" and item.get("mime_type", "").startswith("video/"):
-                    if item.get("size", 0) > MAX_FILE_SIZE:
-                        logging.info(f"Пропуск файла {item.get('name')} (размер {item.get('size')} байт, больше 45 ГБ)")
-                        continue
-                    video_files.append(item)
-        else:
-            logging.error(f"Ошибка получения списка файлов для {folder_path}: {response.text}")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=DISK_LIST_WORKERS) as executor:
+            pending = {executor.submit(_list_folder_items, session, folder_path): folder_path}
+            while pending:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    current = pending.pop(future)
+                    try:
+                        items = future.result()
+                    except Exception as e:
+                        logging.error(f"Исключение при получении списка файлов для {current}: {e}")
+                        items = []
+                    folder_items[current] = items
+                    for item in items:
+                        if item.get("type") == "dir":
+                            subfolder = item.get("path")
+                            pending[executor.submit(_list_folder_items, session, subfolder)] = subfolder
     except Exception as e:
         logging.error(f"Исключение при получении списка файлов для {folder_path}: {e}")
+
+    # Собираем результат в порядке обхода в глубину
+    video_files = []
+    stack = [iter(folder_items.get(folder_path, []))]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+        elif item.get("type") == "dir":
+            stack.append(iter(folder_items.get(item.get("path"), [])))
+        elif _is_video_item(item):
+            video_files.append(item)
     return video_files
 
 
+@stage_timer("get_download_url")
 def get_download_url(file_path):
     """Получает ссылку для скачивания файла с Яндекс.Диска."""
     headers = {"Authorization": f"OAuth {YANDEX_DISK_OAUTH_TOKEN}"}
     try:
-        response = requests.get("https://cloud-api.yandex.net/v1/disk/resources/download",
+        response = _disk_session().get(f"{DISK_API_URL}/resources/download",
                                 params={"path": file_path},
                                 headers=headers)
         if response.status_code == 200:
@@ -177,72 +269,294 @@ def get_download_url(file_path):
         return None
 
 
-def download_file(url, local_path):
-    """Скачивает файл по указанной ссылке и сохраняет его локально."""
+def _probe_download(session, url):
+    """
+    Определяет размер файла и поддержку HTTP Range запросом первого байта.
+    Возвращает (размер, ETag) или (None, None), если сервер не поддерживает Range.
+    """
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True) as r:
+        content_range = r.headers.get("Content-Range", "")
+        if r.status_code != 206 or "/" not in content_range or content_range.endswith("/*"):
+            return None, None
+        return int(content_range.rsplit("/", 1)[1]), r.headers.get("ETag")
+
+
+def _merge_ranges(ranges):
+    """Объединяет пересекающиеся и соседние диапазоны байт [начало, конец) в отсортированный список."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_ranges(done, size, chunk_size):
+    """
+    Возвращает недостающие диапазоны байт [начало, конец] (включительно) файла размером size,
+    разбитые на части не больше chunk_size; done – скачанные диапазоны [начало, конец).
+    """
+    missing = []
+    position = 0
+    for start, end in done + [[size, size]]:
+        for chunk_start in range(position, start, chunk_size):
+            missing.append((chunk_start, min(chunk_start + chunk_size, start) - 1))
+        position = max(position, end)
+    return missing
+
+
+def _load_download_state(state_path, size, etag):
+    """
+    Читает скачанные диапазоны байт [начало, конец) из файла состояния докачки.
+    Диапазоны хранятся в байтах, а не номерами частей, поэтому докачка корректна и после
+    смены DOWNLOAD_CHUNK_MB. Если файл относится к другой версии видео (другой размер
+    или ETag) или записан в прежнем формате, докачка начинается заново.
+    """
     try:
-        logging.info(f"Начало загрузки файла: {local_path}")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total_size = int(r.headers.get('content-length', 0))  # Получаем размер файла, если он доступен
-            downloaded_size = 0
-            chunk_size = 8192  # Размер чанка для чтения
-            start_time = time.time()
-            last_log_time = start_time
-
-            with open(local_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_size += len(chunk)
-                        current_time = time.time()
-
-                        # Логирование каждые 10 секунд или по завершении загрузки
-                        if current_time - last_log_time >= 10 or downloaded_size == total_size:
-                            elapsed_time = current_time - start_time
-                            download_speed = downloaded_size / (elapsed_time * 1024)  # КБ/с
-
-                            if total_size > 0:
-                                progress = (downloaded_size / total_size) * 100
-                                logging.info(
-                                    f"Загружено: {downloaded_size} / {total_size} байт ({progress:.2f}%), скорость: {download_speed:.2f} КБ/с")
-                            else:
-                                logging.info(f"Загружено: {downloaded_size} байт, скорость: {download_speed:.2f} КБ/с")
-
-                            last_log_time = current_time
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("size") == size and state.get("etag") == etag and "ranges" in state:
+            return _merge_ranges([start, end] for start, end in state["ranges"]
+                                 if 0 <= start < end <= size)
+    except (OSError, ValueError, TypeError):
+        pass
+    return []
+
+
+def _save_download_state(state_path, size, etag, done):
+    """Атомарно сохраняет скачанные диапазоны байт (через временный файл и os.replace)."""
+    temp_file = f"{state_path}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump({"size": size, "etag": etag, "ranges": done}, f)
+    os.replace(temp_file, state_path)
 
+
+def _download_range(session, url, fd, start, end):
+    """
+    Скачивает диапазон байт [start, end] и записывает его в файл по тому же смещению (os.pwrite),
+    поэтому части, скачиваемые параллельно, пишутся в один файл без общей блокировки.
+    При обрыве соединения часть скачивается заново, не более DOWNLOAD_RANGE_RETRIES раз.
+    """
+    for attempt in range(1, DOWNLOAD_RANGE_RETRIES + 1):
+        position = start
+        try:
+            with session.get(url, headers={"Range": f"bytes={start}-{end}"}, stream=True) as r:
+                if r.status_code != 206:
+                    raise IOError(f"HTTP {r.status_code} на запрос диапазона {start}-{end}")
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+                    os.pwrite(fd, chunk, position)
+                    position += len(chunk)
+            if position == end + 1:
+                return end + 1 - start
+            raise IOError(f"получено {position - start} из {end + 1 - start} байт")
+        except (requests.exceptions.RequestException, IOError) as e:
+            if attempt == DOWNLOAD_RANGE_RETRIES:
+                raise
+            logging.warning(f"Повтор скачивания диапазона {start}-{end} (попытка {attempt}): {e}")
+
+
+def _download_stream(session, url, local_path):
+    """Скачивает файл одним потоком (для серверов без поддержки Range); докачка невозможна."""
+    with session.get(url, stream=True) as r:
+        r.raise_for_status()
+        with open(local_path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+                f.write(chunk)
+
+
+@stage_timer("download")
+def download_file(url, local_path, connections=None, chunk_size=None):
+    """
+    Скачивает файл по указанной ссылке и сохраняет его локально.
+
+    Файл делится на части по chunk_size байт (DOWNLOAD_CHUNK_MB), которые скачиваются
+    HTTP Range-запросами в connections параллельных соединений (DOWNLOAD_CONNECTIONS)
+    во временный файл local_path + ".part". Скачанные диапазоны байт сохраняются
+    в local_path + ".part.json", поэтому после перезапуска процесса или обрыва связи
+    скачивание продолжается с недостающих частей, а не с начала. Когда все части
+    скачаны, файл переименовывается в local_path.
+    Если сервер не поддерживает Range, файл скачивается одним потоком.
+    """
+    connections = connections or DOWNLOAD_CONNECTIONS
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
+    part_path = f"{local_path}.part"
+    state_path = f"{part_path}.json"
+    session = _disk_session()
+    try:
+        logging.info(f"Начало загрузки файла: {local_path}")
+        total_size, etag = _probe_download(session, url)
+        if total_size is None:
+            logging.info(f"Сервер не поддерживает Range, скачивание одним потоком: {local_path}")
+            _download_stream(session, url, local_path)
+            logging.info(f"Файл успешно загружен: {local_path}")
+            return True
+
+        done = _load_download_state(state_path, total_size, etag) if os.path.exists(part_path) else []
+        pending = _missing_ranges(done, total_size, chunk_size)
+        downloaded_size = sum(end - start for start, end in done)
+        if done:
+            logging.info(f"Докачка {local_path}: уже скачано {downloaded_size} из {total_size} байт")
+        resumed_size = downloaded_size
+        start_time = time.time()
+        last_log_time = start_time
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT)
+        try:
+            os.ftruncate(fd, total_size)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+                futures = {
+                    executor.submit(_download_range, session, url, fd, start, end): (start, end)
+                    for start, end in pending
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        downloaded_size += future.result()
+                    except Exception:
+                        # Не начинаем оставшиеся части: файл будет докачан при следующей попытке
+                        for other in futures:
+                            other.cancel()
+                        raise
+                    start, end = futures[future]
+                    done = _merge_ranges(done + [[start, end + 1]])
+                    _save_download_state(state_path, total_size, etag, done)
+
+                    # Логирование каждые 10 секунд или по завершении загрузки
+                    current_time = time.time()
+                    if current_time - last_log_time >= 10 or downloaded_size == total_size:
+                        elapsed_time = max(current_time - start_time, 1e-6)
+                        download_speed = (downloaded_size - resumed_size) / (elapsed_time * 1024)  # КБ/с
+                        progress = (downloaded_size / total_size) * 100 if total_size else 100.0
+                        logging.info(
+                            f"Загружено: {downloaded_size} / {total_size} байт ({progress:.2f}%), скорость: {download_speed:.2f} КБ/с")
+                        last_log_time = current_time
+        finally:
+            os.close(fd)
+
+        os.replace(part_path, local_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
         logging.info(f"Файл успешно загружен: {local_path}")
         return True
     except Exception as e:
+        # Частично скачанный файл и состояние сохраняются для докачки при следующей попытке
         logging.error(f"Ошибка скачивания файла {url}: {e}")
         return False
 
 
-def extract_audio(video_path, audio_path):
+def build_audio_command(source, output, input_options=None, threads=None, profile="legacy"):
+    """
+    Формирует команду ffmpeg для извлечения аудио в OggOpus (моно) по профилю кодирования
+    profile (частота, битрейт и фильтры, см. modules.audio_profiles).
+    source – локальный путь или URL, output – путь к файлу или "pipe:1" для вывода в stdout.
+    Число потоков декодирования и кодирования ограничено threads (по умолчанию см. ffmpeg_threads).
+    """
+    command = ["ffmpeg", "-y"] + threads_options(threads) + list(input_options or []) + [
+        "-i", source, "-vn",
+    ] + encoder_options(profile) + threads_options(threads)
+    if output.startswith("pipe:"):
+        command += ["-f", "ogg"]
+    return command + [output]
+
+
+@stage_timer("extract_audio")
+def extract_audio(video_path, audio_path, input_options=None, threads=None, profile=None):
     """
     Извлекает аудиодорожку из видеофайла и конвертирует её в формат OggOpus с моно каналом.
+    video_path может быть как локальным путём, так и URL: для ссылки на скачивание передаются
+    HTTP_INPUT_OPTIONS, и ffmpeg сам читает HTTP-поток, переподключаясь при обрывах.
+    profile – профиль кодирования (по умолчанию выбирается по AUDIO_PROFILE, см. resolve_profile).
+    ffmpeg работает под управлением transcoder.FfmpegJob: зависший процесс останавливается.
+    Возвращает длительность извлечённого аудио (сек) по прогрессу ffmpeg
+    (если ffmpeg её не сообщил – по get_audio_duration) или None при ошибке.
     """
     try:
-        command = [
-            "ffmpeg", "-y", "-i", video_path, "-vn",
-            "-c:a", "libopus", "-b:a", "64k",
-            "-ac", "1",  # Принудительное преобразование в моно
-            audio_path
-        ]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if result.returncode != 0:
-            logging.error(f"ffmpeg ошибка для {video_path}: {result.stderr.decode('utf-8')}")
-            return False
-        return True
+        profile = profile or resolve_profile(video_path, input_options)
+        job = run_ffmpeg(build_audio_command(video_path, audio_path, input_options, threads, profile),
+                         label=video_path)
+        if not job.ok:
+            logging.error(f"ffmpeg ошибка для {video_path}: {job.error_output}")
+            return None
+        logging.info(f"Аудио извлечено из {video_path}: {job.encoded_seconds or 0:.0f} сек, "
+                     f"скорость {job.speed or 0:.1f}x, профиль {profile}")
+        return job.encoded_seconds or get_audio_duration(audio_path)
     except Exception as e:
         logging.error(f"Исключение при извлечении аудио из {video_path}: {e}")
-        return False
+        return None
+
+
+def _read_range(url, offset, length):
+    """Читает диапазон байт [offset, offset + length) по ссылке с помощью HTTP Range."""
+    headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+    with _disk_session().get(url, headers=headers, stream=True, timeout=30) as r:
+        if r.status_code == 206:
+            return r.content[:length]
+        if r.status_code == 200 and offset == 0:
+            # Сервер проигнорировал Range – читаем из потока только нужное начало файла
+            return r.raw.read(length)
+        return b""
+
+
+def mp4_moov_before_mdat(url, max_boxes=16):
+    """
+    Проверяет, расположен ли атом moov MP4/MOV-файла перед данными (mdat).
+    Читает по ссылке только заголовки атомов верхнего уровня (по 16 байт через Range-запросы).
+    Возвращает True, если файл можно обрабатывать потоково, False – если moov в конце
+    (или структуру определить не удалось).
+    """
+    offset = 0
+    for _ in range(max_boxes):
+        header = _read_range(url, offset, 16)
+        if len(header) < 8:
+            return False
+        size = int.from_bytes(header[0:4], "big")
+        box_type = header[4:8]
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1:
+            # 64-битный размер атома
+            if len(header) < 16:
+                return False
+            size = int.from_bytes(header[8:16], "big")
+        elif size == 0:
+            # Атом до конца файла, дальше атомов нет
+            return False
+        if size < 8:
+            return False
+        offset += size
+    return False
 
 
+def is_streamable(download_url, file_path):
+    """
+    Определяет, можно ли извлечь аудио из видео потоково, без предварительного скачивания.
+    Контейнеры из STREAMABLE_EXTENSIONS читаются последовательно; для MP4/MOV
+    дополнительно проверяется, что атом moov находится в начале файла.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in STREAMABLE_EXTENSIONS:
+        return True
+    if extension in MP4_EXTENSIONS:
+        try:
+            return mp4_moov_before_mdat(download_url)
+        except Exception as e:
+            logging.warning(f"Не удалось проверить структуру MP4 для {file_path}: {e}")
+            return False
+    return False
+
+
+@stage_timer("get_audio_duration")
 def get_audio_duration(file_path):
     """
-    Определяет длительность аудиофайла с помощью ffprobe.
+    Определяет длительность аудиофайла. Для OggOpus она вычисляется по последней странице
+    файла (ogg_opus.opus_duration), без запуска внешнего процесса; для остальных форматов
+    и нечитаемых OggOpus-файлов используется ffprobe.
     Возвращает длительность в секундах или None в случае ошибки.
     """
+    duration = opus_duration(file_path)
+    if duration is not None:
+        return duration
     try:
         cmd = [
             "ffprobe", "-v", "error",
@@ -258,12 +572,15 @@ def get_audio_duration(file_path):
         return None
 
 
-def upload_to_object_storage(local_file, object_name):
+@stage_timer("upload")
+def upload_to_object_storage(local_file, object_name, transfer_config=None):
     """
     Загружает файл в Yandex Object Storage в указанный бакет и возвращает публичную ссылку.
+    Крупные файлы загружаются multipart-частями параллельно (см. s3_transfer_config).
     """
     try:
-        s3_client.upload_file(local_file, YOBJECT_STORAGE_BUCKET, object_name)
+        s3_client.upload_file(local_file, YOBJECT_STORAGE_BUCKET, object_name,
+                              Config=transfer_config or s3_transfer_config)
         public_url = f"{YOBJECT_STORAGE_ENDPOINT}/{YOBJECT_STORAGE_BUCKET}/{quote(object_name)}"
         return public_url
     except ClientError as e:
@@ -271,109 +588,156 @@ def upload_to_object_storage(local_file, object_name):
         return None
 
 
-def async_recognize_speech(file_url, audio_duration, model=RECOGNITION_MODEL):
+def _read_part(stream, size):
+    """Читает из потока ровно size байт (меньше – только в конце потока)."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def upload_stream_to_object_storage(stream, object_name, tee_path=None, before_complete=None,
+                                    part_size=None, max_concurrency=None, hold=None):
     """
-    Отправляет запрос на асинхронное распознавание аудиофайла.
+    Загружает данные из потока (например, stdout ffmpeg) в Object Storage multipart-частями
+    по мере их появления, не дожидаясь окончания записи.
+    Одновременно в памяти и в загрузке находится не более max_concurrency частей.
+
+    tee_path – если указан, прочитанные данные дополнительно сохраняются в этот файл
+    (нужен для определения длительности и повторной загрузки при ошибке).
+    before_complete – функция без аргументов, вызываемая после чтения всего потока;
+    если она вернёт False, загрузка отменяется.
+    hold – контекстный менеджер (например, FfmpegJob.hold), внутри которого поток ждёт
+    освобождения места для следующей части: источник в это время стоит и зависшим не считается.
+    Возвращает публичную ссылку или None.
+    """
+    part_size = max(part_size or S3_MULTIPART_CHUNKSIZE, S3_MIN_PART_SIZE)
+    max_concurrency = max_concurrency or S3_MAX_CONCURRENCY
+    upload_id = None
+    try:
+        upload_id = s3_client.create_multipart_upload(Bucket=YOBJECT_STORAGE_BUCKET,
+                                                      Key=object_name)["UploadId"]
+        slots = threading.BoundedSemaphore(max_concurrency)
+
+        def upload_part(part_number, body):
+            try:
+                response = s3_client.upload_part(Bucket=YOBJECT_STORAGE_BUCKET, Key=object_name,
+                                                 UploadId=upload_id, PartNumber=part_number, Body=body)
+                return {"PartNumber": part_number, "ETag": response["ETag"]}
+            finally:
+                slots.release()
+
+        futures = []
+        tee = open(tee_path, "wb") if tee_path else None
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                part_number = 1
+                while True:
+                    body = _read_part(stream, part_size)
+                    if not body:
+                        break
+                    if tee:
+                        tee.write(body)
+                    with hold() if hold else contextlib.nullcontext():
+                        slots.acquire()
+                    futures.append(executor.submit(upload_part, part_number, body))
+                    part_number += 1
+                parts = [future.result() for future in futures]
+        finally:
+            if tee:
+                tee.close()
+
+        if not parts:
+            raise ValueError("поток не содержит данных")
+        if before_complete is not None and not before_complete():
+            raise RuntimeError("источник данных завершился с ошибкой")
+        s3_client.complete_multipart_upload(Bucket=YOBJECT_STORAGE_BUCKET, Key=object_name,
+                                            UploadId=upload_id,
+                                            MultipartUpload={"Parts": parts})
+        return f"{YOBJECT_STORAGE_ENDPOINT}/{YOBJECT_STORAGE_BUCKET}/{quote(object_name)}"
+    except Exception as e:
+        logging.error(f"Ошибка потоковой загрузки {object_name} в Yandex Object Storage: {e}")
+        if upload_id:
+            try:
+                s3_client.abort_multipart_upload(Bucket=YOBJECT_STORAGE_BUCKET, Key=object_name,
+                                                 UploadId=upload_id)
+            except ClientError as abort_error:
+                logging.error(f"Не удалось отменить multipart-загрузку {object_name}: {abort_error}")
+        return None
+
+
+@stage_timer("extract_and_upload")
+def extract_and_upload_audio(source, audio_path, object_name, input_options=None, threads=None, profile=None):
+    """
+    Извлекает аудио с помощью ffmpeg и одновременно загружает его в Object Storage:
+    вывод ffmpeg читается из pipe и отправляется multipart-частями по мере кодирования.
+    Копия аудио сохраняется в audio_path. Возвращает публичную ссылку или None.
+    """
+    profile = profile or resolve_profile(source, input_options)
+    command = build_audio_command(source, "pipe:1", input_options, threads, profile)
+    try:
+        with FfmpegJob(command, label=source, stdout=subprocess.PIPE) as job:
+            public_url = upload_stream_to_object_storage(job.stdout, object_name, tee_path=audio_path,
+                                                         before_complete=job.wait, hold=job.hold)
+            if public_url is None:
+                job.kill()
+            if not job.wait():
+                logging.error(f"ffmpeg завершился с кодом {job.process.returncode} для {source}: "
+                              f"{job.error_output}")
+                return None
+            return public_url
+    except Exception as e:
+        logging.error(f"Исключение при извлечении и загрузке аудио из {source}: {e}")
+        return None
+
+
+@stage_timer("recognition_wait")
+def wait_recognition(file_url, audio_duration, model=RECOGNITION_MODEL, segments=None, on_submitted=None):
+    """
+    Отправляет запрос на асинхронное распознавание аудиофайла и дожидается результата.
+    Возвращает ответ SpeechKit целиком (фрагменты со словами и их временем) или None.
     Если модель 'general' – используется динамический интервал ожидания,
     если 'deferred-general' – фиксированный интервал опроса с максимальным временем ожидания 24 часа.
+    Статус операции проверяет общий опросчик (modules.recognition), поэтому вызов
+    не выполняет запросы сам, а лишь ждёт завершения Future.
+    Если переданы segments (длинная запись, разбитая по паузам), сегменты распознаются
+    параллельными операциями, а их тексты склеиваются по порядку.
+    on_submitted(operation_id, segments) вызывается сразу после отправки: с id операции
+    или с сегментами, дополненными id их операций, – чтобы сохранить их до окончания ожидания.
 
     Ограничения:
       - Запросов на распознавание в час: 500 (POST-запросы, их обычно мало)
       - Запросов на проверку статуса операции в час: 2500
       - Тарифицированных часов аудио в сутки: 10000 (отсчет с момента первого запроса)
     """
-    headers = {
-        "Authorization": f"Api-Key {YANDEX_SPEECHKIT_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "config": {
-            "specification": {
-                "languageCode": LANGUAGE,
-                "model": model,
-                "rawResults": 'true'  # Флаг, указывающий, как писать числа
-            },                        # false (по умолчанию) — писать цифрами; true — писать прописью
-            "audioEncoding": "OGG_OPUS"
-        },
-        "audio": {
-            "uri": file_url
-        }
-    }
-    try:
-        response = requests.post(SPEECHKIT_ASYNC_URL, headers=headers, json=payload)
-        logging.debug(f"Ответ на запрос распознавания (POST): {response.text}")
-        if response.status_code != 200:
-            logging.error(f"Ошибка запроса асинхронного распознавания: {response.text}")
-            return ""
-        operation = response.json()
-        operation_id = operation.get('id')
-        if not operation_id:
-            logging.error(f"Не получен идентификатор операции: {operation}")
-            return ""
-        op_url = f"https://operation.api.cloud.yandex.net/operations/{operation_id}"
-        logging.info(f"Запущена операция распознавания, id: {operation_id}")
-
-        # Определяем интервал опроса и максимальное время ожидания в зависимости от модели
-        if model == "general":
-            # Динамический интервал: предполагается, что audio_duration/6 - ориентировочное время обработки
-            expected_processing_time = audio_duration / 6.0  # например, 60 сек аудио -> ~10 сек обработки
-            sleep_interval = max(10, expected_processing_time / 3.0)  # минимум 10 сек
-            max_wait_time = expected_processing_time * 10  # допускаем, что обработка займёт не более 10х ожидаемого времени
-        elif model == "deferred-general":
-            # Фиксированный интервал опроса для отложенного режима
-            sleep_interval = 60  # опрашиваем раз в 60 сек
-            max_wait_time = 86400  # 24 часа в секундах
-        else:
-            # По умолчанию используем динамический алгоритм
-            expected_processing_time = audio_duration / 6.0
-            sleep_interval = max(10, expected_processing_time / 3.0)
-            max_wait_time = expected_processing_time * 10
-
-        logging.info(f"Модель распознавания: {model}. Интервал опроса: {sleep_interval:.1f} сек, "
-                     f"максимальное время ожидания: {max_wait_time:.1f} сек")
-        start_time = time.time()
+    if segments:
+        submitted = submit_segments(segments, model)
+        if not submitted:
+            return None
+        if on_submitted:
+            on_submitted(None, submitted)
+        return track_segments(submitted, model).result()
+    operation_id = submit_recognition(file_url, model)
+    if not operation_id:
+        return None
+    if on_submitted:
+        on_submitted(operation_id, None)
+    return track_operation(operation_id, audio_duration, model).result()
 
-        while True:
-            # Если превышено максимальное время ожидания, завершаем попытки
-            if time.time() - start_time > max_wait_time:
-                logging.error("Превышено максимальное время ожидания распознавания.")
-                return ""
-            time.sleep(sleep_interval)
-            op_response = requests.get(op_url, headers=headers)
-
-            # Обработка превышения лимита запросов
-            if op_response.status_code == 429:
-                logging.warning("Превышен лимит запросов на проверку статуса (HTTP 429). Пауза на 1 час.")
-                time.sleep(3600)
-                continue
 
-            logging.debug(f"HTTP статус: {op_response.status_code}")
-            logging.debug(f"Ответ статуса: {op_response.text}")
-            if op_response.status_code != 200:
-                logging.error(f"Ошибка получения статуса (HTTP {op_response.status_code}): {op_response.text}")
-                continue
-            op_data = op_response.json()
-            if op_data.get("done"):
-                if "error" in op_data:
-                    logging.error(f"Ошибка распознавания: {op_data['error']}")
-                    return ""
-                response_data = op_data.get("response", {})
-                if "chunks" in response_data:
-                    chunks = response_data["chunks"]
-                    recognized_text = " ".join(
-                        [chunk["alternatives"][0]["text"]
-                         for chunk in chunks if chunk.get("alternatives")]
-                    )
-                    logging.debug(f"Распознанный текст: {recognized_text}")
-                    return recognized_text
-                else:
-                    logging.error("Операция завершена, но результатов распознавания нет.")
-                    return ""
-            else:
-                logging.info("Операция не завершена, ожидаем следующий опрос...")
-    except requests.exceptions.HTTPError as e:
-        logging.error(f"Исключение при асинхронном распознавании: {e}")
+def async_recognize_speech(file_url, audio_duration, model=RECOGNITION_MODEL, segments=None):
+    """Распознаёт аудиофайл (см. wait_recognition) и возвращает только текст."""
+    response = wait_recognition(file_url, audio_duration, model, segments)
+    if not response:
         return ""
+    recognized_text = chunks_to_text(response)
+    logging.debug(f"Распознанный текст: {recognized_text}")
+    return recognized_text
 
 
 def get_transcript_name(file_path: str) -> str:
@@ -393,12 +757,12 @@ def get_transcript_name(file_path: str) -> str:
     else:
         # Имя подкаста — первая директория
         transcript = parts[0]
-        global podcast_file_counter
-        if transcript not in podcast_file_counter:
-            podcast_file_counter[transcript] = 1
-        else:
-            podcast_file_counter[transcript] += 1
-        count = podcast_file_counter[transcript]
+        with state_lock:
+            if transcript not in podcast_file_counter:
+                podcast_file_counter[transcript] = 1
+            else:
+                podcast_file_counter[transcript] += 1
+            count = podcast_file_counter[transcript]
         if count > 1:
             transcript = f"{transcript} ({count})"
     return transcript
@@ -481,123 +845,454 @@ podcast_file_counter = {}
 #     print("------")
 
 
-def process_video_file(file_item, audio_queue=None):
+@stage_timer("transcript_write")
+def save_raw_transcript(file_path, recognized_text):
     """
-    Обрабатывает видеофайл:
-      - Скачивает видео,
-      - Извлекает аудио и конвертирует его в OGG_OPUS,
-      - Загружает аудио в Object Storage,
-    Если RECOGNITION_MODEL == "deferred-general", аудио-метаданные сохраняются в очередь и persistent-хранилище.
-    При ошибке загрузки аудио информация сохраняется в upload_errors.json для повторной обработки.
+    Сохраняет сырой распознанный текст видео в отдельный файл с записью в манифесте
+    transcript_store. Общий raw_transcript.txt собирается из них по требованию
+    (python -m modules.transcript_store), поэтому потоки распознавания не пишут в один файл.
+    Возвращает запись манифеста или None при ошибке.
+    """
+    return transcript_store.save_text(file_path, recognized_text)
+
+
+def complete_recognition(file_path, recognized_text, response=None):
+    """
+    Сохраняет результат распознавания видео и отмечает задание как распознанное.
+    Если передан ответ SpeechKit, он сохраняется целиком в transcript_store (слова с временем
+    и уверенностью). Тот же результат получают все копии этого видео, ожидающие его (duplicate_of).
+    Если из аудио были вырезаны паузы, время слов переводится во время исходного видео.
+    """
+    save_raw_transcript(file_path, recognized_text)
+    if response:
+        job = job_store.get_job(file_path)
+        if job and job.get("offset_map"):
+            response = vad.restore_timestamps(response, json.loads(job["offset_map"]))
+        transcript_store.save_transcript(file_path, response)
+    job_store.set_state(file_path, job_store.RECOGNIZED, transcript=recognized_text)
+    for duplicate in job_store.list_duplicates(file_path):
+        if duplicate["state"] != job_store.RECOGNIZED:
+            complete_duplicate(file_path, duplicate["file_path"], recognized_text)
+
+
+def complete_duplicate(original_path, duplicate_path, recognized_text, **fields):
+    """
+    Сохраняет для копии видео транскрипцию уже распознанного оригинала и отмечает её
+    как распознанную. Сам оригинал не затрагивается. Дополнительные поля задания
+    (fields) записываются вместе с состоянием.
+    """
+    logging.info(f"Транскрипция {original_path} использована для копии {duplicate_path}")
+    # Вместе с Parquet копируется и блок текста для raw_transcript.txt
+    transcript_store.copy_transcript(original_path, duplicate_path, recognized_text)
+    job_store.set_state(duplicate_path, job_store.RECOGNIZED, transcript=recognized_text, **fields)
+
+
+def fail_recognition(file_path):
+    """Отмечает ошибку распознавания; ожидающие копии видео отвязываются в job_store.set_state."""
+    job_store.set_state(file_path, job_store.FAILED, error_stage="recognition",
+                        error="распознавание не вернуло текст")
+
+
+def content_hash(file_item):
+    """
+    Возвращает хэш содержимого видео по полям sha256/md5 из листинга Диска,
+    например "sha256:9f86...". Если хэшей нет, возвращает None (дедупликация не выполняется).
+    """
+    for algorithm in ("sha256", "md5"):
+        if file_item.get(algorithm):
+            return f"{algorithm}:{file_item[algorithm]}"
+    return None
+
+
+def reuse_duplicate(file_path, file_hash, transcript_name=None) -> bool:
+    """
+    Проверяет, не обрабатывалось ли уже видео с тем же содержимым (переименованное,
+    перемещённое или скопированное в другой курс). Если да, скачивание, извлечение аудио
+    и распознавание пропускаются:
+      - если оригинал уже распознан, его транскрипция сразу сохраняется для копии;
+      - если оригинал ещё в обработке, копия ждёт его результата в состоянии submitted.
+    Возвращает True, если видео обрабатывать не нужно.
+    """
+    if not file_hash:
+        return False
+    original = job_store.find_by_content(file_hash, exclude_path=file_path)
+    if original is None:
+        return False
+    if original["state"] == job_store.RECOGNIZED:
+        logging.info(f"Видео {file_path} совпадает с уже распознанным {original['file_path']}")
+        complete_duplicate(original["file_path"], file_path, original["transcript"], content_hash=file_hash,
+                           duplicate_of=original["file_path"], transcript_name=transcript_name)
+    else:
+        logging.info(f"Видео {file_path} совпадает с {original['file_path']}, ожидаем его распознавания")
+        job_store.set_state(file_path, job_store.SUBMITTED, content_hash=file_hash,
+                            duplicate_of=original["file_path"], transcript_name=transcript_name)
+    return True
+
+
+def _remove_temp_files(*paths):
+    """Удаляет временные файлы задания, если они существуют."""
+    for temp_file in paths:
+        if temp_file and os.path.exists(temp_file):
+            try:
+                os.remove(temp_file)
+            except Exception as e:
+                logging.error(f"Не удалось удалить временный файл {temp_file}: {e}")
+
+
+def create_video_job(file_item, transcript_name=None):
+    """
+    Формирует задание конвейера для видеофайла.
+    К именам временных файлов добавляется короткий хэш пути на Диске, чтобы одноимённые
+    видео из разных папок не перезаписывали друг друга при параллельной обработке.
     """
     file_path = file_item.get("path")
-    if file_path in processed_files:
-        logging.info(f"Файл уже обработан: {file_path}")
-        return ""
+    path_hash = hashlib.md5(file_path.encode("utf-8")).hexdigest()[:8]
+    local_video = os.path.join(TEMP_DIR, f"{path_hash}_{os.path.basename(file_path)}")
+    local_audio = os.path.splitext(local_video)[0] + ".ogg"
+    return {
+        "file_item": file_item,
+        "file_path": file_path,
+        "transcript_name": transcript_name,
+        "local_video": local_video,
+        "local_audio": local_audio,
+        "object_name": os.path.basename(local_audio),
+    }
+
+
+def download_stage(job):
+    """Стадия конвейера: получает ссылку на скачивание и загружает видео во временную папку."""
+    file_path = job["file_path"]
     logging.info(f"Начало обработки файла: {file_path}")
 
     download_url = get_download_url(file_path)
     if not download_url:
         logging.error(f"Не удалось получить ссылку для скачивания файла: {file_path}")
-        return ""
+        job_store.set_state(file_path, job_store.FAILED, error_stage="download", error="нет ссылки на скачивание")
+        return None
+    job["download_url"] = download_url
+
+    if STREAM_EXTRACTION and is_streamable(download_url, file_path):
+        # Видео не скачивается: ffmpeg прочитает его по ссылке на стадии извлечения аудио
+        logging.info(f"Потоковая обработка без скачивания: {file_path}")
+        job["streamed"] = True
+        job_store.set_state(file_path, job_store.DOWNLOADED)
+        return job
+
+    logging.info(f"Загрузка видеофайла: {file_path}")
+    if not download_file(download_url, job["local_video"]):
+        logging.error(f"Не удалось скачать файл: {file_path}")
+        _remove_temp_files(job["local_video"])
+        job_store.set_state(file_path, job_store.FAILED, error_stage="download", error="ошибка скачивания")
+        return None
+    logging.info(f"Видео успешно загружено: {file_path}")
+    job_store.set_state(file_path, job_store.DOWNLOADED)
+    return job
 
-    local_video = os.path.join(TEMP_DIR, os.path.basename(file_path))
-    local_audio = os.path.splitext(local_video)[0] + ".ogg"
 
+def _extract_job_audio(job, source, input_options=None):
+    """
+    Извлекает аудио задания из source. При STREAM_UPLOAD аудио загружается в Object Storage
+    одновременно с кодированием, а публичная ссылка сохраняется в job["public_url"].
+    Длительность аудио, если её сообщил ffmpeg, сохраняется в job["audio_duration"].
+    Число потоков ffmpeg задаёт планировщик конвейера (job["ffmpeg_threads"]), выбранный
+    профиль кодирования сохраняется в job["audio_profile"].
+    """
+    threads = job.get("ffmpeg_threads")
+    job["audio_profile"] = resolve_profile(source, input_options)
+    if STREAM_UPLOAD:
+        public_url = extract_and_upload_audio(source, job["local_audio"], job["object_name"], input_options,
+                                              threads, job["audio_profile"])
+        if public_url:
+            job["public_url"] = public_url
+        return bool(public_url)
+    audio_duration = extract_audio(source, job["local_audio"], input_options, threads, job["audio_profile"])
+    if audio_duration:
+        job["audio_duration"] = audio_duration
+    return bool(audio_duration)
+
+
+def trim_job_silence(job):
+    """
+    Вырезает длинные паузы из аудио задания (см. modules.vad): обрезанное аудио заменяет
+    исходное, длительность задания уменьшается, а карта смещений сохраняется
+    в job["offset_map"] для перевода времени слов обратно во время видео.
+    """
+    local_audio = job["local_audio"]
+    trimmed_audio = os.path.splitext(local_audio)[0] + "_vad.ogg"
+    result = vad.trim_silence(local_audio, trimmed_audio, job["audio_duration"], job.get("audio_profile"))
+    if result is None:
+        _remove_temp_files(trimmed_audio)
+        return
+    os.replace(trimmed_audio, local_audio)
+    job["audio_duration"] = get_audio_duration(local_audio) or result[0]
+    job["offset_map"] = result[1]
+
+
+def transcode_stage(job):
+    """
+    Стадия конвейера: извлекает аудио из видео и определяет его длительность.
+    При VAD_ENABLED из аудио вырезаются длинные паузы (trim_job_silence).
+    """
+    file_path = job["file_path"]
     try:
-        logging.info(f"Загрузка видеофайла: {file_path}")
-        if not download_file(download_url, local_video):
-            logging.error(f"Не удалось скачать файл: {file_path}")
-            return ""
-        logging.info(f"Видео успешно загружено: {file_path}")
-
         logging.info(f"Извлечение аудио из видео: {file_path}")
-        if not extract_audio(local_video, local_audio):
+        if job.get("streamed"):
+            extracted = _extract_job_audio(job, job["download_url"], HTTP_INPUT_OPTIONS)
+            if not extracted:
+                # Запасной путь: скачиваем видео целиком и обрабатываем локальную копию
+                logging.warning(f"Потоковое извлечение не удалось, скачиваем файл целиком: {file_path}")
+                extracted = (download_file(job["download_url"], job["local_video"])
+                             and _extract_job_audio(job, job["local_video"]))
+        else:
+            extracted = _extract_job_audio(job, job["local_video"])
+        if not extracted:
             logging.error(f"Не удалось извлечь аудио из файла: {file_path}")
-            return ""
+            _remove_temp_files(job["local_audio"])
+            job_store.set_state(file_path, job_store.FAILED, error_stage="transcode", error="ошибка ffmpeg")
+            return None
         logging.info(f"Аудио успешно извлечено: {file_path}")
 
-        audio_duration = get_audio_duration(local_audio)
+        audio_duration = job.get("audio_duration") or get_audio_duration(job["local_audio"])
         if not audio_duration:
             logging.error(f"Не удалось получить длительность аудио для файла: {file_path}")
-            return ""
+            _remove_temp_files(job["local_audio"])
+            job_store.set_state(file_path, job_store.FAILED, error_stage="transcode",
+                                error="не удалось определить длительность")
+            return None
         logging.info(f"Длительность аудио: {audio_duration} сек")
+        job["audio_duration"] = audio_duration
+        if vad.VAD_ENABLED and not job.get("public_url"):
+            trim_job_silence(job)
+        # Длинная запись разбивается по паузам на сегменты для параллельного распознавания
+        job["segments"] = segment_audio(job["local_audio"], audio_duration)
+        return job
+    finally:
+        # Видео больше не нужно – освобождаем место для следующих загрузок
+        _remove_temp_files(job["local_video"])
+
+
+def upload_segments(segments, object_name):
+    """
+    Загружает сегменты записи в Object Storage параллельно.
+    Возвращает список {"public_url", "offset", "duration"} или None, если какой-то сегмент не загружен.
+    """
+    stem = os.path.splitext(object_name)[0]
+
+    def upload(indexed):
+        index, segment = indexed
+        return upload_to_object_storage(segment["path"], f"{stem}_part{index:03d}.ogg")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(segments), SEGMENT_UPLOAD_WORKERS)) as executor:
+        urls = list(executor.map(upload, enumerate(segments)))
+    if not all(urls):
+        return None
+    return [{"public_url": url, "offset": segment["offset"], "duration": segment["duration"]}
+            for url, segment in zip(urls, segments)]
+
 
-        object_name = os.path.basename(local_audio)
-        public_url = upload_to_object_storage(local_audio, object_name)
-        if not public_url:
+def upload_stage(job, audio_queue=None):
+    """
+    Стадия конвейера: загружает аудио в Object Storage, ставит его в очередь распознавания
+    (или распознаёт сразу) и отмечает видео как обработанное.
+    Разбитая на сегменты запись загружается по сегментам (см. upload_segments).
+    """
+    file_path = job["file_path"]
+    local_audio = job["local_audio"]
+    audio_duration = job["audio_duration"]
+    local_segments = job.get("segments") or []
+    try:
+        segments = None
+        if local_segments:
+            segments = upload_segments(local_segments, job["object_name"])
+            public_url = job.get("public_url")
+            uploaded = segments is not None
+        else:
+            # При STREAM_UPLOAD аудио уже загружено на стадии извлечения
+            public_url = job.get("public_url") or upload_to_object_storage(local_audio, job["object_name"])
+            uploaded = bool(public_url)
+        if not uploaded:
             logging.error(f"Ошибка загрузки аудио в Object Storage: {file_path}")
-            # Сохраняем metadata в persistent-хранилище ошибок для повторной обработки
-            error_item = {
-                "file_path": file_path,
-                "local_audio": local_audio,
-                "audio_duration": audio_duration,
-                "timestamp": time.time()
-            }
-            # Загружаем существующие ошибки, добавляем новый элемент и сохраняем
-            current_errors = load_upload_errors()
-            current_errors.append(error_item)
-            save_upload_errors(current_errors)
-            return ""
-        logging.info(f"Аудио загружено, публичная ссылка: {public_url}")
-
-        # Определяем имя транскрипции для подкаста
-        transcript_name = get_transcript_name(file_path)
+            # Сохраняем задание как ошибку загрузки для повторной обработки
+            job_store.set_state(file_path, job_store.FAILED, error_stage="upload", error="ошибка загрузки",
+                                local_audio=local_audio, audio_duration=audio_duration)
+            return None
+        if segments:
+            logging.info(f"Аудио загружено сегментами: {len(segments)}")
+        else:
+            logging.info(f"Аудио загружено, публичная ссылка: {public_url}")
+
+        # Имя транскрипции назначается при постановке задания в конвейер, чтобы нумерация
+        # не зависела от того, в каком порядке задания проходят стадии.
+        transcript_name = job.get("transcript_name") or get_transcript_name(file_path)
         logging.info(f"Имя транскрипции: {transcript_name}")
 
+        # Фиксируем загрузку в базе заданий до постановки в очередь, чтобы поток
+        # распознавания мог сразу забрать задание
+        job_store.set_state(file_path, job_store.UPLOADED, public_url=public_url,
+                            audio_duration=audio_duration, transcript_name=transcript_name,
+                            segments=json.dumps(segments) if segments else None,
+                            offset_map=json.dumps(job["offset_map"]) if job.get("offset_map") else None)
+
         if RECOGNITION_MODEL == "deferred-general" and audio_queue is not None:
             metadata = {"transcript_name": transcript_name}
             metadata.update({
                 "public_url": public_url,
                 "audio_duration": audio_duration,
-                "file_path": file_path
+                "file_path": file_path,
+                "segments": segments
             })
             # Добавляем элемент в in-memory очередь
             audio_queue.put(metadata)
-            # Загружаем текущий persistent список, добавляем новый элемент и сохраняем
-            current_items = load_audio_queue()
-            current_items.append(metadata)
-            save_audio_queue(current_items)
-        else:
-            recognized_text = async_recognize_speech(public_url, audio_duration, model=RECOGNITION_MODEL)
+        elif RECOGNITION_MODEL != "deferred-general":
+            # Без очереди задания deferred-general остаются в состоянии uploaded
+            # и распознаются пакетно в process_deferred_recognition
+            job_store.set_state(file_path, job_store.SUBMITTED)
+
+            def save_operation(operation_id, submitted_segments):
+                # id операции сохраняется сразу, чтобы после перезапуска restore_recognition_state
+                # снова отслеживал её, а не отправлял аудио на распознавание повторно
+                job_store.set_state(file_path, job_store.SUBMITTED, operation_id=operation_id,
+                                    segments=json.dumps(submitted_segments) if submitted_segments else None)
+
+            response = wait_recognition(public_url, audio_duration, model=RECOGNITION_MODEL, segments=segments,
+                                        on_submitted=save_operation)
+            recognized_text = chunks_to_text(response)
             if recognized_text:
                 logging.info(f"Распознавание успешно для файла: {file_path}")
+                complete_recognition(file_path, recognized_text, response)
             else:
                 logging.error(f"Распознавание не вернуло текст для файла: {file_path}")
+                fail_recognition(file_path)
+        return job
+    finally:
+        _remove_temp_files(local_audio, *(segment["path"] for segment in local_segments))
+
 
-        processed_files[file_path] = True
-        save_processed_files(processed_files)
+def process_video_file(file_item, audio_queue=None):
+    """
+    Обрабатывает видеофайл:
+      - Скачивает видео,
+      - Извлекает аудио и конвертирует его в OGG_OPUS,
+      - Загружает аудио в Object Storage,
+    Если видео с тем же содержимым (sha256/md5 Диска) уже распознано, его транскрипция
+    используется повторно, а все стадии пропускаются.
+    Если RECOGNITION_MODEL == "deferred-general", аудио-метаданные сохраняются в очередь и базу заданий.
+    При ошибке загрузки аудио задание отмечается в базе как failed (стадия upload) для повторной обработки.
+    Стадии выполняются последовательно; для параллельной обработки используется run_ingestion_pipeline.
+    При повторной обработке используется имя транскрипции, сохранённое в базе заданий,
+    чтобы повтор не занимал новый номер подкаста.
+    """
+    file_path = file_item.get("path")
+    stored = job_store.get_job(file_path)
+    if stored and stored["state"] in job_store.PROCESSED_STATES:
+        logging.info(f"Файл уже обработан: {file_path}")
         return ""
+    transcript_name = (stored or {}).get("transcript_name") or get_transcript_name(file_path)
+    file_hash = content_hash(file_item)
+    if reuse_duplicate(file_path, file_hash, transcript_name):
+        return ""
+    fields = {"content_hash": file_hash} if file_hash else {}
+    job_store.set_state(file_path, job_store.DISCOVERED, transcript_name=transcript_name, **fields)
+
+    job = create_video_job(file_item, transcript_name)
+    try:
+        job = download_stage(job)
+        if job:
+            job = transcode_stage(job)
+        if job:
+            upload_stage(job, audio_queue)
     except Exception as e:
         logging.error(f"Исключение при обработке файла {file_path}: {e}")
-        return ""
-    finally:
-        for temp_file in [local_video, local_audio]:
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except Exception as e:
-                    logging.error(f"Не удалось удалить временный файл {temp_file}: {e}")
+    return ""
+
+
+def run_ingestion_pipeline(video_files, audio_queue=None):
+    """
+    Обрабатывает список видеофайлов конвейером из трёх стадий (скачивание, извлечение аудио,
+    загрузка в Object Storage). У каждой стадии свой пул потоков (DOWNLOAD_WORKERS,
+    TRANSCODE_WORKERS, UPLOAD_WORKERS), а между стадиями – ограниченные очереди
+    размером PIPELINE_QUEUE_SIZE, так что сеть и процессор загружены одновременно,
+    а на диске одновременно лежит лишь ограниченное число скачанных видео.
+
+    Имена транскрипций назначаются здесь, в порядке сканирования, поэтому они не зависят
+    от того, в каком порядке задания проходят стадии. Сами задания ставятся в конвейер
+    от больших видео к меньшим (размер из list_video_files – оценка стоимости извлечения),
+    чтобы самые долгие извлечения не остались в конце прогона на одном ядре.
+    Число потоков извлечения и потоков ffmpeg на задание подбирается по числу ядер
+    и свободному месту во временном каталоге (см. transcoder.transcode_workers).
+    """
+    jobs = []
+    for file_item in video_files:
+        file_path = file_item.get("path")
+        stored = job_store.get_job(file_path)
+        if stored and stored["state"] in job_store.PROCESSED_STATES:
+            logging.info(f"Файл уже обработан: {file_path}")
+            continue
+        # Повтор после ошибки сохраняет имя транскрипции и не занимает новый номер подкаста
+        transcript_name = (stored or {}).get("transcript_name") or get_transcript_name(file_path)
+        file_hash = content_hash(file_item)
+        # Копии уже обработанных (или обрабатываемых) видео в конвейер не попадают
+        if reuse_duplicate(file_path, file_hash, transcript_name):
+            continue
+        fields = {"content_hash": file_hash} if file_hash else {}
+        job_store.set_state(file_path, job_store.DISCOVERED, transcript_name=transcript_name, **fields)
+        jobs.append(create_video_job(file_item, transcript_name))
+    if not jobs:
+        return
+    jobs.sort(key=lambda job: job["file_item"].get("size") or 0, reverse=True)
+
+    # Скачанные видео ждут извлечения и у потоков скачивания, и в очереди перед стадией извлечения
+    workers = transcode_workers(TRANSCODE_WORKERS, [job["file_item"].get("size") or 0 for job in jobs],
+                                TEMP_DIR, reserved=DOWNLOAD_WORKERS + PIPELINE_QUEUE_SIZE)
+    threads = ffmpeg_threads(workers)
+    for job in jobs:
+        job["ffmpeg_threads"] = threads
+    logging.info(f"Заданий в конвейере: {len(jobs)}; параллельных извлечений аудио: {workers}, "
+                 f"потоков ffmpeg на задание: {threads}")
+
+    stages = [
+        ("download", download_stage, DOWNLOAD_WORKERS),
+        ("transcode", transcode_stage, workers),
+        ("upload", lambda job: upload_stage(job, audio_queue), UPLOAD_WORKERS),
+    ]
+    run_stages(jobs, stages, queue_size=PIPELINE_QUEUE_SIZE)
 
 
 def process_deferred_recognition(metadata_list):
     """
-    Отправляет запросы асинхронного распознавания для всех аудиофайлов в режиме deferred-general параллельно.
+    Отправляет запросы асинхронного распознавания для всех аудиофайлов в режиме deferred-general.
+    Все операции ожидаются одновременно общим опросчиком, без отдельного потока на каждую.
+    id операций сохраняются в базе заданий сразу после отправки (см. restore_recognition_state).
     """
     recognized_texts = []
-
-    def recognize(metadata):
-        public_url = metadata["public_url"]
-        audio_duration = metadata["audio_duration"]
-        result = async_recognize_speech(public_url, audio_duration, model="deferred-general")
-        return result
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(recognize, md) for md in metadata_list]
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result:
-                recognized_texts.append(result)
+    futures = {}
+    for metadata in metadata_list:
+        file_path = metadata["file_path"]
+        job_store.set_state(file_path, job_store.SUBMITTED)
+        if metadata.get("segments"):
+            segments = submit_segments(metadata["segments"], "deferred-general")
+            if not segments:
+                fail_recognition(file_path)
+                continue
+            job_store.set_state(file_path, job_store.SUBMITTED, segments=json.dumps(segments))
+            future = track_segments(segments, "deferred-general")
+        else:
+            operation_id = submit_recognition(metadata["public_url"], "deferred-general")
+            if not operation_id:
+                fail_recognition(file_path)
+                continue
+            job_store.set_state(file_path, job_store.SUBMITTED, operation_id=operation_id)
+            future = track_operation(operation_id, metadata["audio_duration"], "deferred-general")
+        futures[future] = metadata
+    for future in concurrent.futures.as_completed(futures):
+        file_path = futures[future]["file_path"]
+        response = future.result()
+        if response:
+            recognized_text = chunks_to_text(response)
+            recognized_texts.append(recognized_text)
+            complete_recognition(file_path, recognized_text, response)
+        else:
+            fail_recognition(file_path)
     return recognized_texts
 
 
@@ -606,10 +1301,9 @@ def process_all_videos():
     podcast_file_counter = {}  # Сброс нумерации подкастов
     video_files = list_video_files(DISK_FOLDER_PATH)
     logging.info(f"Найдено видеофайлов: {len(video_files)}")
-    for file_item in video_files:
-        process_video_file(file_item)
+    run_ingestion_pipeline(video_files)
     if RECOGNITION_MODEL == "deferred-general":
-        # Загружаем актуальные аудио-метаданные из persistent-хранилища
+        # Загружаем аудио-метаданные, ожидающие распознавания, из базы заданий
         metadata_list = load_audio_queue()
         recognized_texts = process_deferred_recognition(metadata_list)
         return "\n".join(recognized_texts)